@@ -0,0 +1,26 @@
+-- Change Tracking no SQL Server (ERP) para a sincronização incremental (/sync/changes)
+-- Pode ser executado mais do que uma vez.
+
+-- Base de dados: guarda o histórico de alterações durante 7 dias
+IF NOT EXISTS (SELECT 1 FROM sys.change_tracking_databases WHERE database_id = DB_ID())
+    ALTER DATABASE CURRENT SET CHANGE_TRACKING = ON (CHANGE_RETENTION = 7 DAYS, AUTO_CLEANUP = ON);
+GO
+
+-- Tabelas espelhadas pela app (ver BD_OFFLINE/TABELAS.sql)
+IF NOT EXISTS (SELECT 1 FROM sys.change_tracking_tables WHERE object_id = OBJECT_ID('dbo.Utilizadores'))
+    ALTER TABLE dbo.Utilizadores ENABLE CHANGE_TRACKING WITH (TRACK_COLUMNS_UPDATED = ON);
+IF NOT EXISTS (SELECT 1 FROM sys.change_tracking_tables WHERE object_id = OBJECT_ID('dbo.Estado'))
+    ALTER TABLE dbo.Estado ENABLE CHANGE_TRACKING WITH (TRACK_COLUMNS_UPDATED = ON);
+IF NOT EXISTS (SELECT 1 FROM sys.change_tracking_tables WHERE object_id = OBJECT_ID('dbo.Tipo'))
+    ALTER TABLE dbo.Tipo ENABLE CHANGE_TRACKING WITH (TRACK_COLUMNS_UPDATED = ON);
+IF NOT EXISTS (SELECT 1 FROM sys.change_tracking_tables WHERE object_id = OBJECT_ID('dbo.Familia'))
+    ALTER TABLE dbo.Familia ENABLE CHANGE_TRACKING WITH (TRACK_COLUMNS_UPDATED = ON);
+IF NOT EXISTS (SELECT 1 FROM sys.change_tracking_tables WHERE object_id = OBJECT_ID('dbo.Armazem'))
+    ALTER TABLE dbo.Armazem ENABLE CHANGE_TRACKING WITH (TRACK_COLUMNS_UPDATED = ON);
+IF NOT EXISTS (SELECT 1 FROM sys.change_tracking_tables WHERE object_id = OBJECT_ID('dbo.Artigo'))
+    ALTER TABLE dbo.Artigo ENABLE CHANGE_TRACKING WITH (TRACK_COLUMNS_UPDATED = ON);
+IF NOT EXISTS (SELECT 1 FROM sys.change_tracking_tables WHERE object_id = OBJECT_ID('dbo.Equipamento'))
+    ALTER TABLE dbo.Equipamento ENABLE CHANGE_TRACKING WITH (TRACK_COLUMNS_UPDATED = ON);
+IF NOT EXISTS (SELECT 1 FROM sys.change_tracking_tables WHERE object_id = OBJECT_ID('dbo.Movimentos'))
+    ALTER TABLE dbo.Movimentos ENABLE CHANGE_TRACKING WITH (TRACK_COLUMNS_UPDATED = ON);
+GO
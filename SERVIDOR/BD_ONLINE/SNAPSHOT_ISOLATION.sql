@@ -0,0 +1,7 @@
+-- SNAPSHOT isolation no SQL Server (ERP) para o /sync ler todas as tabelas no mesmo
+-- ponto no tempo, em paralelo e sem bloquear escritas (ver app/leitura.py).
+-- Pode ser executado mais do que uma vez.
+
+IF NOT EXISTS (SELECT 1 FROM sys.databases WHERE database_id = DB_ID() AND snapshot_isolation_state = 1)
+    ALTER DATABASE CURRENT SET ALLOW_SNAPSHOT_ISOLATION ON;
+GO
@@ -1,60 +1,138 @@
-from fastapi import APIRouter, HTTPException
-from typing import List, Dict, Any
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from typing import List, Dict, Any, Iterator, Optional
 import pyodbc
+from .config import settings
 from .db import get_connection
+from .executor import em_executor, run_db, stream_db
+from .etag import condicional
+from .serializacao import dumps, json_rapido, linhas_para_dicts
+from .formatos import escolher_formato, resposta_compacta, tabela_compacta
+from .leitura import consultas_select, ler_tabelas, snapshot_disponivel, transacao_snapshot
 
 router = APIRouter()
 
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
 
-def _fetch_table_data(table: str, columns: str = "*") -> List[Dict[str, Any]]:
+# Tabelas enviadas no /sync (chave na resposta, tabela no SQL Server)
+SYNC_TABELAS = [
+    ("estados", "ESTADO"),
+    ("tipos", "TIPO"),
+    ("familias", "FAMILIA"),
+    ("armazens", "ARMAZEM"),
+    ("artigos", "ARTIGO"),
+    ("equipamentos", "EQUIPAMENTO"),
+    ("movimentos", "MOVIMENTOS"),
+]
+
+
+def _linha_ndjson(obj: Dict[str, Any]) -> bytes:
+    return dumps(obj) + b"\n"
+
+
+def _gerar_ndjson(tabelas, lote: int) -> Iterator[bytes]:
     """
-    Busca dados de uma tabela e retorna como lista de dicionários.
+    Gera o /sync em NDJSON, lendo cada tabela com fetchmany em lotes de `lote` linhas.
+    Cada item produzido é um lote já codificado, por isso a memória não depende do
+    tamanho das tabelas. Registos:
+        {"tipo": "inicio", "timestamp": ...}
+        {"tipo": "tabela", "tabela": "artigos", "colunas": [...]}
+        {<uma linha da tabela>}  (repetido)
+        {"tipo": "fim_tabela", "tabela": "artigos", "registos": N}
+        {"tipo": "fim", "versao": <versão do change tracking>, "stats": {...}}
     """
-    conn = get_connection()
-    cur = conn.cursor()
-    
-    try:
-        cur.execute(f"SELECT {columns} FROM {table}")
-        rows = cur.fetchall()
-        
-        # Converte pyodbc.Row para dicionário
-        columns = [desc[0] for desc in cur.description]
-        result = []
-        
-        for row in rows:
-            row_dict = {}
-            for i, col in enumerate(columns):
-                value = row[i]
-                # Converte datetime para string ISO
-                if hasattr(value, 'isoformat'):
-                    value = value.isoformat()
-                row_dict[col] = value
-            result.append(row_dict)
-        
-        return result
-        
-    finally:
+    stats: Dict[str, int] = {}
+    yield _linha_ndjson({
+        "tipo": "inicio",
+        "timestamp": __import__("datetime").datetime.now().isoformat(),
+    })
+
+    with get_connection() as conn:
+        cur = conn.cursor()
+        # Todas as tabelas na mesma transação SNAPSHOT (se a BD o permitir)
+        with transacao_snapshot(cur, snapshot_disponivel()) as versao:
+            for chave, table in tabelas:
+                cur.execute(f"SELECT * FROM {table}")
+                columns = [desc[0] for desc in cur.description]
+                partes = [_linha_ndjson({"tipo": "tabela", "tabela": chave, "colunas": columns})]
+                registos = 0
+                while True:
+                    rows = cur.fetchmany(lote)
+                    if not rows:
+                        break
+                    registos += len(rows)
+                    partes.extend(
+                        _linha_ndjson(linha) for linha in linhas_para_dicts(columns, rows)
+                    )
+                    yield b"".join(partes)
+                    partes = []
+                partes.append(_linha_ndjson(
+                    {"tipo": "fim_tabela", "tabela": chave, "registos": registos}
+                ))
+                yield b"".join(partes)
+                stats[chave] = registos
         cur.close()
-        conn.close()
+
+    yield _linha_ndjson({
+        "tipo": "fim",
+        "versao": versao,
+        "stats": {"total_registos": sum(stats.values()), **stats},
+    })
+
+
+def _quer_ndjson(request: Request, formato: Optional[str]) -> bool:
+    if formato:
+        return formato.lower() == "ndjson"
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+# ETag fraco: o conteúdo só muda com as tabelas, mas o "timestamp" é sempre o do momento
+_ETAG_SYNC = condicional(*(chave for chave, _ in SYNC_TABELAS), fraco=True)
 
 
 @router.get("/sync")
-def sync_all_data():
+async def sync_all_data(
+    request: Request,
+    response: Response,
+    formato: Optional[str] = None,
+    etag: Optional[str] = Depends(_ETAG_SYNC),
+):
     """
     Endpoint principal de sincronização.
     Retorna todos os dados necessários para a app mobile.
+    Com ?formato=ndjson (ou Accept: application/x-ndjson) a resposta é enviada em stream.
+    Com ?formato=colunas|linhas|msgpack (ou Accept: application/msgpack) cada tabela
+    vem no formato compacto de formatos.py.
+    Com If-None-Match e nada alterado desde esse ETag, responde 304.
+    """
+    if _quer_ndjson(request, formato):
+        try:
+            corpo = await stream_db(_gerar_ndjson(SYNC_TABELAS, settings.sync_fetch_lote))
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Erro na sincronização: {str(e)}")
+        headers = {"ETag": etag, "Cache-Control": "no-cache"} if etag else None
+        return StreamingResponse(corpo, media_type=NDJSON_MEDIA_TYPE, headers=headers)
+    compacto = escolher_formato(request, formato)
+    if compacto:
+        layout, em_msgpack = compacto
+        return await run_db(lambda: resposta_compacta(_sync_compacto(layout), em_msgpack, response))
+    # A serialização também corre no executor: para o /sync completo é trabalho pesado
+    return await run_db(lambda: json_rapido(_sync_all_data(), response))
+
+
+def _sync_all_data():
+    """
+    Lê as tabelas em paralelo, todas no mesmo ponto no tempo (ver leitura.py).
+    "leitura" indica a versão do change tracking dos dados (para /sync/changes?since=)
+    e quanto tempo demorou cada tabela.
     """
     try:
-        data = {
-            "estados": _fetch_table_data("ESTADO"),
-            "tipos": _fetch_table_data("TIPO"),
-            "familias": _fetch_table_data("FAMILIA"),
-            "armazens": _fetch_table_data("ARMAZEM"),
-            "artigos": _fetch_table_data("ARTIGO"),
-            "equipamentos": _fetch_table_data("EQUIPAMENTO"),
-            "movimentos": _fetch_table_data("MOVIMENTOS"),
-            "timestamp": __import__("datetime").datetime.now().isoformat(),
-        }
+        data, leitura = ler_tabelas(
+            consultas_select(SYNC_TABELAS), lambda _, cols, rows: linhas_para_dicts(cols, rows)
+        )
+        data["timestamp"] = __import__("datetime").datetime.now().isoformat()
         
         # Estatísticas
         total_registos = sum(len(v) for k, v in data.items() if isinstance(v, list))
@@ -71,56 +149,79 @@ def sync_all_data():
                 "artigos": len(data["artigos"]),
                 "equipamentos": len(data["equipamentos"]),
                 "movimentos": len(data["movimentos"]),
-            }
+            },
+            "leitura": leitura,
         }
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro na sincronização: {str(e)}")
 
 
-@router.get("/sync/light")
-def sync_light():
+def _sync_compacto(layout: str) -> Dict[str, Any]:
+    """O mesmo que _sync_all_data, mas com cada tabela em formato compacto."""
+    try:
+        offline = dict(SYNC_TABELAS)
+        stats: Dict[str, int] = {}
+
+        def compactar(chave: str, columns: List[str], rows) -> Dict[str, Any]:
+            stats[chave] = len(rows)
+            return tabela_compacta(offline[chave], columns, rows, layout)
+
+        data, leitura = ler_tabelas(consultas_select(SYNC_TABELAS), compactar)
+        data["timestamp"] = __import__("datetime").datetime.now().isoformat()
+        return {
+            "success": True,
+            "data": data,
+            "stats": {
+                "total_registos": sum(stats.values()),
+                **{chave: stats[chave] for chave, _ in SYNC_TABELAS},
+            },
+            "leitura": leitura,
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro na sincronização: {str(e)}")
+
+
+@router.get("/sync/light", dependencies=[Depends(condicional(
+    "estados", "tipos", "familias", "armazens", "artigos", "equipamentos", fraco=True,
+))])
+@em_executor
+def sync_light(response: Response):
     """
     Sincronização leve - apenas dados essenciais (sem movimentos).
     Útil para sincronizações rápidas.
     """
     try:
-        data = {
-            "estados": _fetch_table_data("ESTADO"),
-            "tipos": _fetch_table_data("TIPO"),
-            "familias": _fetch_table_data("FAMILIA"),
-            "armazens": _fetch_table_data("ARMAZEM"),
-            "artigos": _fetch_table_data("ARTIGO"),
-            "equipamentos": _fetch_table_data("EQUIPAMENTO"),
-            "timestamp": __import__("datetime").datetime.now().isoformat(),
-        }
+        tabelas = [(chave, table) for chave, table in SYNC_TABELAS if chave != "movimentos"]
+        data, leitura = ler_tabelas(
+            consultas_select(tabelas), lambda _, cols, rows: linhas_para_dicts(cols, rows)
+        )
+        data["timestamp"] = __import__("datetime").datetime.now().isoformat()
         
-        return {"success": True, "data": data}
+        return json_rapido({"success": True, "data": data, "leitura": leitura}, response)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro na sincronização: {str(e)}")
 
 
 @router.get("/sync/stats")
+@em_executor
 def sync_stats():
     """
     Retorna estatísticas dos dados sem transferir tudo.
     Útil para verificar se há novos dados.
     """
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        
         stats = {}
         tables = ["ESTADO", "TIPO", "FAMILIA", "ARMAZEM", "ARTIGO", "EQUIPAMENTO", "MOVIMENTOS"]
         
-        for table in tables:
-            cur.execute(f"SELECT COUNT(*) FROM {table}")
-            count = cur.fetchone()[0]
-            stats[table.lower()] = count
-        
-        cur.close()
-        conn.close()
+        with get_connection() as conn:
+            cur = conn.cursor()
+            for table in tables:
+                cur.execute(f"SELECT COUNT(*) FROM {table}")
+                count = cur.fetchone()[0]
+                stats[table.lower()] = count
+            cur.close()
         
         return {
             "success": True,
@@ -131,21 +232,3 @@ def sync_stats():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao obter estatísticas: {str(e)}")
 
-
-@router.get("/sync/artigos")
-def sync_artigos_only():
-    """
-    Sincroniza apenas artigos (para atualizações rápidas).
-    """
-    try:
-        artigos = _fetch_table_data("ARTIGO")
-        
-        return {
-            "success": True,
-            "data": artigos,
-            "count": len(artigos),
-            "timestamp": __import__("datetime").datetime.now().isoformat()
-        }
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro ao sincronizar artigos: {str(e)}")
\ No newline at end of file
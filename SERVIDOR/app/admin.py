@@ -0,0 +1,117 @@
+# SERVIDOR/app/admin.py
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from .cache import cache_referencia
+from .config import settings
+from .executor import em_executor
+from .imagens import IMAGES_DIR, migrar_para_conteudo, recolher_orfas
+from .miniaturas import gerador
+from .replica import replica
+from .sessoes import cache_utilizadores, utilizador_atual
+from .snapshot import construtor
+
+# Rotas operacionais: só com um token válido (Authorization: Bearer <token>)
+router = APIRouter(dependencies=[Depends(utilizador_atual)])
+
+
+@router.get("/admin/cache")
+async def get_cache():
+    """Estado da cache de referência: TTL, validade e hits/misses por tabela."""
+    return cache_referencia.stats()
+
+
+@router.post("/admin/cache/invalidar")
+async def invalidar_cache(tabela: Optional[str] = None):
+    """
+    Invalida a cache de uma tabela (?tabela=tipos) ou de todas.
+    Útil quando a BD é alterada sem change tracking ativo.
+    """
+    if tabela is not None and tabela not in cache_referencia.ttls:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Tabela desconhecida: {tabela} (válidas: {', '.join(cache_referencia.ttls)})",
+        )
+    return {"success": True, "invalidadas": cache_referencia.invalidar(tabela)}
+
+
+@router.get("/admin/snapshot")
+async def get_snapshot_estado():
+    """Estado da construção do snapshot SQLite."""
+    return construtor.stats()
+
+
+@router.post("/admin/snapshot/construir", status_code=202)
+async def construir_snapshot():
+    """Pede a reconstrução imediata do snapshot SQLite (corre em background)."""
+    construtor.pedir(forcar=True)
+    return {"success": True}
+
+
+@router.get("/admin/replica")
+async def get_replica_estado():
+    """Estado da réplica local (modo edge): versão, atraso, cópias e leituras servidas por ela."""
+    return replica.stats()
+
+
+@router.post("/admin/replica/reconstruir", status_code=202)
+async def reconstruir_replica():
+    """
+    Pede uma cópia completa da réplica local. Corre em background: as leituras
+    continuam na cópia atual até ao fim.
+    """
+    if not settings.replica_ativa:
+        raise HTTPException(status_code=400, detail="Réplica local desativada (REPLICA_ATIVA)")
+    replica.reconstruir()
+    return {"success": True}
+
+
+@router.get("/admin/auth")
+async def get_auth_estado():
+    """Estado da cache de utilizadores verificados (usada para validar os tokens)."""
+    return cache_utilizadores.stats()
+
+
+@router.post("/admin/auth/revogar")
+async def revogar_utilizador(id_utilizador: Optional[int] = None):
+    """
+    Tira um utilizador (ou todos) da cache: o próximo pedido com o seu token volta a
+    confirmar na BD se está ativo. Útil quando Utilizadores é alterada sem change tracking.
+    """
+    return {"success": True, "revogados": cache_utilizadores.revogar(id_utilizador)}
+
+
+@router.get("/admin/imagens/miniaturas")
+async def get_miniaturas_estado():
+    """Estado da geração de tamanhos derivados das imagens (na fila, geradas, falhas)."""
+    return gerador.stats()
+
+
+@router.post("/admin/imagens/miniaturas/preencher", status_code=202)
+async def preencher_miniaturas():
+    """Agenda a geração dos tamanhos que faltam a imagens já existentes (corre em background)."""
+    return {"success": True, "agendadas": gerador.preencher(IMAGES_DIR)}
+
+
+@router.post("/admin/imagens/migrar")
+@em_executor
+def migrar_imagens():
+    """Renomeia as imagens com nome antigo para nomes pelo conteúdo (sha256), com URLs imutáveis."""
+    try:
+        return {"success": True, **migrar_para_conteudo()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao migrar imagens: {str(e)}")
+
+
+@router.post("/admin/imagens/recolher")
+@em_executor
+def recolher_imagens(idade: Optional[int] = None):
+    """
+    Apaga imagens que nenhum artigo usa, derivadas sem original e temporários de
+    uploads interrompidos, com mais de `idade` segundos (omissão: IMAGENS_ORFAS_IDADE).
+    """
+    try:
+        return {"success": True, **recolher_orfas(idade)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao recolher imagens: {str(e)}")
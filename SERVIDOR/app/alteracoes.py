@@ -0,0 +1,226 @@
+# SERVIDOR/app/alteracoes.py
+"""
+Leitura de alterações com o Change Tracking do SQL Server
+(ativado com BD_ONLINE/CHANGE_TRACKING.sql).
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .config import settings
+from .db import get_connection
+from .tabelas import TABELAS, Tabela, linha_para_dict
+
+logger = logging.getLogger(__name__)
+
+
+def versao_atual(cur) -> int:
+    """Versão atual do change tracking da base de dados."""
+    cur.execute("SELECT CHANGE_TRACKING_CURRENT_VERSION()")
+    row = cur.fetchone()
+    if not row or row[0] is None:
+        raise RuntimeError("Change tracking não está ativo na base de dados")
+    return int(row[0])
+
+
+def versao_minima(cur, tabela: Tabela) -> int:
+    """Versão mais antiga a partir da qual ainda há histórico para a tabela."""
+    cur.execute("SELECT CHANGE_TRACKING_MIN_VALID_VERSION(OBJECT_ID(?))", (f"dbo.{tabela.origem}",))
+    row = cur.fetchone()
+    if not row or row[0] is None:
+        raise RuntimeError(f"Change tracking não está ativo na tabela {tabela.origem}")
+    return int(row[0])
+
+
+def ler_tabela(cur, tabela: Tabela) -> List[Dict[str, Any]]:
+    """Lê a tabela inteira (usado quando o token do cliente já não é válido)."""
+    cur.execute(f"SELECT {', '.join(tabela.colunas)} FROM dbo.{tabela.origem}")
+    return [linha_para_dict(tabela.colunas, row) for row in cur.fetchall()]
+
+
+def ler_alteracoes(cur, tabela: Tabela, desde: int) -> Tuple[List[Dict[str, Any]], List[Any]]:
+    """
+    Linhas inseridas/alteradas e chaves removidas desde a versão `desde`.
+
+    Returns:
+        (alterados, removidos): linhas atuais das chaves alteradas e lista de chaves apagadas
+    """
+    colunas = ", ".join(f"t.{c}" for c in tabela.colunas)
+    cur.execute(f"""
+        SELECT ct.SYS_CHANGE_OPERATION, ct.{tabela.pk}, {colunas}
+        FROM CHANGETABLE(CHANGES dbo.{tabela.origem}, ?) AS ct
+        LEFT JOIN dbo.{tabela.origem} AS t ON t.{tabela.pk} = ct.{tabela.pk}
+        ORDER BY ct.SYS_CHANGE_VERSION
+    """, (desde,))
+
+    alterados: List[Dict[str, Any]] = []
+    removidos: List[Any] = []
+    for row in cur.fetchall():
+        # Uma linha alterada e depois apagada aparece sem dados no JOIN
+        if row[0] == 'D' or row[2] is None:
+            removidos.append(row[1])
+        else:
+            alterados.append(linha_para_dict(tabela.colunas, row[2:]))
+    return alterados, removidos
+
+
+def alteracoes_desde(cur, tabelas, desde: Optional[int]) -> Dict[str, Any]:
+    """
+    Alterações de várias tabelas desde o token `desde`.
+    Tabelas cujo histórico já não cobre `desde` (ou sem token) são devolvidas inteiras
+    com reset=True.
+
+    A versão nova é lida antes das alterações: alterações feitas entretanto podem
+    vir repetidas na próxima sincronização, mas nunca se perdem.
+    """
+    nova = versao_atual(cur)
+    resultado: Dict[str, Any] = {}
+    for tabela in tabelas:
+        if desde is None or desde > nova or desde < versao_minima(cur, tabela):
+            resultado[tabela.chave] = {
+                "reset": True,
+                "alterados": ler_tabela(cur, tabela),
+                "removidos": [],
+            }
+        else:
+            alterados, removidos = ler_alteracoes(cur, tabela, desde)
+            resultado[tabela.chave] = {
+                "reset": False,
+                "alterados": alterados,
+                "removidos": removidos,
+            }
+    return {"versao": nova, "tabelas": resultado}
+
+
+class MonitorAlteracoes:
+    """
+    Verifica periodicamente a versão do change tracking e avisa os subscritores
+    das tabelas alteradas. Mantém também a versão da última alteração de cada tabela.
+    """
+
+    def __init__(self, tabelas, intervalo: float):
+        self.tabelas = tuple(tabelas)
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._subscritores: List[Callable[[Dict[str, int], int, int], None]] = []
+        self._versao: Optional[int] = None
+        self._versoes_tabela: Dict[str, int] = {}
+        self._ultima_verificacao: Optional[float] = None
+        self._erro: Optional[str] = None
+        self._thread: Optional[threading.Thread] = None
+        self._parar = threading.Event()
+
+    def subscrever(self, fn: Callable[[Dict[str, int], int, int], None], primeiro: bool = False):
+        """
+        fn(alteradas, desde, ate): alteradas = {chave da tabela: versão da última alteração}.
+        Com `primeiro`, fn é chamada antes dos subscritores já registados.
+        """
+        with self._lock:
+            if primeiro:
+                self._subscritores.insert(0, fn)
+            else:
+                self._subscritores.append(fn)
+
+    @property
+    def versao(self) -> Optional[int]:
+        return self._versao
+
+    @property
+    def ultima_verificacao(self) -> Optional[float]:
+        """time.monotonic() da última verificação que correu bem."""
+        return self._ultima_verificacao
+
+    def versao_tabela(self, chave: str) -> Optional[int]:
+        return self._versoes_tabela.get(chave)
+
+    def saudavel(self) -> bool:
+        """True se a última verificação correu bem e é recente."""
+        ultima = self._ultima_verificacao
+        return (
+            self._erro is None
+            and ultima is not None
+            and time.monotonic() - ultima <= max(3 * self.intervalo, 1.0)
+        )
+
+    def verificar(self) -> Dict[str, int]:
+        """Faz uma verificação e notifica os subscritores. Devolve as tabelas alteradas."""
+        with get_connection() as conn:
+            cur = conn.cursor()
+            atual = versao_atual(cur)
+            desde = self._versao
+            alteradas: Dict[str, int] = {}
+            if desde is None:
+                # Primeiro arranque: não se sabe quando mudou cada tabela
+                for tabela in self.tabelas:
+                    self._versoes_tabela[tabela.chave] = atual
+            elif atual != desde:
+                for tabela in self.tabelas:
+                    if desde < versao_minima(cur, tabela):
+                        # Histórico já limpo: assume-se que mudou
+                        alteradas[tabela.chave] = atual
+                        continue
+                    cur.execute(
+                        "SELECT MAX(SYS_CHANGE_VERSION) "
+                        f"FROM CHANGETABLE(CHANGES dbo.{tabela.origem}, ?) AS ct",
+                        (desde,),
+                    )
+                    row = cur.fetchone()
+                    if row and row[0] is not None:
+                        alteradas[tabela.chave] = int(row[0])
+            cur.close()
+
+        if alteradas:
+            with self._lock:
+                subscritores = list(self._subscritores)
+            for fn in subscritores:
+                try:
+                    fn(alteradas, desde, atual)
+                except Exception:
+                    logger.exception("Erro num subscritor de alterações")
+
+        # Só depois dos subscritores (ex: invalidar caches): um ETag novo
+        # nunca pode ser servido com dados antigos
+        self._versoes_tabela.update(alteradas)
+        self._versao = atual
+        self._ultima_verificacao = time.monotonic()
+        self._erro = None
+        return alteradas
+
+    def iniciar(self):
+        """Arranca a thread de verificação periódica (daemon)."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._parar.clear()
+            self._thread = threading.Thread(
+                target=self._loop, name="monitor-alteracoes", daemon=True
+            )
+            self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+        with self._lock:
+            self._thread = None
+
+    def _loop(self):
+        while not self._parar.is_set():
+            try:
+                self.verificar()
+            except Exception as e:
+                if self._erro != str(e):
+                    logger.warning("Monitor de alterações sem change tracking: %s", e)
+                self._erro = str(e)
+            self._parar.wait(self.intervalo)
+
+    def stats(self) -> dict:
+        return {
+            "ativo": self._thread is not None,
+            "saudavel": self.saudavel(),
+            "versao": self._versao,
+            "versoes_tabela": dict(self._versoes_tabela),
+            "erro": self._erro,
+        }
+
+
+monitor = MonitorAlteracoes(TABELAS, settings.alteracoes_intervalo)
@@ -0,0 +1,363 @@
+# SERVIDOR/app/analytics.py
+"""
+Análise dos movimentos para todos os artigos de uma vez: séries de entradas e
+saídas por dia, semana ou mês, consumo médio, dias de cobertura e artigos abaixo
+do ponto de encomenda.
+
+Os movimentos são carregados em colunas NumPy (artigo, dia, entrada, saída) e
+todas as contas são reduções agrupadas sobre os arrays (np.unique + np.bincount),
+sem ciclos em Python por movimento. As colunas e os resultados ficam em cache
+até o monitor de alterações ver movimentos novos.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Callable, Dict, Hashable, Optional, Sequence
+
+import numpy as np
+from fastapi import APIRouter, HTTPException
+
+from .alteracoes import monitor
+from .cache import CacheTTL
+from .config import settings
+from .db import get_connection
+from .executor import em_executor
+from .serializacao import json_rapido
+
+router = APIRouter()
+
+PERIODOS = ("dia", "semana", "mes")
+
+# Resultados guardados por conjunto de colunas (os mais usados)
+_MAX_RESULTADOS = 64
+
+
+class MovimentosColunares:
+    """
+    Movimentos em arrays paralelos: `artigo` (int64), `dia` (datetime64[D]),
+    `entrada` e `saida` (float64). Guarda também os resultados já calculados
+    sobre estes arrays, que deixam de existir quando as colunas são recarregadas.
+    """
+
+    def __init__(self, artigo: np.ndarray, dia: np.ndarray, entrada: np.ndarray, saida: np.ndarray):
+        validos = ~np.isnat(dia)
+        self.artigo = artigo[validos]
+        self.dia = dia[validos]
+        self.entrada = np.nan_to_num(entrada[validos])
+        self.saida = np.nan_to_num(saida[validos])
+        # Índice denso de cada artigo (0..n-1), usado por todas as reduções
+        self.artigos, self.indice = np.unique(self.artigo, return_inverse=True)
+        self.carregado_em = time.monotonic()
+        self._lock = threading.Lock()
+        self._resultados: "OrderedDict[Hashable, Any]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.artigo)
+
+    @classmethod
+    def de_linhas(cls, blocos) -> "MovimentosColunares":
+        """
+        Constrói as colunas a partir de blocos de linhas numéricas
+        (ID_artigo, dias desde 1970-01-01, Qtd_entrada, Qtd_saida), como as de _SQL_MOVIMENTOS.
+        """
+        matrizes = [np.array(rows, dtype=np.float64).reshape(-1, 4) for rows in blocos if rows]
+        matriz = np.concatenate(matrizes) if matrizes else np.empty((0, 4))
+        matriz = matriz[~np.isnan(matriz[:, 0]) & ~np.isnan(matriz[:, 1])]
+        return cls(
+            matriz[:, 0].astype(np.int64),
+            matriz[:, 1].astype(np.int64).astype("datetime64[D]"),
+            matriz[:, 2],
+            matriz[:, 3],
+        )
+
+    def resultado(self, chave: Hashable, calcular: Callable[[], Any]) -> Any:
+        with self._lock:
+            if chave in self._resultados:
+                self._resultados.move_to_end(chave)
+                return self._resultados[chave]
+        valor = calcular()
+        with self._lock:
+            self._resultados[chave] = valor
+            while len(self._resultados) > _MAX_RESULTADOS:
+                self._resultados.popitem(last=False)
+        return valor
+
+    def stats(self) -> dict:
+        return {
+            "movimentos": len(self),
+            "artigos": len(self.artigos),
+            "primeiro_dia": str(self.dia.min()) if len(self) else None,
+            "ultimo_dia": str(self.dia.max()) if len(self) else None,
+            "resultados_em_cache": len(self._resultados),
+            "idade_s": round(time.monotonic() - self.carregado_em, 1),
+        }
+
+
+def _periodo(dia: np.ndarray, periodo: str) -> np.ndarray:
+    """Primeiro dia do período de cada data (semanas de segunda a domingo)."""
+    if periodo == "mes":
+        return dia.astype("datetime64[M]").astype("datetime64[D]")
+    if periodo == "semana":
+        # 1970-01-01 foi uma quinta-feira
+        dias = dia.astype(np.int64)
+        return ((dias + 3) // 7 * 7 - 3).astype("datetime64[D]")
+    return dia
+
+
+def series(
+    mov: MovimentosColunares,
+    periodo: str,
+    desde: np.datetime64,
+    ate: np.datetime64,
+    artigos: Optional[Sequence[int]] = None,
+) -> Dict[str, Any]:
+    """
+    Entradas e saídas por artigo e período entre `desde` e `ate` (inclusive).
+    Só aparecem os períodos com movimentos.
+    """
+    filtro = (mov.dia >= desde) & (mov.dia <= ate)
+    if artigos:
+        filtro &= np.isin(mov.artigo, np.asarray(artigos, dtype=np.int64))
+    indice = mov.indice[filtro]
+    inicio = _periodo(mov.dia[filtro], periodo)
+
+    # Uma chave por (artigo, período): artigo * n_periodos + período
+    dias = inicio.astype(np.int64)
+    base = dias.min() if len(dias) else 0
+    largura = int(dias.max() - base + 1) if len(dias) else 1
+    chave = indice.astype(np.int64) * largura + (dias - base)
+    chaves, grupo = np.unique(chave, return_inverse=True)
+    entradas = np.bincount(grupo, weights=mov.entrada[filtro], minlength=len(chaves))
+    saidas = np.bincount(grupo, weights=mov.saida[filtro], minlength=len(chaves))
+    artigo_grupo = mov.artigos[chaves // largura]
+    periodo_grupo = (chaves % largura + base).astype("datetime64[D]")
+    if periodo == "mes":
+        periodo_grupo = periodo_grupo.astype("datetime64[M]")
+
+    # As chaves vêm ordenadas por artigo e período: cortar onde muda o artigo
+    cortes = np.flatnonzero(np.diff(artigo_grupo)) + 1
+    limites = zip(np.concatenate(([0], cortes)), np.concatenate((cortes, [len(chaves)])))
+    rotulos = periodo_grupo.astype(str)
+    return {
+        "periodo": periodo,
+        "desde": str(desde),
+        "ate": str(ate),
+        "series": [
+            {
+                "ID_artigo": int(artigo_grupo[i]),
+                "periodos": rotulos[i:j].tolist(),
+                "entradas": entradas[i:j].tolist(),
+                "saidas": saidas[i:j].tolist(),
+            }
+            for i, j in limites
+            if j > i
+        ],
+    }
+
+
+def consumo(
+    mov: MovimentosColunares,
+    hoje: np.datetime64,
+    janela: int,
+    prazo: float,
+    seguranca: float,
+) -> Dict[str, np.ndarray]:
+    """
+    Por artigo (na ordem de mov.artigos): saldo até `hoje`, consumo médio diário
+    nos últimos `janela` dias e nos últimos 7/30/90, dias de cobertura (saldo /
+    consumo) e ponto de encomenda (consumo x (prazo de reposição + dias de segurança)).
+    """
+    n = len(mov.artigos)
+    ate_hoje = mov.dia <= hoje
+    saldo = np.bincount(
+        mov.indice[ate_hoje], weights=(mov.entrada - mov.saida)[ate_hoje], minlength=n
+    )
+
+    def media(dias: int) -> np.ndarray:
+        na_janela = ate_hoje & (mov.dia > hoje - np.timedelta64(dias, "D"))
+        return np.bincount(mov.indice[na_janela], weights=mov.saida[na_janela], minlength=n) / dias
+
+    diario = media(janela)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cobertura = np.where(diario > 0, np.maximum(saldo, 0) / diario, np.inf)
+    ponto = diario * (prazo + seguranca)
+    return {
+        "ID_artigo": mov.artigos,
+        "saldo": saldo,
+        "consumo_diario": diario,
+        "consumo_7d": media(7),
+        "consumo_30d": media(30),
+        "consumo_90d": media(90),
+        "dias_cobertura": cobertura,
+        "ponto_encomenda": ponto,
+        # Só conta quem tem consumo: um artigo parado não está em rutura
+        "abaixo_ponto": (diario > 0) & (saldo <= ponto),
+    }
+
+
+def _linhas(colunas: Dict[str, np.ndarray], selecao: Optional[np.ndarray] = None) -> list:
+    """Colunas -> lista de dicts (uma conversão tolist por coluna). Infinito sai como null."""
+    convertidas = {}
+    for nome, valores in colunas.items():
+        if selecao is not None:
+            valores = valores[selecao]
+        if valores.dtype.kind == "f":
+            valores = np.round(valores, 3)
+            lista = [None if not np.isfinite(v) else v for v in valores.tolist()]
+        else:
+            lista = valores.tolist()
+        convertidas[nome] = lista
+    nomes = list(convertidas)
+    return [dict(zip(nomes, linha)) for linha in zip(*convertidas.values())]
+
+
+# ---------------------------------------------------------------- carregamento
+
+cache_analytics = CacheTTL({"movimentos": settings.analytics_ttl})
+
+
+# Datas e quantidades já convertidas no SQL Server: criar datetime e Decimal em
+# Python para cada linha custava mais do que todas as contas juntas
+_SQL_MOVIMENTOS = """
+    SELECT ID_artigo,
+           DATEDIFF(DAY, '19700101', Data_mov),
+           CAST(Qtd_entrada AS FLOAT),
+           CAST(Qtd_saida AS FLOAT)
+    FROM Movimentos
+"""
+
+
+def _ler_movimentos() -> MovimentosColunares:
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(_SQL_MOVIMENTOS)
+        lotes = iter(lambda: cur.fetchmany(settings.sync_fetch_lote), [])
+        colunas = MovimentosColunares.de_linhas(lotes)
+        cur.close()
+    return colunas
+
+
+def movimentos_colunares() -> MovimentosColunares:
+    """Colunas dos movimentos (em cache até haver movimentos novos ou expirar ANALYTICS_TTL)."""
+    return cache_analytics.obter("movimentos", _ler_movimentos)
+
+
+def _ao_alterar(alteradas: Dict[str, int], desde: int, ate: int):
+    if "movimentos" in alteradas:
+        cache_analytics.invalidar("movimentos")
+
+
+monitor.subscrever(_ao_alterar)
+
+
+def _data(valor: Optional[date], omissao: date) -> np.datetime64:
+    return np.datetime64(valor or omissao, "D")
+
+
+# ---------------------------------------------------------------- endpoints
+
+@router.get("/analytics/movimentos/series")
+@em_executor
+def get_series(
+    periodo: str = "semana",
+    desde: Optional[date] = None,
+    ate: Optional[date] = None,
+    id_artigo: Optional[str] = None,
+):
+    """
+    Entradas e saídas por artigo e por dia, semana ou mês.
+    Por omissão: os últimos 90 dias, 26 semanas ou 24 meses até hoje.
+    `id_artigo` aceita vários ids separados por vírgulas.
+    """
+    if periodo not in PERIODOS:
+        raise HTTPException(
+            status_code=400, detail=f"periodo deve ser um de: {', '.join(PERIODOS)}"
+        )
+    try:
+        artigos = tuple(int(i) for i in id_artigo.split(",") if i.strip()) if id_artigo else ()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="id_artigo deve ser uma lista de números")
+    fim = _data(ate, date.today())
+    omissao = {"dia": 90, "semana": 26 * 7, "mes": 730}[periodo]
+    inicio = _data(desde, (fim - np.timedelta64(omissao - 1, "D")).item())
+    try:
+        mov = movimentos_colunares()
+        resultado = mov.resultado(
+            ("series", periodo, inicio, fim, artigos),
+            lambda: series(mov, periodo, inicio, fim, artigos),
+        )
+        return json_rapido(resultado)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Erro ao calcular séries de movimentos: {str(e)}"
+        )
+
+
+def _consumo(janela: int, prazo: Optional[float], seguranca: Optional[float], ate: Optional[date]):
+    if janela < 1:
+        raise HTTPException(status_code=400, detail="janela deve ser pelo menos 1 dia")
+    prazo = settings.analytics_prazo_reposicao if prazo is None else prazo
+    seguranca = settings.analytics_dias_seguranca if seguranca is None else seguranca
+    hoje = _data(ate, date.today())
+    mov = movimentos_colunares()
+    colunas = mov.resultado(
+        ("consumo", hoje, janela, prazo, seguranca),
+        lambda: consumo(mov, hoje, janela, prazo, seguranca),
+    )
+    parametros = {"ate": str(hoje), "janela": janela, "prazo": prazo, "seguranca": seguranca}
+    return colunas, parametros
+
+
+@router.get("/analytics/movimentos/consumo")
+@em_executor
+def get_consumo(
+    janela: int = 30,
+    prazo: Optional[float] = None,
+    seguranca: Optional[float] = None,
+    ate: Optional[date] = None,
+):
+    """
+    Por artigo: saldo, consumo médio diário (na `janela` e a 7/30/90 dias),
+    dias de cobertura, ponto de encomenda e se está abaixo dele.
+    `prazo` e `seguranca` (dias) por omissão vêm de ANALYTICS_PRAZO_REPOSICAO e
+    ANALYTICS_DIAS_SEGURANCA.
+    """
+    try:
+        colunas, parametros = _consumo(janela, prazo, seguranca, ate)
+        return json_rapido({**parametros, "artigos": _linhas(colunas)})
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao calcular consumo: {str(e)}")
+
+
+@router.get("/analytics/movimentos/reposicao")
+@em_executor
+def get_reposicao(
+    janela: int = 30,
+    prazo: Optional[float] = None,
+    seguranca: Optional[float] = None,
+    ate: Optional[date] = None,
+):
+    """
+    Artigos com saldo no ponto de encomenda ou abaixo, os com menos dias de cobertura
+    primeiro.
+    """
+    try:
+        colunas, parametros = _consumo(janela, prazo, seguranca, ate)
+        abaixo = np.flatnonzero(colunas["abaixo_ponto"])
+        ordem = abaixo[np.argsort(colunas["dias_cobertura"][abaixo], kind="stable")]
+        return json_rapido({**parametros, "artigos": _linhas(colunas, ordem)})
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao calcular reposição: {str(e)}")
+
+
+@router.get("/analytics/movimentos/estado")
+async def get_estado():
+    """Estado da cache das colunas de movimentos."""
+    estado = cache_analytics.stats()["movimentos"]
+    colunas = cache_analytics.em_cache("movimentos")
+    return {**estado, **(colunas.stats() if colunas is not None else {})}
@@ -1,21 +1,25 @@
-from fastapi import APIRouter, HTTPException
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel
+from typing import Any, Dict, Iterable, List, Optional
+import logging
+import threading
+from .config import settings
 from .db import get_connection
+from .executor import em_executor, run_db
+from .paginacao import Pagina, pagina
+from .replica import get_leitura
+from .alteracoes import monitor
+from .cache import designacoes
+from .etag import condicional
+from .serializacao import json_rapido
+from .indice_codigos import COLUNAS_CODIGO, IndiceCodigos, normalizar_codigo
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
-
-@router.get("/artigos")
-def get_all_artigos():
-    """
-    Retorna todos os artigos com informações de tipo, família e stock.
-    """
-    try:
-        conn = get_connection()
-        cur = conn.cursor()
-        
-        query = """
-            SELECT 
+# Colunas comuns a todas as consultas de artigos (ver _artigo_de_linha).
+# As designações de tipo e família vêm da cache de referência, não de JOINs.
+_COLUNAS_ARTIGO = """
                 a.ID_artigo,
                 a.ID_tipo,
                 a.ID_familia,
@@ -24,123 +28,347 @@ def get_all_artigos():
                 a.Imagem,
                 a.Cod_bar,
                 a.Cod_NFC,
-                a.Cod_RFID,
-                t.Designacao AS tipo_designacao,
-                f.Designacao AS familia_designacao
-            FROM Artigo a
-            LEFT JOIN Tipo t ON a.ID_tipo = t.ID_tipo
-            LEFT JOIN Familia f ON a.ID_familia = f.ID_familia
-            ORDER BY a.Designacao
-        """
-        
-        cur.execute(query)
-        rows = cur.fetchall()
+                a.Cod_RFID
+"""
+_FROM_ARTIGO = "Artigo a"
+
+# Máximo de parâmetros por IN (...) (o SQL Server aceita até 2100 por query)
+_LOTE_IN = 1000
+
+
+def _referencias(cur):
+    """(tipos, familias): mapas ID -> Designacao; `cur` só é usado se a cache tiver expirado."""
+    return designacoes("tipos", cur), designacoes("familias", cur)
+
+
+def _artigo_de_linha(row, referencias) -> Dict[str, Any]:
+    """Monta o artigo (com tipo e família) a partir de uma linha de _COLUNAS_ARTIGO."""
+    tipos, familias = referencias
+    artigo = {
+        "ID_artigo": row[0],
+        "ID_tipo": row[1],
+        "ID_familia": row[2],
+        "Referencia": row[3],
+        "Designacao": row[4],
+        "Imagem": row[5],
+        "Cod_bar": row[6],
+        "Cod_NFC": row[7],
+        "Cod_RFID": row[8],
+    }
+    
+    # Adiciona tipo se existir
+    if row[1] and tipos.get(row[1]):
+        artigo["tipo"] = {
+            "ID_tipo": row[1],
+            "Designacao": tipos[row[1]]
+        }
+    
+    # Adiciona família se existir
+    if row[2] and familias.get(row[2]):
+        artigo["familia"] = {
+            "ID_familia": row[2],
+            "Designacao": familias[row[2]]
+        }
+    
+    return artigo
+
+
+def _ler_artigos(cur, ids: Optional[Iterable[int]] = None) -> List[Dict[str, Any]]:
+    """Lê todos os artigos, ou só os `ids` indicados (em lotes de IN)."""
+    referencias = _referencias(cur)
+    if ids is None:
+        cur.execute(f"SELECT {_COLUNAS_ARTIGO} FROM {_FROM_ARTIGO}")
+        return [_artigo_de_linha(row, referencias) for row in cur.fetchall()]
+
+    ids = list(ids)
+    artigos = []
+    for i in range(0, len(ids), _LOTE_IN):
+        lote = ids[i:i + _LOTE_IN]
+        marcadores = ", ".join("?" * len(lote))
+        cur.execute(
+            f"SELECT {_COLUNAS_ARTIGO} FROM {_FROM_ARTIGO} WHERE a.ID_artigo IN ({marcadores})",
+            lote,
+        )
+        artigos.extend(_artigo_de_linha(row, referencias) for row in cur.fetchall())
+    return artigos
+
+
+# Dependências do ETag das respostas de artigos (as designações vêm de Tipo e Familia)
+_ETAG_ARTIGOS = condicional("artigos", "tipos", "familias")
+
+
+# ---------------------------------------------------------------- índice de códigos
+
+indice = IndiceCodigos()
+_reconstrucao = threading.Lock()
+
+
+def construir_indice():
+    """Reconstrói o índice de códigos com todos os artigos."""
+    with _reconstrucao:
+        with get_connection("artigos.indice") as conn:
+            cur = conn.cursor()
+            artigos = _ler_artigos(cur)
+            cur.close()
+        indice.carregar(artigos)
+    logger.info("Índice de códigos construído: %s", indice.stats())
+
+
+def _indice_fresco() -> bool:
+    """O índice está atualizado se o monitor de alterações está a funcionar ou se é recente."""
+    if not indice.construido:
+        return False
+    return monitor.saudavel() or indice.idade() < settings.codigos_indice_max_idade
+
+
+def _agendar_reconstrucao():
+    """Reconstrói o índice em background, se não houver já uma reconstrução a decorrer."""
+    if _reconstrucao.locked():
+        return
+
+    def _correr():
+        try:
+            construir_indice()
+        except Exception as e:
+            logger.warning("Não foi possível reconstruir o índice de códigos: %s", e)
+
+    threading.Thread(target=_correr, name="indice-codigos", daemon=True).start()
+
+
+def _ao_alterar(alteradas: Dict[str, int], desde: int, ate: int):
+    """Mantém o índice atualizado com as alterações detetadas pelo monitor."""
+    if not indice.construido:
+        return
+    if "tipos" in alteradas or "familias" in alteradas:
+        # Designações de tipo/família estão copiadas em todos os artigos
+        construir_indice()
+        return
+    if "artigos" not in alteradas:
+        return
+
+    with get_connection("artigos.alteracoes") as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT ct.SYS_CHANGE_OPERATION, ct.ID_artigo "
+            "FROM CHANGETABLE(CHANGES dbo.Artigo, ?) AS ct",
+            (desde,),
+        )
+        alteracoes = cur.fetchall()
+        # Muitas alterações de uma vez: sai mais barato reconstruir tudo
+        reconstruir = len(alteracoes) > 10 * _LOTE_IN
+        if not reconstruir:
+            removidos = [row[1] for row in alteracoes if row[0] == 'D']
+            artigos = _ler_artigos(cur, [row[1] for row in alteracoes if row[0] != 'D'])
+        cur.close()
+
+    if reconstruir:
+        construir_indice()
+        return
+
+    # Ids alterados que já não existem (apagados depois da alteração) saem do índice
+    existentes = {a["ID_artigo"] for a in artigos}
+    removidos += [row[1] for row in alteracoes if row[0] != 'D' and row[1] not in existentes]
+    indice.atualizar(artigos, removidos)
+
+
+monitor.subscrever(_ao_alterar)
+
+
+def atualizar_artigo_no_indice(id_artigo: int):
+    """Atualiza já um artigo alterado pela própria API (sem esperar pelo monitor)."""
+    if not indice.construido:
+        return
+    with get_connection("artigos.indice_artigo") as conn:
+        cur = conn.cursor()
+        artigos = _ler_artigos(cur, [id_artigo])
+        cur.close()
+    indice.atualizar(artigos, [] if artigos else [id_artigo])
+
+
+def imagem_do_artigo(id_artigo: int) -> Optional[str]:
+    """
+    Campo Imagem de um artigo: do índice em memória se estiver atualizado, senão da BD.
+    None se o artigo não existir ou não tiver imagem.
+    """
+    if _indice_fresco():
+        artigo = indice.artigo(id_artigo)
+        return artigo.get("Imagem") if artigo else None
+    with get_leitura("artigos.imagem") as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT Imagem FROM Artigo WHERE ID_artigo = ?", (id_artigo,))
+        row = cur.fetchone()
+        cur.close()
+    return row[0] if row else None
+
+
+# ---------------------------------------------------------------- endpoints
+
+
+
+@router.get("/artigos", dependencies=[Depends(_ETAG_ARTIGOS)])
+@em_executor
+def get_all_artigos(pag: Pagina = Depends(pagina)):
+    """
+    Retorna todos os artigos com informações de tipo, família e stock.
+    Ordenados por Designacao e ID_artigo; aceita paginação com ?limit=&after=.
+    """
+    try:
+        query, params = pag.consulta(_COLUNAS_ARTIGO, _FROM_ARTIGO, ["a.Designacao", "a.ID_artigo"])
         
-        artigos = []
-        for row in rows:
-            artigo = {
-                "ID_artigo": row[0],
-                "ID_tipo": row[1],
-                "ID_familia": row[2],
-                "Referencia": row[3],
-                "Designacao": row[4],
-                "Imagem": row[5],
-                "Cod_bar": row[6],
-                "Cod_NFC": row[7],
-                "Cod_RFID": row[8],
-            }
-            
-            # Adiciona tipo se existir
-            if row[1] and row[9]:
-                artigo["tipo"] = {
-                    "ID_tipo": row[1],
-                    "Designacao": row[9]
-                }
-            
-            # Adiciona família se existir
-            if row[2] and row[10]:
-                artigo["familia"] = {
-                    "ID_familia": row[2],
-                    "Designacao": row[10]
-                }
-            
-            artigos.append(artigo)
+        with get_leitura("artigos.listar") as conn:
+            cur = conn.cursor()
+            referencias = _referencias(cur)
+            cur.execute(query, params)
+            rows = pag.cortar(cur.fetchall(), lambda row: [row[4], row[0]])
+            cur.close()
         
-        cur.close()
-        conn.close()
+        artigos = [_artigo_de_linha(row, referencias) for row in rows]
         
-        return artigos
+        return json_rapido(artigos, pag.response)
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao buscar artigos: {str(e)}")
 
 
-@router.get("/artigos/{id_artigo}")
+@router.get("/artigos/codigos/indice")
+async def get_indice_codigos():
+    """
+    Estado do índice de códigos em memória.
+    """
+    return {**indice.stats(), "fresco": _indice_fresco(), "monitor": monitor.stats()}
+
+
+@router.get("/artigos/codigos/colisoes")
+async def get_colisoes_codigos():
+    """
+    Códigos que identificam mais do que um artigo (na mesma coluna ou em colunas diferentes).
+    A leitura devolve o artigo da coluna com mais prioridade: Cod_bar, Cod_NFC, Cod_RFID,
+    Referencia.
+    """
+    if not indice.construido:
+        raise HTTPException(status_code=503, detail="Índice de códigos ainda não construído")
+    colisoes = indice.colisoes()
+    return {"total": len(colisoes), "colisoes": colisoes}
+
+
+class CodigosBatchRequest(BaseModel):
+    codigos: List[str]
+
+
+@router.post("/artigos/codigo/batch")
+async def get_artigos_by_codigos(request: CodigosBatchRequest):
+    """
+    Resolve vários códigos de uma vez (ex: leitura RFID em massa).
+    Retorna os artigos encontrados por código (tal como foi enviado) e a lista de códigos
+    desconhecidos. Usa o índice em memória; os códigos que lá não estão são resolvidos
+    numa só consulta por lote.
+    """
+    if len(request.codigos) > settings.codigos_batch_max:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Máximo de {settings.codigos_batch_max} códigos por pedido"
+        )
+
+    # Código normalizado -> códigos originais enviados
+    pedidos: Dict[str, List[str]] = {}
+    for codigo in request.codigos:
+        chave = normalizar_codigo(codigo)
+        if chave is not None:
+            pedidos.setdefault(chave, []).append(codigo)
+
+    resolvidos: Dict[str, Dict[str, Any]] = {}
+    em_falta = list(pedidos)
+    if _indice_fresco():
+        em_falta = []
+        for chave in pedidos:
+            artigo = indice.procurar(chave)
+            if artigo is not None:
+                resolvidos[chave] = artigo
+            else:
+                em_falta.append(chave)
+        if not settings.codigos_fallback_miss:
+            em_falta = []
+    else:
+        _agendar_reconstrucao()
+
+    if em_falta:
+        resolvidos.update(await run_db(_resolver_codigos_bd, em_falta))
+
+    encontrados = {}
+    for chave, artigo in resolvidos.items():
+        for original in pedidos[chave]:
+            encontrados[original] = artigo
+    desconhecidos = [
+        codigo for codigo in dict.fromkeys(request.codigos) if codigo not in encontrados
+    ]
+    return {
+        "total": len(request.codigos),
+        "encontrados": encontrados,
+        "desconhecidos": desconhecidos,
+    }
+
+
+def _resolver_codigos_bd(chaves: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Resolve códigos normalizados na BD com uma consulta IN por lote
+    (4 colunas x 500 códigos = 2000 parâmetros, abaixo do limite de 2100).
+    """
+    lote_max = _LOTE_IN // 2
+    pendentes = set(chaves)
+    # chave -> (prioridade da coluna, artigo)
+    melhores: Dict[str, Any] = {}
+    try:
+        with get_leitura("artigos.codigos_lote") as conn:
+            cur = conn.cursor()
+            referencias = _referencias(cur)
+            for i in range(0, len(chaves), lote_max):
+                lote = chaves[i:i + lote_max]
+                marcadores = ", ".join("?" * len(lote))
+                condicoes = " OR ".join(
+                    f"a.{coluna} IN ({marcadores})" for coluna in COLUNAS_CODIGO
+                )
+                cur.execute(
+                    f"SELECT {_COLUNAS_ARTIGO} FROM {_FROM_ARTIGO} WHERE {condicoes}",
+                    lote * len(COLUNAS_CODIGO),
+                )
+                for row in cur.fetchall():
+                    artigo = _artigo_de_linha(row, referencias)
+                    for prioridade, coluna in enumerate(COLUNAS_CODIGO):
+                        chave = normalizar_codigo(artigo[coluna])
+                        if chave not in pendentes:
+                            continue
+                        atual = melhores.get(chave)
+                        candidato = (prioridade, artigo["ID_artigo"])
+                        if atual is None or candidato < (atual[0], atual[1]["ID_artigo"]):
+                            melhores[chave] = (prioridade, artigo)
+            cur.close()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao buscar artigos por código: {str(e)}")
+    return {chave: artigo for chave, (_, artigo) in melhores.items()}
+
+
+@router.get("/artigos/{id_artigo}", dependencies=[Depends(_ETAG_ARTIGOS)])
+@em_executor
 def get_artigo_by_id(id_artigo: int):
     """
     Retorna um artigo específico pelo ID.
     """
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        
-        query = """
-            SELECT 
-                a.ID_artigo,
-                a.ID_tipo,
-                a.ID_familia,
-                a.Referencia,
-                a.Designacao,
-                a.Imagem,
-                a.Cod_bar,
-                a.Cod_NFC,
-                a.Cod_RFID,
-                t.Designacao AS tipo_designacao,
-                f.Designacao AS familia_designacao
-            FROM Artigo a
-            LEFT JOIN Tipo t ON a.ID_tipo = t.ID_tipo
-            LEFT JOIN Familia f ON a.ID_familia = f.ID_familia
-            WHERE a.ID_artigo = ?
-        """
-        
-        cur.execute(query, (id_artigo,))
-        row = cur.fetchone()
+        with get_leitura("artigos.por_id") as conn:
+            cur = conn.cursor()
+            referencias = _referencias(cur)
+            cur.execute(
+                f"SELECT {_COLUNAS_ARTIGO} FROM {_FROM_ARTIGO} WHERE a.ID_artigo = ?", (id_artigo,)
+            )
+            row = cur.fetchone()
+            cur.close()
         
         if not row:
-            cur.close()
-            conn.close()
             raise HTTPException(status_code=404, detail="Artigo não encontrado")
         
-        artigo = {
-            "ID_artigo": row[0],
-            "ID_tipo": row[1],
-            "ID_familia": row[2],
-            "Referencia": row[3],
-            "Designacao": row[4],
-            "Imagem": row[5],
-            "Cod_bar": row[6],
-            "Cod_NFC": row[7],
-            "Cod_RFID": row[8],
-        }
-        
-        # Adiciona tipo se existir
-        if row[1] and row[9]:
-            artigo["tipo"] = {
-                "ID_tipo": row[1],
-                "Designacao": row[9]
-            }
-        
-        # Adiciona família se existir
-        if row[2] and row[10]:
-            artigo["familia"] = {
-                "ID_familia": row[2],
-                "Designacao": row[10]
-            }
-        
-        cur.close()
-        conn.close()
-        
-        return artigo
+        return _artigo_de_linha(row, referencias)
         
     except HTTPException:
         raise
@@ -149,76 +377,57 @@ def get_artigo_by_id(id_artigo: int):
 
 
 @router.get("/artigos/codigo/{codigo}")
-def get_artigo_by_codigo(codigo: str):
+async def get_artigo_by_codigo(codigo: str):
     """
     Retorna um artigo pelo código (QR, NFC, RFID ou Código de Barras).
+    Responde a partir do índice em memória; só vai à BD se o índice não estiver
+    atualizado ou se o código não estiver lá (CODIGOS_FALLBACK_MISS).
     """
+    fresco = _indice_fresco()
+    if fresco:
+        artigo = indice.procurar(codigo)
+        if artigo is not None:
+            return artigo
+        if not settings.codigos_fallback_miss:
+            raise HTTPException(status_code=404, detail="Artigo não encontrado com este código")
+    else:
+        _agendar_reconstrucao()
+    return await run_db(_get_artigo_by_codigo_bd, codigo)
+
+
+def _get_artigo_by_codigo_bd(codigo: str):
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        
-        query = """
-            SELECT 
-                a.ID_artigo,
-                a.ID_tipo,
-                a.ID_familia,
-                a.Referencia,
-                a.Designacao,
-                a.Imagem,
-                a.Cod_bar,
-                a.Cod_NFC,
-                a.Cod_RFID,
-                t.Designacao AS tipo_designacao,
-                f.Designacao AS familia_designacao
-            FROM Artigo a
-            LEFT JOIN Tipo t ON a.ID_tipo = t.ID_tipo
-            LEFT JOIN Familia f ON a.ID_familia = f.ID_familia
+        codigo = codigo.strip()
+        query = f"""
+            SELECT TOP 1 {_COLUNAS_ARTIGO}
+            FROM {_FROM_ARTIGO}
             WHERE a.Cod_bar = ? 
                OR a.Cod_NFC = ? 
                OR a.Cod_RFID = ?
                OR a.Referencia = ?
+            ORDER BY
+                CASE
+                    WHEN a.Cod_bar = ? THEN 0
+                    WHEN a.Cod_NFC = ? THEN 1
+                    WHEN a.Cod_RFID = ? THEN 2
+                    ELSE 3
+                END,
+                a.ID_artigo
         """
         
-        cur.execute(query, (codigo, codigo, codigo, codigo))
-        row = cur.fetchone()
+        with get_leitura("artigos.por_codigo") as conn:
+            cur = conn.cursor()
+            referencias = _referencias(cur)
+            cur.execute(query, (codigo,) * 7)
+            row = cur.fetchone()
+            cur.close()
         
         if not row:
-            cur.close()
-            conn.close()
             raise HTTPException(status_code=404, detail="Artigo não encontrado com este código")
         
-        artigo = {
-            "ID_artigo": row[0],
-            "ID_tipo": row[1],
-            "ID_familia": row[2],
-            "Referencia": row[3],
-            "Designacao": row[4],
-            "Imagem": row[5],
-            "Cod_bar": row[6],
-            "Cod_NFC": row[7],
-            "Cod_RFID": row[8],
-        }
-        
-        # Adiciona tipo se existir
-        if row[1] and row[9]:
-            artigo["tipo"] = {
-                "ID_tipo": row[1],
-                "Designacao": row[9]
-            }
-        
-        # Adiciona família se existir
-        if row[2] and row[10]:
-            artigo["familia"] = {
-                "ID_familia": row[2],
-                "Designacao": row[10]
-            }
-        
-        cur.close()
-        conn.close()
-        
-        return artigo
+        return _artigo_de_linha(row, referencias)
         
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro ao buscar artigo por código: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Erro ao buscar artigo por código: {str(e)}")
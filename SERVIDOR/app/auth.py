@@ -1,9 +1,15 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from typing import Optional
+import logging
+from .config import settings
 from .db import get_connection
+from .executor import run_db
+from .senhas import gerar_hash_async, verificar_async
+from .sessoes import cache_utilizadores, dados_utilizador, emitir_token, utilizador_atual
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 
 class LoginRequest(BaseModel):
@@ -15,61 +21,90 @@ class LoginResponse(BaseModel):
     success: bool
     message: Optional[str] = None
     utilizador: Optional[dict] = None
+    access_token: Optional[str] = None
+    token_type: Optional[str] = None
+    expires_at: Optional[int] = None
+
+
+def _ler_utilizador(username: str):
+    with get_connection("auth.login") as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT ID_utilizador, Nome, Email, Username, Password, Ativo
+            FROM Utilizadores
+            WHERE Username = ? AND Ativo = 1
+        """, (username,))
+        row = cur.fetchone()
+        cur.close()
+    return row
+
+
+def _guardar_hash(id_utilizador: int, antigo: str, novo: str):
+    """Troca a password guardada pelo hash, se entretanto não tiver sido alterada."""
+    with get_connection("auth.guardar_hash") as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE Utilizadores
+            SET Password = ?
+            WHERE ID_utilizador = ? AND Password = ?
+        """, (novo, id_utilizador, antigo))
+        conn.commit()
+        cur.close()
 
 
 @router.post("/auth/login", response_model=LoginResponse)
-def login(request: LoginRequest):
+async def login(request: LoginRequest):
     """
     Endpoint de autenticação.
+    A password é verificada (scrypt) num pool de processos. Devolve um token de
+    acesso assinado para usar nas outras rotas (Authorization: Bearer <token>).
+    Com AUTH_ATUALIZAR_HASH, passwords antigas guardadas em texto passam a hash neste login.
     """
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        
         # Busca utilizador
-        query = """
-            SELECT ID_utilizador, Nome, Email, Username, Password, Ativo
-            FROM Utilizadores
-            WHERE Username = ? AND Ativo = 1
-        """
-        
-        cur.execute(query, (request.username,))
-        row = cur.fetchone()
-        
+        row = await run_db(_ler_utilizador, request.username)
+
         if not row:
-            cur.close()
-            conn.close()
             return LoginResponse(
                 success=False,
                 message="Utilizador não encontrado ou inativo"
             )
-        
+
         # Verifica password
-        if row[4] != request.password:
-            cur.close()
-            conn.close()
+        ok, atualizar = await verificar_async(request.password, row[4])
+        if not ok:
             return LoginResponse(
                 success=False,
                 message="Password incorreta"
             )
-        
+
+        if atualizar and settings.auth_atualizar_hash:
+            try:
+                novo = await gerar_hash_async(request.password)
+                await run_db(_guardar_hash, row[0], row[4], novo)
+            except Exception as e:
+                # O login vale na mesma; a troca fica para a próxima vez
+                logger.warning("Não foi possível guardar o hash da password de %s: %s", row[3], e)
+
         # Login OK
-        utilizador = {
-            "ID_utilizador": row[0],
-            "Nome": row[1],
-            "Email": row[2],
-            "Username": row[3],
-            "Ativo": row[5]
-        }
-        
-        cur.close()
-        conn.close()
-        
+        utilizador = dados_utilizador(row)
+        cache_utilizadores.guardar(row[0], utilizador)
+        token, expira = emitir_token(row[0], row[3])
+
         return LoginResponse(
             success=True,
             message="Login bem-sucedido",
-            utilizador=utilizador
+            utilizador=utilizador,
+            access_token=token,
+            token_type="bearer",
+            expires_at=expira
         )
-        
+
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Erro: {str(e)}")
+
+
+@router.get("/auth/me")
+async def get_me(utilizador: dict = Depends(utilizador_atual)):
+    """Utilizador do token enviado (401 se o token for inválido ou o utilizador estiver inativo)."""
+    return utilizador
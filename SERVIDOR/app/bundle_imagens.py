@@ -0,0 +1,253 @@
+# SERVIDOR/app/bundle_imagens.py
+"""
+Todas as imagens alteradas desde um token de sincronização num só pedido:
+um tar (sem compressão, as imagens já vêm comprimidas) com manifest.json em
+primeiro lugar e depois os ficheiros, lidos do disco à medida que são enviados.
+
+O tar é determinístico (mtime 0, ordem fixa, cada imagem uma vez), por isso o
+mesmo manifesto gera sempre os mesmos bytes: o ETag é o hash do manifesto e um
+download interrompido retoma com Range + If-Range.
+"""
+import hashlib
+import json
+import re
+import tarfile
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+
+from .alteracoes import versao_atual, versao_minima
+from .conteudo_imagens import hash_do_ficheiro
+from .db import get_connection
+from .etag import corresponde
+from .executor import em_executor
+from .miniaturas import ORIGINAL, TAMANHOS, caminho_derivada
+from .tabelas import POR_CHAVE
+
+router = APIRouter()
+
+MEDIA_TYPE = "application/x-tar"
+_BLOCO = 512
+_LEITURA = 1024 * 1024
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# Parte do tar: bytes já prontos (cabeçalhos, manifesto) ou (ficheiro, tamanho)
+Parte = Union[bytes, Tuple[Path, int]]
+
+
+def _alteracoes(cur, desde: Optional[int]) -> Tuple[int, bool, List[Tuple[int, Optional[str]]]]:
+    """
+    (versão nova, reset, [(ID_artigo, Imagem)]) com os artigos cuja imagem mudou desde `desde`.
+    Imagem None = artigo apagado ou sem imagem. Sem token (ou com um token antigo) vêm todos.
+    """
+    nova = versao_atual(cur)
+    if desde is None or desde > nova or desde < versao_minima(cur, POR_CHAVE["artigos"]):
+        cur.execute(
+            "SELECT ID_artigo, Imagem FROM Artigo WHERE Imagem IS NOT NULL ORDER BY ID_artigo"
+        )
+        return nova, True, [(row[0], row[1]) for row in cur.fetchall()]
+    # Alterações a outras colunas não interessam (TRACK_COLUMNS_UPDATED, ver CHANGE_TRACKING.sql)
+    cur.execute("""
+        SELECT ct.ID_artigo, t.Imagem
+        FROM CHANGETABLE(CHANGES dbo.Artigo, ?) AS ct
+        LEFT JOIN dbo.Artigo AS t ON t.ID_artigo = ct.ID_artigo
+        WHERE ct.SYS_CHANGE_OPERATION <> 'U'
+           OR CHANGE_TRACKING_IS_COLUMN_IN_MASK(
+                  COLUMNPROPERTY(OBJECT_ID('dbo.Artigo'), 'Imagem', 'ColumnId'),
+                  ct.SYS_CHANGE_COLUMNS
+              ) = 1
+        ORDER BY ct.ID_artigo
+    """, (desde,))
+    return nova, False, [(row[0], row[1]) for row in cur.fetchall()]
+
+
+def _cabecalho(nome: str, tamanho: int) -> bytes:
+    info = tarfile.TarInfo(nome)
+    info.size = tamanho
+    info.mtime = 0
+    info.mode = 0o644
+    return info.tobuf(format=tarfile.USTAR_FORMAT)
+
+
+def _enchimento(tamanho: int) -> bytes:
+    return b"\0" * (-tamanho % _BLOCO)
+
+
+def montar_bundle(
+    artigos: List[Tuple[int, Optional[str]]],
+    size: str = ORIGINAL,
+    since: Optional[str] = None,
+    reset: bool = False,
+) -> Tuple[Dict[str, Any], List[Parte]]:
+    """
+    Manifesto e partes do tar para os artigos dados. Cada ficheiro entra uma vez,
+    mesmo que seja a imagem de vários artigos. Se `size` ainda não tiver sido
+    gerado para uma imagem, vai a original (o manifesto diz qual foi).
+    """
+    imagens: List[Dict[str, Any]] = []
+    removidos: List[int] = []
+    em_falta: List[int] = []
+    ficheiros: Dict[str, Tuple[Path, int]] = {}
+
+    for id_artigo, imagem in artigos:
+        if not imagem:
+            removidos.append(id_artigo)
+            continue
+        original = Path(imagem)
+        caminho, servido = original, ORIGINAL
+        if size != ORIGINAL and caminho_derivada(original, size).is_file():
+            caminho, servido = caminho_derivada(original, size), size
+        try:
+            stat = caminho.stat()
+            hash_imagem = hash_do_ficheiro(original)
+        except OSError:
+            em_falta.append(id_artigo)
+            continue
+        nome = f"imagens/{hash_imagem}{original.suffix.lower()}"
+        if servido != ORIGINAL:
+            nome += f".{servido}.webp"
+        ficheiros.setdefault(nome, (caminho, stat.st_size))
+        imagens.append({
+            "ID_artigo": id_artigo,
+            "hash": hash_imagem,
+            "size": servido,
+            "ficheiro": nome,
+            "tamanho": ficheiros[nome][1],
+        })
+
+    manifesto = {
+        "since": since,
+        "reset": reset,
+        "size": size,
+        "imagens": imagens,
+        "removidos": removidos,
+        "em_falta": em_falta,
+    }
+    dados = json.dumps(manifesto, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    partes: List[Parte] = [
+        _cabecalho("manifest.json", len(dados)) + dados + _enchimento(len(dados))
+    ]
+    for nome, (caminho, tamanho) in ficheiros.items():
+        partes.append(_cabecalho(nome, tamanho))
+        partes.append((caminho, tamanho))
+        partes.append(_enchimento(tamanho))
+    partes.append(b"\0" * (2 * _BLOCO))
+    return manifesto, partes
+
+
+def tamanho_partes(partes: List[Parte]) -> int:
+    return sum(len(p) if isinstance(p, bytes) else p[1] for p in partes)
+
+
+def ler_partes(partes: List[Parte], inicio: int = 0, fim: Optional[int] = None) -> Iterator[bytes]:
+    """Bytes [inicio, fim) do tar, lendo os ficheiros em blocos (nada fica todo em memória)."""
+    fim = tamanho_partes(partes) if fim is None else fim
+    posicao = 0
+    for parte in partes:
+        tamanho = len(parte) if isinstance(parte, bytes) else parte[1]
+        if posicao + tamanho <= inicio:
+            posicao += tamanho
+            continue
+        if posicao >= fim:
+            break
+        de, ate = max(inicio - posicao, 0), min(fim - posicao, tamanho)
+        if isinstance(parte, bytes):
+            yield parte[de:ate]
+        else:
+            with open(parte[0], "rb") as f:
+                f.seek(de)
+                falta = ate - de
+                while falta > 0:
+                    bloco = f.read(min(_LEITURA, falta))
+                    if not bloco:
+                        # O ficheiro mudou depois do manifesto: o cliente volta a pedir
+                        raise IOError(f"Ficheiro encurtado durante o envio: {parte[0]}")
+                    falta -= len(bloco)
+                    yield bloco
+        posicao += tamanho
+
+
+def _intervalo(range_header: Optional[str], total: int) -> Optional[Tuple[int, int]]:
+    """(inicio, fim) de um Range com um só intervalo; None para enviar tudo."""
+    if not range_header:
+        return None
+    m = _RANGE.match(range_header.strip())
+    if not m or (not m.group(1) and not m.group(2)):
+        return None
+    if m.group(1):
+        inicio = int(m.group(1))
+        fim = min(int(m.group(2)) + 1, total) if m.group(2) else total
+    else:
+        inicio, fim = max(total - int(m.group(2)), 0), total
+    if inicio >= total or inicio >= fim:
+        raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{total}"})
+    return inicio, fim
+
+
+@router.get("/sync/imagens/bundle")
+@em_executor
+def sync_imagens_bundle(request: Request, since: Optional[str] = None, size: str = ORIGINAL):
+    """
+    Tar com as imagens dos artigos alteradas desde o token `since` (o de /sync/changes)
+    e manifest.json: [{ID_artigo, hash, size, ficheiro, tamanho}], "removidos" (artigos
+    que deixaram de ter imagem) e "em_falta" (ficheiro não encontrado no servidor).
+    Sem token vêm todas. `size`: thumb, list, detail ou original.
+    O token seguinte vem no header X-Sync-Token. Para retomar, repetir o pedido com
+    Range e If-Range: <ETag>; se entretanto algo mudou, vem o tar inteiro.
+    """
+    if size != ORIGINAL and size not in TAMANHOS:
+        raise HTTPException(
+            status_code=400, detail=f"size deve ser um de: {', '.join([*TAMANHOS, ORIGINAL])}"
+        )
+    desde = None
+    if since:
+        try:
+            desde = int(since)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Token de sincronização inválido")
+
+    try:
+        with get_connection() as conn:
+            cur = conn.cursor()
+            nova, reset, artigos = _alteracoes(cur, desde)
+            cur.close()
+        manifesto, partes = montar_bundle(artigos, size, since, reset)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao preparar imagens: {str(e)}")
+
+    resumo = hashlib.sha256(partes[0]).hexdigest()[:32]
+    etag = f'"{resumo}"'
+    total = tamanho_partes(partes)
+    headers = {
+        "ETag": etag,
+        "X-Sync-Token": str(nova),
+        "X-Bundle-Imagens": str(len(manifesto["imagens"])),
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "no-cache",
+        "Content-Disposition": f'attachment; filename="imagens-{nova}.tar"',
+    }
+    if corresponde(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    intervalo = None
+    if_range = request.headers.get("if-range")
+    if if_range is None or if_range == etag:
+        intervalo = _intervalo(request.headers.get("range"), total)
+    if intervalo is None:
+        return StreamingResponse(
+            ler_partes(partes), media_type=MEDIA_TYPE,
+            headers={**headers, "Content-Length": str(total)},
+        )
+    inicio, fim = intervalo
+    return StreamingResponse(
+        ler_partes(partes, inicio, fim),
+        status_code=206,
+        media_type=MEDIA_TYPE,
+        headers={
+            **headers,
+            "Content-Length": str(fim - inicio),
+            "Content-Range": f"bytes {inicio}-{fim - 1}/{total}",
+        },
+    )
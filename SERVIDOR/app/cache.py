@@ -0,0 +1,129 @@
+# SERVIDOR/app/cache.py
+"""
+Cache em memória (read-through, com TTL por tabela) para as tabelas de referência:
+Tipo, Familia, Estado e Armazem. Mudam raramente e são lidas em quase todos os pedidos.
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from .alteracoes import monitor
+from .config import settings
+from .db import get_connection
+from .tabelas import POR_CHAVE, linha_para_dict
+
+
+class CacheTTL:
+    """
+    Cache chave -> valor com TTL por chave e contadores de hits/misses.
+    Só um pedido carrega uma chave expirada de cada vez; os outros esperam pelo resultado.
+    """
+
+    def __init__(self, ttls: Dict[str, float]):
+        self.ttls = dict(ttls)
+        self._lock = threading.Lock()
+        self._valores: Dict[str, Any] = {}
+        self._expira: Dict[str, float] = {}
+        self._carregamento: Dict[str, threading.Lock] = {nome: threading.Lock() for nome in ttls}
+        self._hits: Dict[str, int] = {nome: 0 for nome in ttls}
+        self._misses: Dict[str, int] = {nome: 0 for nome in ttls}
+        self._invalidacoes: Dict[str, int] = {nome: 0 for nome in ttls}
+
+    def _valido(self, nome: str) -> bool:
+        return nome in self._valores and time.monotonic() < self._expira[nome]
+
+    def obter(self, nome: str, carregar: Callable[[], Any]) -> Any:
+        if self._valido(nome):
+            with self._lock:
+                self._hits[nome] += 1
+            return self._valores[nome]
+
+        with self._carregamento[nome]:
+            # Outro pedido pode ter carregado enquanto se esperava
+            if self._valido(nome):
+                with self._lock:
+                    self._hits[nome] += 1
+                return self._valores[nome]
+            with self._lock:
+                self._misses[nome] += 1
+            valor = carregar()
+            with self._lock:
+                self._valores[nome] = valor
+                self._expira[nome] = time.monotonic() + self.ttls[nome]
+            return valor
+
+    def em_cache(self, nome: str) -> Optional[Any]:
+        """Valor em cache, se ainda for válido (sem carregar nem contar como hit)."""
+        return self._valores.get(nome) if self._valido(nome) else None
+
+    def invalidar(self, nome: Optional[str] = None) -> List[str]:
+        """Invalida uma chave (ou todas). Devolve as chaves invalidadas."""
+        nomes = [nome] if nome else list(self.ttls)
+        with self._lock:
+            for n in nomes:
+                self._valores.pop(n, None)
+                self._expira.pop(n, None)
+                self._invalidacoes[n] += 1
+        return nomes
+
+    def stats(self) -> Dict[str, Any]:
+        agora = time.monotonic()
+        with self._lock:
+            return {
+                nome: {
+                    "ttl_s": self.ttls[nome],
+                    "em_cache": nome in self._valores,
+                    "expira_em_s": (
+                        round(self._expira[nome] - agora, 1) if nome in self._expira else None
+                    ),
+                    "hits": self._hits[nome],
+                    "misses": self._misses[nome],
+                    "invalidacoes": self._invalidacoes[nome],
+                }
+                for nome in self.ttls
+            }
+
+
+cache_referencia = CacheTTL({
+    "tipos": settings.cache_ttl_tipos,
+    "familias": settings.cache_ttl_familias,
+    "estados": settings.cache_ttl_estados,
+    "armazens": settings.cache_ttl_armazens,
+})
+
+
+def _ler_referencia(nome: str, cur=None) -> List[Dict[str, Any]]:
+    tabela = POR_CHAVE[nome]
+    sql = f"SELECT {', '.join(tabela.colunas)} FROM {tabela.origem} ORDER BY {tabela.pk}"
+    if cur is not None:
+        cur.execute(sql)
+        return [linha_para_dict(tabela.colunas, row) for row in cur.fetchall()]
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(sql)
+        rows = cur.fetchall()
+        cur.close()
+    return [linha_para_dict(tabela.colunas, row) for row in rows]
+
+
+def obter_referencia(nome: str, cur=None) -> List[Dict[str, Any]]:
+    """
+    Linhas de uma tabela de referência, ordenadas pela chave primária.
+    `cur` permite reutilizar a conexão de quem chama em vez de pedir outra ao pool.
+    """
+    return cache_referencia.obter(nome, lambda: _ler_referencia(nome, cur))
+
+
+def designacoes(nome: str, cur=None) -> Dict[int, Any]:
+    """Mapa ID -> Designacao de uma tabela de referência (tipos, familias, estados)."""
+    tabela = POR_CHAVE[nome]
+    return {row[tabela.pk]: row["Designacao"] for row in obter_referencia(nome, cur)}
+
+
+def _ao_alterar(alteradas: Dict[str, int], desde: int, ate: int):
+    for nome in alteradas:
+        if nome in cache_referencia.ttls:
+            cache_referencia.invalidar(nome)
+
+
+monitor.subscrever(_ao_alterar)
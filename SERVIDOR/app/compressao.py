@@ -0,0 +1,210 @@
+# SERVIDOR/app/compressao.py
+"""
+Compressão das respostas negociada pelo Accept-Encoding: zstd, br ou gzip.
+zstd e br só são usados se os pacotes `zstandard` / `brotli` estiverem instalados.
+Respostas em stream (NDJSON) são comprimidas bloco a bloco, com flush em cada um,
+para o cliente poder ir processando à medida que chegam.
+"""
+import time
+import zlib
+from typing import Dict, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .tracing import somar as somar_traco
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - opcional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - opcional
+    zstandard = None
+
+
+# Tipos de conteúdo que vale a pena comprimir (imagens e ficheiros já comprimidos ficam de fora)
+TIPOS_COMPRIMIVEIS = (
+    "application/json",
+    "application/x-ndjson",
+    "application/msgpack",
+    "application/x-msgpack",
+    "application/vnd.msgpack",
+    "text/",
+)
+
+# Blocos maiores do que isto são comprimidos numa thread, para não parar o event loop
+_BLOCO_EM_THREAD = 256 * 1024
+
+
+class _Gzip:
+    def __init__(self, nivel: int):
+        self._obj = zlib.compressobj(nivel, zlib.DEFLATED, 31)
+
+    def comprimir(self, dados: bytes, fim: bool) -> bytes:
+        modo = zlib.Z_FINISH if fim else zlib.Z_SYNC_FLUSH
+        return self._obj.compress(dados) + self._obj.flush(modo)
+
+
+class _Brotli:
+    def __init__(self, nivel: int):
+        self._obj = brotli.Compressor(quality=nivel)
+
+    def comprimir(self, dados: bytes, fim: bool) -> bytes:
+        saida = self._obj.process(dados)
+        return saida + (self._obj.finish() if fim else self._obj.flush())
+
+
+class _Zstd:
+    def __init__(self, nivel: int):
+        self._obj = zstandard.ZstdCompressor(level=nivel).compressobj()
+
+    def comprimir(self, dados: bytes, fim: bool) -> bytes:
+        saida = self._obj.compress(dados)
+        if fim:
+            return saida + self._obj.flush()
+        return saida + self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+
+def codecs_disponiveis() -> List[str]:
+    """Codecs por ordem de preferência do servidor."""
+    codecs = []
+    if zstandard is not None:
+        codecs.append("zstd")
+    if brotli is not None:
+        codecs.append("br")
+    codecs.append("gzip")
+    return codecs
+
+
+def escolher_codec(accept_encoding: str, disponiveis: List[str]) -> Optional[str]:
+    """
+    Escolhe o codec a partir do Accept-Encoding (com q-values).
+    Entre os aceites com o mesmo q, ganha a preferência do servidor.
+    """
+    aceites: Dict[str, float] = {}
+    for parte in accept_encoding.split(","):
+        nome, _, params = parte.strip().partition(";")
+        nome = nome.strip().lower()
+        if not nome:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        aceites[nome] = q
+
+    melhor, melhor_q = None, 0.0
+    for codec in disponiveis:
+        q = aceites.get(codec, aceites.get("*", 0.0))
+        if q > melhor_q:
+            melhor, melhor_q = codec, q
+    return melhor
+
+
+class CompressaoMiddleware:
+    def __init__(self, app: ASGIApp, minimo: int = 1024, niveis: Optional[Dict[str, int]] = None):
+        self.app = app
+        self.minimo = minimo
+        self.niveis = {"gzip": 6, "br": 4, "zstd": 3, **(niveis or {})}
+        self.disponiveis = codecs_disponiveis()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        codec = escolher_codec(Headers(scope=scope).get("accept-encoding", ""), self.disponiveis)
+        if codec is None:
+            await self.app(scope, receive, send)
+            return
+        await _Respondedor(self, codec, send).correr(scope, receive)
+
+    def compressor(self, codec: str):
+        nivel = self.niveis[codec]
+        if codec == "zstd":
+            return _Zstd(nivel)
+        if codec == "br":
+            return _Brotli(nivel)
+        return _Gzip(nivel)
+
+
+class _Respondedor:
+    """Estado de uma resposta: decide no primeiro bloco se comprime ou passa tal e qual."""
+
+    def __init__(self, middleware: CompressaoMiddleware, codec: str, send: Send):
+        self.middleware = middleware
+        self.codec = codec
+        self.send = send
+        self.inicio: Optional[Message] = None
+        self.comprimir: Optional[bool] = None
+        self.compressor = None
+
+    async def correr(self, scope: Scope, receive: Receive):
+        await self.middleware.app(scope, receive, self._enviar)
+
+    def _compressivel(self, headers: Headers) -> bool:
+        if self.inicio["status"] < 200 or self.inicio["status"] in (204, 206, 304):
+            return False
+        if "content-encoding" in headers or "content-range" in headers:
+            return False
+        tipo = headers.get("content-type", "")
+        return any(tipo.startswith(t) for t in TIPOS_COMPRIMIVEIS)
+
+    async def _bloco(self, dados: bytes, fim: bool) -> bytes:
+        inicio = time.perf_counter()
+        if len(dados) >= _BLOCO_EM_THREAD:
+            comprimido = await run_in_threadpool(self.compressor.comprimir, dados, fim)
+        else:
+            comprimido = self.compressor.comprimir(dados, fim)
+        somar_traco("comp", time.perf_counter() - inicio)
+        return comprimido
+
+    async def _enviar(self, message: Message):
+        tipo = message["type"]
+        if tipo == "http.response.start":
+            self.inicio = message
+            return
+        if tipo != "http.response.body":
+            await self.send(message)
+            return
+
+        corpo = message.get("body", b"")
+        mais = message.get("more_body", False)
+
+        if self.comprimir is None:
+            headers = MutableHeaders(raw=self.inicio["headers"])
+            self.comprimir = self._compressivel(headers) and (
+                mais or len(corpo) >= self.middleware.minimo
+            )
+            if not self.comprimir:
+                await self.send(self.inicio)
+                await self.send(message)
+                return
+            self.compressor = self.middleware.compressor(self.codec)
+            headers["Content-Encoding"] = self.codec
+            headers.add_vary_header("Accept-Encoding")
+            # Um ETag forte identifica os bytes; comprimidos já não são os mesmos
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                headers["ETag"] = "W/" + etag
+            comprimido = await self._bloco(corpo, not mais)
+            if mais:
+                del headers["Content-Length"]
+            else:
+                headers["Content-Length"] = str(len(comprimido))
+            self.inicio["headers"] = headers.raw
+            await self.send(self.inicio)
+            await self.send({"type": "http.response.body", "body": comprimido, "more_body": mais})
+            return
+
+        if not self.comprimir:
+            await self.send(message)
+            return
+        comprimido = await self._bloco(corpo, not mais)
+        await self.send({"type": "http.response.body", "body": comprimido, "more_body": mais})
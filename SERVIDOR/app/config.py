@@ -11,6 +11,100 @@ class Settings(BaseSettings):
     db_encrypt: str = Field(default="yes", alias="DB_ENCRYPT")
     db_port: Optional[str] = Field(default=None, alias="DB_PORT")
 
+    # Pool de conexões
+    db_pool_min: int = Field(default=2, alias="DB_POOL_MIN")
+    db_pool_max: int = Field(default=20, alias="DB_POOL_MAX")
+    db_pool_timeout: float = Field(default=10.0, alias="DB_POOL_TIMEOUT")
+    db_pool_max_lifetime: float = Field(default=1800.0, alias="DB_POOL_MAX_LIFETIME")
+    db_pool_max_idle: float = Field(default=300.0, alias="DB_POOL_MAX_IDLE")
+    db_pool_validar_apos: float = Field(default=30.0, alias="DB_POOL_VALIDAR_APOS")
+
+    # Executor de queries (limita o trabalho concorrente na BD)
+    db_executor_workers: Optional[int] = Field(default=None, alias="DB_EXECUTOR_WORKERS")
+    db_executor_max_fila: int = Field(default=64, alias="DB_EXECUTOR_MAX_FILA")
+    db_executor_timeout_fila: float = Field(default=5.0, alias="DB_EXECUTOR_TIMEOUT_FILA")
+    db_executor_retry_after: int = Field(default=2, alias="DB_EXECUTOR_RETRY_AFTER")
+
+    # Sincronização
+    sync_fetch_lote: int = Field(default=1000, alias="SYNC_FETCH_LOTE")
+    alteracoes_intervalo: float = Field(default=5.0, alias="ALTERACOES_INTERVALO")
+    sync_paralelo_workers: int = Field(default=4, alias="SYNC_PARALELO_WORKERS")
+
+    # Autenticação: tokens assinados com AUTH_SEGREDO (validade em segundos) e passwords com scrypt
+    auth_segredo: Optional[str] = Field(default=None, alias="AUTH_SEGREDO")
+    auth_token_validade: int = Field(default=12 * 3600, alias="AUTH_TOKEN_VALIDADE")
+    auth_cache_ttl: float = Field(default=60.0, alias="AUTH_CACHE_TTL")
+    auth_scrypt_n: int = Field(default=2 ** 14, alias="AUTH_SCRYPT_N")
+    auth_hash_workers: int = Field(default=2, alias="AUTH_HASH_WORKERS")
+    # Desligado enquanto o login offline da app comparar a password sincronizada em texto
+    auth_atualizar_hash: bool = Field(default=False, alias="AUTH_ATUALIZAR_HASH")
+
+    # Traço dos pedidos (X-Trace-Id, Server-Timing) e log de consultas lentas (0 desliga)
+    tracing_ativo: bool = Field(default=True, alias="TRACING_ATIVO")
+    server_timing_max_sql: int = Field(default=10, alias="SERVER_TIMING_MAX_SQL")
+    consulta_lenta_ms: float = Field(default=500.0, alias="CONSULTA_LENTA_MS")
+
+    # Paginação por cursor (limit/after)
+    paginacao_max_limit: int = Field(default=5000, alias="PAGINACAO_MAX_LIMIT")
+    paginacao_limit_omissao: int = Field(default=500, alias="PAGINACAO_LIMIT_OMISSAO")
+
+    # Índice de códigos em memória (/artigos/codigo/{codigo})
+    codigos_indice_max_idade: float = Field(default=600.0, alias="CODIGOS_INDICE_MAX_IDADE")
+    codigos_fallback_miss: bool = Field(default=True, alias="CODIGOS_FALLBACK_MISS")
+    codigos_batch_max: int = Field(default=5000, alias="CODIGOS_BATCH_MAX")
+
+    # Stock calculado a partir dos movimentos: sem monitor de alterações, é posto
+    # em dia no pedido se tiver mais do que isto (segundos)
+    stock_max_idade: float = Field(default=60.0, alias="STOCK_MAX_IDADE")
+
+    # Análise de movimentos (/analytics/movimentos/*)
+    analytics_ttl: float = Field(default=3600.0, alias="ANALYTICS_TTL")
+    analytics_prazo_reposicao: float = Field(default=7.0, alias="ANALYTICS_PRAZO_REPOSICAO")
+    analytics_dias_seguranca: float = Field(default=7.0, alias="ANALYTICS_DIAS_SEGURANCA")
+
+    # Upload de imagens: tamanho máximo e idade mínima (s) para recolher ficheiros sem uso
+    imagens_max_bytes: int = Field(default=20 * 1024 * 1024, alias="IMAGENS_MAX_BYTES")
+    imagens_orfas_idade: int = Field(default=3600, alias="IMAGENS_ORFAS_IDADE")
+
+    # Tamanhos derivados das imagens dos artigos (WebP)
+    miniaturas_workers: int = Field(default=2, alias="MINIATURAS_WORKERS")
+    miniaturas_qualidade: int = Field(default=80, alias="MINIATURAS_QUALIDADE")
+    miniaturas_preencher_arranque: bool = Field(default=True, alias="MINIATURAS_PREENCHER_ARRANQUE")
+
+    # Reconhecimento visual para o scanner AR (/ar/match)
+    ar_indice_path: str = Field(default="assets/reconhecimento/indice.npz", alias="AR_INDICE_PATH")
+    ar_descritores_imagem: int = Field(default=150, alias="AR_DESCRITORES_IMAGEM")
+    ar_descritores_consulta: int = Field(default=200, alias="AR_DESCRITORES_CONSULTA")
+    ar_lado: int = Field(default=480, alias="AR_LADO")
+    ar_distancia_maxima: int = Field(default=64, alias="AR_DISTANCIA_MAXIMA")
+    ar_racio: float = Field(default=0.8, alias="AR_RACIO")
+
+    # Cache das tabelas de referência (TTL em segundos)
+    cache_ttl_tipos: float = Field(default=3600.0, alias="CACHE_TTL_TIPOS")
+    cache_ttl_familias: float = Field(default=3600.0, alias="CACHE_TTL_FAMILIAS")
+    cache_ttl_estados: float = Field(default=3600.0, alias="CACHE_TTL_ESTADOS")
+    cache_ttl_armazens: float = Field(default=600.0, alias="CACHE_TTL_ARMAZENS")
+
+    # Compressão das respostas (zstd / br / gzip, conforme o Accept-Encoding)
+    compressao_ativa: bool = Field(default=True, alias="COMPRESSAO_ATIVA")
+    compressao_minimo: int = Field(default=1024, alias="COMPRESSAO_MINIMO")
+    compressao_nivel_gzip: int = Field(default=6, alias="COMPRESSAO_NIVEL_GZIP")
+    compressao_nivel_brotli: int = Field(default=4, alias="COMPRESSAO_NIVEL_BROTLI")
+    compressao_nivel_zstd: int = Field(default=3, alias="COMPRESSAO_NIVEL_ZSTD")
+
+    # Modo edge: réplica SQLite local para as leituras de artigos e sync (ver replica.py)
+    replica_ativa: bool = Field(default=False, alias="REPLICA_ATIVA")
+    replica_path: str = Field(default="assets/replica/armazem.sqlite", alias="REPLICA_PATH")
+    replica_intervalo: float = Field(default=300.0, alias="REPLICA_INTERVALO")
+    replica_atraso_max: float = Field(default=600.0, alias="REPLICA_ATRASO_MAX")
+
+    # Snapshot SQLite para o primeiro arranque da app (/sync/snapshot)
+    snapshot_ativo: bool = Field(default=True, alias="SNAPSHOT_ATIVO")
+    snapshot_dir: str = Field(default="assets/snapshots", alias="SNAPSHOT_DIR")
+    snapshot_intervalo: float = Field(default=3600.0, alias="SNAPSHOT_INTERVALO")
+    snapshot_intervalo_min: float = Field(default=300.0, alias="SNAPSHOT_INTERVALO_MIN")
+    snapshot_manter: int = Field(default=2, alias="SNAPSHOT_MANTER")
+
     app_env: str = Field(default="dev", alias="APP_ENV")
     app_host: str = Field(default="172.20.10.2", alias="APP_HOST")
     app_port: int = Field(default=8000, alias="APP_PORT")
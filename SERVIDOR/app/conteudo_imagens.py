@@ -0,0 +1,204 @@
+# SERVIDOR/app/conteudo_imagens.py
+"""
+Imagens guardadas com o nome do seu conteúdo (<sha256>.<ext>) e servidas com
+cache HTTP: ETag forte, Last-Modified, 304 e pedidos Range.
+
+Um nome por hash nunca muda de conteúdo, por isso /imagens/{nome} pode ser
+guardado pelos clientes para sempre (Cache-Control: immutable). Duas imagens
+iguais ficam no mesmo ficheiro.
+"""
+import hashlib
+import os
+import re
+import threading
+import uuid
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import BinaryIO, Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import FileResponse
+
+from .etag import corresponde
+
+NOME_HASH = re.compile(r"^[0-9a-f]{64}\.[a-z0-9]{1,5}$")
+
+CACHE_IMUTAVEL = "public, max-age=31536000, immutable"
+# O ficheiro de um artigo pode mudar: o cliente guarda, mas confirma sempre com o ETag
+CACHE_REVALIDAR = "no-cache"
+
+_EXTENSAO = re.compile(r"^[a-z0-9]{1,5}$")
+_BLOCO_UPLOAD = 1024 * 1024
+
+
+def extensao_segura(nome_ficheiro: Optional[str], omissao: str = "jpg") -> str:
+    """Extensão do nome enviado pelo cliente, só se for curta e alfanumérica."""
+    nome = nome_ficheiro or ""
+    extensao = nome.rsplit(".", 1)[-1].lower() if "." in nome else ""
+    return extensao if _EXTENSAO.match(extensao) else omissao
+
+
+def nome_por_conteudo(conteudo: bytes, extensao: str) -> str:
+    return f"{hashlib.sha256(conteudo).hexdigest()}.{extensao}"
+
+
+def _fsync_pasta(pasta: Path):
+    """Torna o rename durável (POSIX); no Windows não se abre uma pasta, e não é preciso."""
+    try:
+        fd = os.open(pasta, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _temporario(pasta: Path) -> Path:
+    return pasta / f".upload-{uuid.uuid4().hex}.tmp"
+
+
+def instalar(temporario: Path, destino: Path) -> Path:
+    """
+    Põe um temporário já gravado (e com fsync) no nome final, de uma vez. Se o
+    destino já existir é a mesma imagem (o nome é o hash): o temporário é descartado.
+    """
+    if destino.is_file():
+        temporario.unlink(missing_ok=True)
+        return destino
+    os.replace(temporario, destino)
+    _fsync_pasta(destino.parent)
+    return destino
+
+
+def receber_por_conteudo(
+    pasta: Path, origem: BinaryIO, extensao: str, maximo: int
+) -> Tuple[Path, str]:
+    """
+    Copia `origem` para um temporário em `pasta`, em blocos, a calcular o sha256.
+    Devolve (temporário, nome final <sha256>.<ext>); quem chama instala-o com instalar().
+
+    Raises:
+        HTTPException 413: se passar de `maximo` bytes (o temporário é apagado)
+    """
+    temporario = _temporario(pasta)
+    resumo = hashlib.sha256()
+    total = 0
+    try:
+        with open(temporario, "wb") as f:
+            for bloco in iter(lambda: origem.read(_BLOCO_UPLOAD), b""):
+                total += len(bloco)
+                if total > maximo:
+                    raise HTTPException(
+                        status_code=413, detail=f"Imagem maior do que o máximo ({maximo} bytes)"
+                    )
+                resumo.update(bloco)
+                f.write(bloco)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        temporario.unlink(missing_ok=True)
+        raise
+    return temporario, f"{resumo.hexdigest()}.{extensao}"
+
+
+def guardar_por_conteudo(pasta: Path, conteudo: bytes, extensao: str) -> Path:
+    """
+    Grava `conteudo` em `pasta`/<sha256>.<ext>. Se já existir (mesma imagem), não
+    volta a escrever. A escrita é feita num temporário e trocada de uma vez.
+    """
+    destino = pasta / nome_por_conteudo(conteudo, extensao)
+    if destino.is_file():
+        return destino
+    temporario = _temporario(pasta)
+    try:
+        with open(temporario, "wb") as f:
+            f.write(conteudo)
+            f.flush()
+            os.fsync(f.fileno())
+        return instalar(temporario, destino)
+    finally:
+        temporario.unlink(missing_ok=True)
+
+
+class _HashesFicheiros:
+    """
+    sha256 de ficheiros com nome antigo (não por hash), guardado por
+    (caminho, mtime, tamanho).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hashes: Dict[str, Tuple[int, int, str]] = {}
+
+    def obter(self, caminho: Path, stat: os.stat_result) -> str:
+        chave = str(caminho)
+        with self._lock:
+            guardado = self._hashes.get(chave)
+        if guardado and guardado[:2] == (stat.st_mtime_ns, stat.st_size):
+            return guardado[2]
+        resumo = hashlib.sha256()
+        with open(caminho, "rb") as f:
+            for bloco in iter(lambda: f.read(1024 * 1024), b""):
+                resumo.update(bloco)
+        valor = resumo.hexdigest()
+        with self._lock:
+            self._hashes[chave] = (stat.st_mtime_ns, stat.st_size, valor)
+        return valor
+
+
+_hashes = _HashesFicheiros()
+
+
+def hash_do_ficheiro(caminho: Path, stat: Optional[os.stat_result] = None) -> str:
+    """sha256 do conteúdo: vem do nome se for um nome por hash; senão é calculado (e guardado)."""
+    if NOME_HASH.match(caminho.name):
+        return caminho.name.split(".", 1)[0]
+    return _hashes.obter(caminho, stat or os.stat(caminho))
+
+
+class RespostaImagem(FileResponse):
+    """FileResponse que aceita If-Range com o ETag definido por quem a cria."""
+
+    def _should_use_range(self, http_if_range: str, stat_result: os.stat_result) -> bool:
+        if http_if_range == self.headers.get("etag"):
+            return True
+        return super()._should_use_range(http_if_range, stat_result)
+
+
+def _nao_modificado(request: Request, etag: str, stat: os.stat_result) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # Com If-None-Match, o If-Modified-Since é ignorado (RFC 9110)
+        return corresponde(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(stat.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def resposta_imagem(
+    request: Request,
+    caminho: Path,
+    etag: str,
+    cache_control: str,
+    media_type: Optional[str] = None,
+    headers: Optional[Dict[str, str]] = None,
+    stat: Optional[os.stat_result] = None,
+) -> Response:
+    """Resposta com ETag, Last-Modified e Cache-Control: 304 se o cliente já tiver esta versão."""
+    stat = stat or os.stat(caminho)
+    cabecalhos = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Cache-Control": cache_control,
+        **(headers or {}),
+    }
+    if request.method in ("GET", "HEAD") and _nao_modificado(request, etag, stat):
+        return Response(status_code=304, headers=cabecalhos)
+    return RespostaImagem(caminho, media_type=media_type, headers=cabecalhos, stat_result=stat)
@@ -1,33 +1,44 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
 import pyodbc
 from .config import settings
+from .metricas import bd_conexao, bd_execute, bd_fetch, bd_linhas
+from .tracing import Consulta, somar as somar_traco, terminar_consulta
+
+logger = logging.getLogger(__name__)
+
+
+class PoolEsgotadoError(pyodbc.Error):
+    """Não foi possível obter uma conexão do pool dentro do tempo limite."""
+
 
 def _build_server() -> str:
     """
-    String de servidor adequada para a conexão: 
+    String de servidor adequada para a conexão:
     Se o servidor tiver uma instância nomeada (ex: localhost\SQLEXP_RSANTOS) e não houver uma porta TCP definida, é preciso usar Named Pipes senão usar TCP/IP.
     """
     port = (settings.db_port or "").strip()
     srv = settings.db_server
-    
+
     if "\\" in srv and not port:
         inst = srv.split("\\", 1)[1]
         # Formato name pipes
         return fr"np:\\.\pipe\MSSQL${inst}\sql\query"
-    
+
     return f"{srv},{port}" if port else srv
 
-def get_connection() -> pyodbc.Connection:
+
+def _connect() -> pyodbc.Connection:
     """
-    Cria uma conexão ao SQL Server usando SQL Server Native Client 11.0.
-    
-    Returns:
-        pyodbc.Connection: Objeto de conexão ativa
-        
-    Raises:
-        pyodbc.Error: Se houver erro na conexão
+    Abre uma conexão nova ao SQL Server usando SQL Server Native Client 11.0.
+    Só deve ser chamada pelo pool; o resto da aplicação usa get_connection().
     """
     server = _build_server()
-    
+
     # Usa SQL Server Native Client 11.0
     conn_str = (
         "DRIVER={SQL Server Native Client 11.0};"
@@ -41,6 +52,496 @@ def get_connection() -> pyodbc.Connection:
     )
     return pyodbc.connect(conn_str)
 
+
+class CursorMedido:
+    """
+    Cursor que mede cada consulta: tempo de execute e de fetch e linhas lidas.
+    Com o nome da consulta, vai para as métricas; vai sempre para o traço do
+    pedido (Server-Timing) e, se for lenta, para o log de consultas lentas.
+    O resto passa para o cursor pyodbc.
+    """
+
+    def __init__(self, raw, consulta: Optional[str] = None):
+        self.__dict__["_raw"] = raw
+        self.__dict__["_consulta"] = consulta
+        self.__dict__["_atual"] = None
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._raw, name, value)
+
+    def _terminar(self):
+        atual = self._atual
+        if atual is not None:
+            self.__dict__["_atual"] = None
+            terminar_consulta(atual)
+
+    def _executar(self, metodo, sql, parametros, *args):
+        self._terminar()
+        atual = self.__dict__["_atual"] = Consulta(self._consulta, sql, parametros)
+        inicio = time.perf_counter()
+        try:
+            metodo(sql, *args)
+        finally:
+            atual.execute = time.perf_counter() - inicio
+            if self._consulta:
+                bd_execute.observar(atual.execute, self._consulta)
+        return self
+
+    def execute(self, sql, *params):
+        parametros = params
+        if len(params) == 1 and isinstance(params[0], (list, tuple)):
+            parametros = params[0]
+        return self._executar(self._raw.execute, sql, parametros, *params)
+
+    def executemany(self, sql, seq_params):
+        return self._executar(self._raw.executemany, sql, seq_params, seq_params)
+
+    def _ler(self, metodo, *args):
+        inicio = time.perf_counter()
+        try:
+            resultado = metodo(*args)
+        finally:
+            duracao = time.perf_counter() - inicio
+            if self._consulta:
+                bd_fetch.observar(duracao, self._consulta)
+        linhas = len(resultado) if isinstance(resultado, list) else int(resultado is not None)
+        if self._consulta:
+            bd_linhas.inc(self._consulta, n=linhas)
+        atual = self._atual
+        if atual is not None:
+            atual.fetch += duracao
+            atual.linhas += linhas
+        return resultado
+
+    def fetchone(self):
+        return self._ler(self._raw.fetchone)
+
+    def fetchall(self):
+        return self._ler(self._raw.fetchall)
+
+    def fetchmany(self, *args):
+        return self._ler(self._raw.fetchmany, *args)
+
+    def __iter__(self):
+        while True:
+            linhas = self.fetchmany(settings.sync_fetch_lote)
+            if not linhas:
+                return
+            yield from linhas
+
+    def close(self):
+        self._terminar()
+        self._raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def __del__(self):
+        # Cursores que não foram fechados: a última consulta conta na mesma
+        try:
+            self._terminar()
+        except Exception:
+            pass
+
+
+class ConexaoPool:
+    """
+    Conexão emprestada pelo pool.
+    Comporta-se como uma pyodbc.Connection, mas close() devolve-a ao pool em vez de a fechar.
+    Usada com `with`, faz commit (ou rollback se houver exceção) e devolve sempre a conexão.
+    Os cursores são CursorMedido; com o nome de uma consulta (get_connection("...")),
+    vão também para as métricas.
+    """
+
+    def __init__(self, pool: "PoolConexoes", raw, criada_em: float):
+        self._pool = pool
+        self._raw = raw
+        self._criada_em = criada_em
+        self.consulta: Optional[str] = None
+
+    def __getattr__(self, name):
+        raw = self.__dict__.get("_raw")
+        if raw is None:
+            raise pyodbc.Error("Conexão já foi devolvida ao pool")
+        return getattr(raw, name)
+
+    def cursor(self):
+        return CursorMedido(self.__getattr__("cursor")(), self.consulta)
+
+    def close(self):
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            self._pool._devolver(raw, self._criada_em)
+
+    def descartar(self):
+        """Fecha a conexão real e retira-a do pool (ex: depois de um erro de rede)."""
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            self._pool._descartar(raw)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        raw = self._raw
+        if raw is None:
+            return False
+        try:
+            if exc_type is None:
+                raw.commit()
+            else:
+                raw.rollback()
+        except pyodbc.Error:
+            self.descartar()
+            return False
+        self.close()
+        return False
+
+    def __del__(self):
+        # Rede de segurança: uma conexão esquecida volta ao pool quando é recolhida
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class PoolConexoes:
+    """
+    Pool de conexões thread-safe com tamanho mínimo/máximo, validação no checkout,
+    tempo de vida máximo e remoção de conexões paradas.
+    """
+
+    def __init__(
+        self,
+        fabrica: Callable[[], object],
+        minimo: int = 2,
+        maximo: int = 20,
+        timeout: float = 10.0,
+        max_lifetime: float = 1800.0,
+        max_idle: float = 300.0,
+        validar_apos: float = 30.0,
+    ):
+        if maximo < 1 or minimo < 0 or minimo > maximo:
+            raise ValueError("Tamanhos do pool inválidos")
+        self._fabrica = fabrica
+        self.minimo = minimo
+        self.maximo = maximo
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.validar_apos = validar_apos
+
+        # Conexões livres: (raw, criada_em, ultimo_uso). LIFO para deixar as restantes envelhecer.
+        self._livres: deque = deque()
+        self._total = 0
+        self._cond = threading.Condition(threading.RLock())
+        self._fechado = False
+        self._manutencao: Optional[threading.Thread] = None
+
+        # Estatísticas
+        self._a_espera = 0
+        self._checkouts = 0
+        self._esperas = 0
+        self._tempo_espera_total = 0.0
+        self._tempo_espera_max = 0.0
+        self._timeouts = 0
+        self._criadas = 0
+        self._descartadas = 0
+        self._falhas_validacao = 0
+
+    # ------------------------------------------------------------------ checkout
+
+    def obter(self, timeout: Optional[float] = None) -> ConexaoPool:
+        """
+        Empresta uma conexão. Espera até `timeout` segundos se o pool estiver cheio.
+
+        Raises:
+            PoolEsgotadoError: se nenhuma conexão ficar livre a tempo
+            pyodbc.Error: se não for possível abrir uma conexão nova
+        """
+        timeout = self.timeout if timeout is None else timeout
+        inicio = time.monotonic()
+        limite = inicio + timeout
+        esperou = False
+
+        while True:
+            candidata = None
+            criar = False
+            with self._cond:
+                if self._fechado:
+                    raise pyodbc.Error("Pool de conexões fechado")
+                if self._livres:
+                    candidata = self._livres.pop()
+                elif self._total < self.maximo:
+                    self._total += 1
+                    criar = True
+                else:
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        self._timeouts += 1
+                        raise PoolEsgotadoError(
+                            f"Sem conexões livres após {timeout:.1f}s ({self.maximo} em uso)"
+                        )
+                    esperou = True
+                    self._a_espera += 1
+                    try:
+                        self._cond.wait(restante)
+                    finally:
+                        self._a_espera -= 1
+                    continue
+
+            if criar:
+                try:
+                    raw = self._fabrica()
+                except BaseException:
+                    with self._cond:
+                        self._total -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._criadas += 1
+                self._registar_checkout(inicio, esperou)
+                return ConexaoPool(self, raw, time.monotonic())
+
+            raw, criada_em, ultimo_uso = candidata
+            agora = time.monotonic()
+            if self._expirada(criada_em, ultimo_uso, agora):
+                self._descartar(raw)
+                continue
+            if self.validar_apos >= 0 and agora - ultimo_uso >= self.validar_apos:
+                if not self._validar(raw):
+                    with self._cond:
+                        self._falhas_validacao += 1
+                    self._descartar(raw)
+                    continue
+            self._registar_checkout(inicio, esperou)
+            return ConexaoPool(self, raw, criada_em)
+
+    def _registar_checkout(self, inicio: float, esperou: bool):
+        espera = time.monotonic() - inicio
+        with self._cond:
+            self._checkouts += 1
+            if esperou:
+                self._esperas += 1
+                self._tempo_espera_total += espera
+                self._tempo_espera_max = max(self._tempo_espera_max, espera)
+
+    def _expirada(self, criada_em: float, ultimo_uso: float, agora: float) -> bool:
+        if self.max_lifetime > 0 and agora - criada_em >= self.max_lifetime:
+            return True
+        return self.max_idle > 0 and agora - ultimo_uso >= self.max_idle
+
+    @staticmethod
+    def _validar(raw) -> bool:
+        try:
+            cur = raw.cursor()
+            try:
+                cur.execute("SELECT 1")
+                cur.fetchone()
+            finally:
+                cur.close()
+            return True
+        except Exception:
+            return False
+
+    # ------------------------------------------------------------------ checkin
+
+    def _devolver(self, raw, criada_em: float):
+        try:
+            # Termina qualquer transação deixada aberta pelo handler
+            raw.rollback()
+        except Exception:
+            self._descartar(raw)
+            return
+        agora = time.monotonic()
+        with self._cond:
+            velha = self.max_lifetime > 0 and agora - criada_em >= self.max_lifetime
+            if not self._fechado and not velha:
+                self._livres.append((raw, criada_em, agora))
+                self._cond.notify()
+                return
+        self._descartar(raw)
+
+    def _descartar(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._total -= 1
+            self._descartadas += 1
+            self._cond.notify()
+
+    # ------------------------------------------------------------------ manutenção
+
+    def aquecer(self):
+        """Abre conexões até ao tamanho mínimo."""
+        while True:
+            with self._cond:
+                if self._fechado or self._total >= self.minimo:
+                    return
+                self._total += 1
+            try:
+                raw = self._fabrica()
+            except BaseException:
+                with self._cond:
+                    self._total -= 1
+                raise
+            with self._cond:
+                self._criadas += 1
+                self._livres.appendleft((raw, time.monotonic(), time.monotonic()))
+                self._cond.notify()
+
+    def manutencao(self):
+        """
+        Remove conexões paradas ou velhas (mantendo o mínimo) e repõe o tamanho mínimo.
+        """
+        agora = time.monotonic()
+        remover = []
+        with self._cond:
+            manter = deque()
+            # As mais antigas estão à esquerda
+            while self._livres:
+                item = self._livres.popleft()
+                raw, criada_em, ultimo_uso = item
+                velha = self.max_lifetime > 0 and agora - criada_em >= self.max_lifetime
+                parada = self.max_idle > 0 and agora - ultimo_uso >= self.max_idle
+                if velha or (parada and self._total - len(remover) > self.minimo):
+                    remover.append(raw)
+                else:
+                    manter.append(item)
+            self._livres = manter
+        for raw in remover:
+            self._descartar(raw)
+        try:
+            self.aquecer()
+        except Exception as e:
+            logger.warning("Não foi possível repor o mínimo do pool: %s", e)
+
+    def iniciar_manutencao(self, intervalo: float = 30.0):
+        """Arranca a thread de manutenção periódica (daemon)."""
+        with self._cond:
+            if self._manutencao is not None:
+                return
+
+            def _loop():
+                while True:
+                    with self._cond:
+                        if self._fechado:
+                            return
+                    time.sleep(intervalo)
+                    self.manutencao()
+
+            self._manutencao = threading.Thread(
+                target=_loop, name="db-pool-manutencao", daemon=True
+            )
+            self._manutencao.start()
+
+    def fechar(self):
+        """Fecha todas as conexões livres; as emprestadas são fechadas quando voltarem."""
+        with self._cond:
+            self._fechado = True
+            livres, self._livres = list(self._livres), deque()
+            self._cond.notify_all()
+        for raw, _, _ in livres:
+            self._descartar(raw)
+
+    def stats(self) -> dict:
+        with self._cond:
+            livres = len(self._livres)
+            return {
+                "min": self.minimo,
+                "max": self.maximo,
+                "total": self._total,
+                "livres": livres,
+                "em_uso": self._total - livres,
+                "a_espera": self._a_espera,
+                "checkouts": self._checkouts,
+                "esperas": self._esperas,
+                "tempo_espera_total_ms": round(self._tempo_espera_total * 1000, 2),
+                "tempo_espera_max_ms": round(self._tempo_espera_max * 1000, 2),
+                "tempo_espera_medio_ms": round(
+                    self._tempo_espera_total * 1000 / self._esperas, 2
+                ) if self._esperas else 0.0,
+                "timeouts": self._timeouts,
+                "criadas": self._criadas,
+                "descartadas": self._descartadas,
+                "falhas_validacao": self._falhas_validacao,
+            }
+
+
+_pool: Optional[PoolConexoes] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> PoolConexoes:
+    """Devolve o pool global, criando-o na primeira utilização."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PoolConexoes(
+                    _connect,
+                    minimo=settings.db_pool_min,
+                    maximo=settings.db_pool_max,
+                    timeout=settings.db_pool_timeout,
+                    max_lifetime=settings.db_pool_max_lifetime,
+                    max_idle=settings.db_pool_max_idle,
+                    validar_apos=settings.db_pool_validar_apos,
+                )
+                _pool.iniciar_manutencao()
+    return _pool
+
+
+def get_connection(consulta: Optional[str] = None) -> ConexaoPool:
+    """
+    Empresta uma conexão do pool ao SQL Server.
+    Usar de preferência com `with get_connection() as conn:` para garantir a devolução.
+    Com `consulta` (ex: "artigos.por_id"), o tempo de obter a conexão e o execute/fetch
+    dos cursores ficam nas métricas com esse nome (ver metricas.py) e no Server-Timing
+    e no log de consultas lentas (ver tracing.py).
+
+    Returns:
+        ConexaoPool: Conexão ativa (close() devolve-a ao pool)
+
+    Raises:
+        pyodbc.Error: Se houver erro na conexão ou o pool estiver esgotado
+    """
+    inicio = time.perf_counter()
+    try:
+        conn = get_pool().obter()
+    finally:
+        espera = time.perf_counter() - inicio
+        somar_traco("pool", espera)
+        if consulta is not None:
+            bd_conexao.observar(espera, consulta)
+    conn.consulta = consulta
+    return conn
+
+
+def pool_stats() -> dict:
+    """Estatísticas do pool (em uso, à espera, tempos de espera)."""
+    if _pool is None:
+        return {"ativo": False}
+    return {"ativo": True, **_pool.stats()}
+
+
+def fechar_pool():
+    """Fecha o pool global (usado no shutdown da aplicação)."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.fechar()
+
+
 def ping_db() -> bool:
     """
     Testa a conexão à base de dados executando um SELECT 1.
@@ -52,4 +553,3 @@ def ping_db() -> bool:
         cur.execute("SELECT 1")
         cur.fetchone()
     return True
-
@@ -0,0 +1,67 @@
+# SERVIDOR/app/etag.py
+"""
+ETags a partir das versões de change tracking de cada tabela (ver MonitorAlteracoes).
+Se nenhuma tabela de que a resposta depende mudou, o pedido com If-None-Match
+recebe 304 sem se correr a consulta nem serializar nada.
+"""
+import hashlib
+from typing import Iterable, Optional
+
+from fastapi import HTTPException, Request, Response
+
+from .alteracoes import monitor
+
+
+def etag_tabelas(chaves: Iterable[str], variante: str = "", fraco: bool = False) -> Optional[str]:
+    """
+    ETag para uma resposta que depende das tabelas `chaves`. `variante` distingue
+    respostas diferentes com os mesmos dados (query string, formato).
+    Devolve None se o monitor não estiver saudável: sem versões fiáveis não há ETag.
+    """
+    if not monitor.saudavel():
+        return None
+    partes = []
+    for chave in chaves:
+        versao = monitor.versao_tabela(chave)
+        if versao is None:
+            return None
+        partes.append(f"{chave}={versao}")
+    partes.append(variante)
+    resumo = hashlib.sha1("|".join(partes).encode("utf-8")).hexdigest()[:20]
+    return f'W/"{resumo}"' if fraco else f'"{resumo}"'
+
+
+def corresponde(if_none_match: Optional[str], etag: str) -> bool:
+    """Comparação fraca do If-None-Match (RFC 9110): ignora o prefixo W/."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    alvo = etag[2:] if etag.startswith("W/") else etag
+    for candidato in if_none_match.split(","):
+        candidato = candidato.strip()
+        if candidato.startswith("W/"):
+            candidato = candidato[2:]
+        if candidato == alvo:
+            return True
+    return False
+
+
+def condicional(*chaves: str, fraco: bool = False):
+    """
+    Dependency para rotas GET: põe o ETag na resposta e responde 304 se o cliente
+    já tiver essa versão. Uso: @router.get(..., dependencies=[Depends(condicional("tipos"))]).
+    O Accept entra na variante porque /sync pode responder em JSON ou NDJSON.
+    """
+    async def verificar(request: Request, response: Response) -> Optional[str]:
+        variante = f"{request.url.path}?{request.url.query}|{request.headers.get('accept', '')}"
+        etag = etag_tabelas(chaves, variante, fraco)
+        if etag is None:
+            return None
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if corresponde(request.headers.get("if-none-match"), etag):
+            raise HTTPException(status_code=304, headers=headers)
+        response.headers.update(headers)
+        return etag
+
+    return verificar
@@ -0,0 +1,210 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Iterator, Optional
+
+from fastapi import HTTPException
+
+from .config import settings
+
+
+class ExecutorSaturadoError(HTTPException):
+    """A BD está no limite: o pedido é recusado com 503 e Retry-After."""
+
+    def __init__(self, retry_after: int, detail: str = "Servidor ocupado, tente novamente"):
+        super().__init__(
+            status_code=503,
+            detail=detail,
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+class ExecutorBD:
+    """
+    Executor dedicado ao trabalho bloqueante na BD (pyodbc).
+    Tem um número fixo de workers e uma fila limitada: quando está cheia,
+    os pedidos novos são recusados logo em vez de se acumularem. Um pedido só
+    deixa de contar para o limite quando o worker acaba (ou quando sai da fila
+    sem ter começado), mesmo que o cliente já tenha desistido.
+    """
+
+    def __init__(self, workers: int, max_fila: int, timeout_fila: float, retry_after: int):
+        if workers < 1 or max_fila < 0:
+            raise ValueError("Tamanhos do executor inválidos")
+        self.workers = workers
+        self.max_fila = max_fila
+        self.timeout_fila = timeout_fila
+        self.retry_after = retry_after
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db")
+        self._lock = threading.Lock()
+        self._pendentes = 0
+        self._em_execucao = 0
+        self._concluidas = 0
+        self._rejeitadas = 0
+        self._expiradas = 0
+
+    def _correr(self, ctx: contextvars.Context, fn: Callable, args, kwargs):
+        with self._lock:
+            self._em_execucao += 1
+        try:
+            return ctx.run(fn, *args, **kwargs)
+        finally:
+            with self._lock:
+                self._em_execucao -= 1
+                self._concluidas += 1
+
+    def _libertar(self, _futuro: Optional[Future] = None):
+        with self._lock:
+            self._pendentes -= 1
+
+    async def executar(self, fn: Callable, *args, **kwargs):
+        """
+        Corre `fn` num worker da BD e devolve o resultado. Se o pedido ficar mais de
+        timeout_fila segundos na fila sem um worker lhe pegar, sai da fila e a
+        resposta é logo 503.
+
+        Raises:
+            ExecutorSaturadoError: se a fila estiver cheia ou o pedido expirar na fila
+        """
+        with self._lock:
+            if self._pendentes >= self.workers + self.max_fila:
+                self._rejeitadas += 1
+                raise ExecutorSaturadoError(self.retry_after)
+            self._pendentes += 1
+        try:
+            futuro = self._executor.submit(
+                self._correr, contextvars.copy_context(), fn, args, kwargs
+            )
+        except BaseException:
+            self._libertar()
+            raise
+        futuro.add_done_callback(self._libertar)
+        espera = asyncio.wrap_future(futuro)
+        if self.timeout_fila > 0:
+            try:
+                await asyncio.wait([espera], timeout=self.timeout_fila)
+            except asyncio.CancelledError:
+                # Cliente desligou: se ainda não começou, não chega a correr
+                futuro.cancel()
+                raise
+            # cancel() só tira o pedido da fila se nenhum worker lhe tiver pegado
+            if not espera.done() and futuro.cancel():
+                with self._lock:
+                    self._expiradas += 1
+                raise ExecutorSaturadoError(
+                    self.retry_after, "Tempo de espera na fila da BD excedido"
+                )
+        # Cancelar esta espera cancela o pedido na fila; a correr, vai até ao fim
+        return await espera
+
+    async def iterar(self, gerador: Iterator) -> AsyncIterator:
+        """
+        Prepara o consumo de um gerador síncrono (ex: leitura em lotes com fetchmany)
+        nos workers da BD. A admissão e o primeiro item são obtidos já aqui, para que
+        um 503 ou um erro de conexão aconteçam antes de a resposta começar a ser enviada.
+        O stream ocupa um lugar no executor até terminar, porque mantém uma conexão aberta.
+        """
+        with self._lock:
+            if self._pendentes >= self.workers + self.max_fila:
+                self._rejeitadas += 1
+                raise ExecutorSaturadoError(self.retry_after)
+            self._pendentes += 1
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        fim = object()
+        try:
+            primeiro = await loop.run_in_executor(self._executor, ctx.run, next, gerador, fim)
+        except BaseException:
+            await self._terminar_stream(loop, gerador)
+            raise
+        return self._continuar_stream(loop, ctx, gerador, primeiro, fim)
+
+    async def _continuar_stream(self, loop, ctx, gerador, item, fim):
+        try:
+            while item is not fim:
+                yield item
+                item = await loop.run_in_executor(self._executor, ctx.run, next, gerador, fim)
+        finally:
+            await self._terminar_stream(loop, gerador)
+
+    async def _terminar_stream(self, loop, gerador):
+        try:
+            # Fecha o gerador no worker para devolver a conexão ao pool
+            await loop.run_in_executor(self._executor, gerador.close)
+        except Exception:
+            gerador.close()
+        finally:
+            with self._lock:
+                self._pendentes -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_fila": self.max_fila,
+                "em_execucao": self._em_execucao,
+                "em_fila": max(self._pendentes - self._em_execucao, 0),
+                "concluidas": self._concluidas,
+                "rejeitadas": self._rejeitadas,
+                "expiradas": self._expiradas,
+            }
+
+    def fechar(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_executor: Optional[ExecutorBD] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ExecutorBD:
+    """Devolve o executor global, criando-o na primeira utilização."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ExecutorBD(
+                    workers=settings.db_executor_workers or settings.db_pool_max,
+                    max_fila=settings.db_executor_max_fila,
+                    timeout_fila=settings.db_executor_timeout_fila,
+                    retry_after=settings.db_executor_retry_after,
+                )
+    return _executor
+
+
+async def run_db(fn: Callable, *args, **kwargs):
+    """Executa trabalho de BD no executor dedicado."""
+    return await get_executor().executar(fn, *args, **kwargs)
+
+
+async def stream_db(gerador: Iterator) -> AsyncIterator:
+    """Async iterator que consome um gerador de BD no executor dedicado (para StreamingResponse)."""
+    return await get_executor().iterar(gerador)
+
+
+def em_executor(fn: Callable) -> Callable:
+    """
+    Transforma um handler síncrono num handler async que corre no executor da BD.
+    A assinatura é preservada, por isso o FastAPI continua a ver os mesmos parâmetros.
+    """
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await run_db(fn, *args, **kwargs)
+
+    return wrapper
+
+
+def executor_stats() -> dict:
+    if _executor is None:
+        return {"ativo": False}
+    return {"ativo": True, **_executor.stats()}
+
+
+def fechar_executor():
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.fechar()
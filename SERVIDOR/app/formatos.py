@@ -0,0 +1,151 @@
+# SERVIDOR/app/formatos.py
+"""
+Formatos compactos de sincronização (opt-in), em vez de um objeto JSON por linha:
+
+    ?formato=colunas   {"colunas": [...], "tipos": [...], "valores": [[coluna 1], [coluna 2], ...]}
+    ?formato=linhas    {"colunas": [...], "tipos": [...], "linhas": [[linha 1], [linha 2], ...]}
+    ?formato=msgpack   o mesmo que colunas, em MessagePack
+
+Com Accept: application/msgpack, colunas e linhas saem em MessagePack.
+Os valores são convertidos para os tipos das colunas na BD offline (BD_OFFLINE/TABELAS.sql),
+com as mesmas regras de afinidade do SQLite: um valor que não é número numa coluna
+INTEGER ou REAL fica como texto.
+"""
+import sqlite3
+from datetime import date, datetime, time
+from decimal import Decimal
+from functools import lru_cache
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import msgpack
+from fastapi import HTTPException, Request, Response
+
+from .metricas import serializacao
+from .serializacao import json_rapido
+from .tracing import somar as somar_traco
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+LAYOUTS = ("colunas", "linhas")
+
+SCHEMA_OFFLINE = Path(__file__).resolve().parent.parent / "BD_OFFLINE" / "TABELAS.sql"
+
+
+@lru_cache(maxsize=1)
+def tipos_offline() -> Dict[str, Dict[str, str]]:
+    """{TABELA: {coluna: INTEGER | REAL | TEXT}}, lido do script da BD offline."""
+    conn = sqlite3.connect(":memory:")
+    try:
+        conn.executescript(SCHEMA_OFFLINE.read_text(encoding="utf-8-sig"))
+        tabelas = [
+            r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        ]
+        return {
+            tabela.upper(): {
+                r[1]: r[2].upper() for r in conn.execute(f"PRAGMA table_info({tabela})")
+            }
+            for tabela in tabelas
+        }
+    finally:
+        conn.close()
+
+
+def _texto(v: Any) -> Any:
+    if v is None or isinstance(v, str):
+        return v
+    if isinstance(v, (datetime, date, time)):
+        return v.isoformat()
+    if isinstance(v, bytes):
+        return v.hex()
+    return str(v)
+
+
+def _numero(v: Any, inteiro: bool) -> Any:
+    if v is None:
+        return None
+    if isinstance(v, (bool, int)):
+        return int(v) if inteiro else float(v)
+    if isinstance(v, (Decimal, float)):
+        if inteiro and v == int(v):
+            return int(v)
+        return float(v)
+    if isinstance(v, str):
+        try:
+            return _numero(Decimal(v.strip()), inteiro)
+        except Exception:
+            return v
+    return _texto(v)
+
+
+def _conversor(tipo: Optional[str]) -> Callable[[Any], Any]:
+    if tipo == "INTEGER":
+        return lambda v: _numero(v, True)
+    if tipo == "REAL":
+        return lambda v: _numero(v, False)
+    if tipo == "TEXT":
+        return _texto
+    return _sem_tipo
+
+
+def _sem_tipo(v: Any) -> Any:
+    """Coluna que não existe na BD offline: só se tratam Decimal, datas e binários."""
+    if isinstance(v, Decimal):
+        return float(v)
+    if isinstance(v, (datetime, date, time, bytes)):
+        return _texto(v)
+    return v
+
+
+def escolher_formato(request: Request, formato: Optional[str]) -> Optional[Tuple[str, bool]]:
+    """
+    (layout, msgpack) pedido pelo cliente, ou None para o formato normal (um objeto por linha).
+
+    Raises:
+        HTTPException 400: se `formato` não for conhecido
+    """
+    msgpack_aceite = any(t in request.headers.get("accept", "") for t in MSGPACK_MEDIA_TYPES)
+    if formato is None or formato.lower() in ("", "objetos", "json"):
+        return ("colunas", True) if msgpack_aceite else None
+    formato = formato.lower()
+    if formato == "msgpack":
+        return "colunas", True
+    if formato in LAYOUTS:
+        return formato, msgpack_aceite
+    raise HTTPException(status_code=400, detail=f"Formato desconhecido: {formato}")
+
+
+def converter_linhas(
+    offline: str, colunas: Sequence[str], rows
+) -> Tuple[List[Optional[str]], List[list]]:
+    """(tipos, linhas): cada valor convertido para o tipo da sua coluna na tabela offline."""
+    tipos_tabela = tipos_offline().get(offline.upper(), {})
+    tipos = [tipos_tabela.get(col) for col in colunas]
+    conversores = [_conversor(t) for t in tipos]
+    return tipos, [[f(v) for f, v in zip(conversores, row)] for row in rows]
+
+
+def tabela_compacta(offline: str, colunas: Sequence[str], rows, layout: str) -> Dict[str, Any]:
+    """Colunas uma vez e valores por coluna (ou por linha), convertidos para os tipos offline."""
+    tipos, linhas = converter_linhas(offline, colunas, rows)
+    resultado: Dict[str, Any] = {"colunas": list(colunas), "tipos": tipos}
+    if layout == "linhas":
+        resultado["linhas"] = linhas
+    else:
+        resultado["valores"] = [list(c) for c in zip(*linhas)] if linhas else [[] for _ in colunas]
+    return resultado
+
+
+def resposta_compacta(conteudo: Any, em_msgpack: bool, base: Optional[Response] = None) -> Response:
+    """Serializa em MessagePack ou JSON, levando os headers de `base` (ETag, paginação)."""
+    if not em_msgpack:
+        return json_rapido(conteudo, base)
+    inicio = perf_counter()
+    corpo = msgpack.packb(conteudo, use_bin_type=True)
+    duracao = perf_counter() - inicio
+    serializacao.observar(duracao, "msgpack")
+    somar_traco("ser", duracao)
+    resposta = Response(corpo, media_type=MSGPACK_MEDIA_TYPES[0])
+    if base is not None:
+        resposta.raw_headers.extend(base.raw_headers)
+    return resposta
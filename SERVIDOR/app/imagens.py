@@ -1,20 +1,111 @@
 # SERVIDOR/app/imagens.py
-from fastapi import APIRouter, UploadFile, File, HTTPException, Form
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Request
+from starlette.concurrency import run_in_threadpool
 from typing import Optional
 import base64
-import os
+import logging
+import threading
+import time
 from pathlib import Path
-import uuid
+from .config import settings
 from .db import get_connection
+from .executor import em_executor, run_db
+from .artigos import atualizar_artigo_no_indice, imagem_do_artigo
+from .conteudo_imagens import (
+    CACHE_IMUTAVEL, CACHE_REVALIDAR, NOME_HASH, extensao_segura, guardar_por_conteudo,
+    hash_do_ficheiro, instalar, receber_por_conteudo, resposta_imagem,
+)
+from .reconhecimento import indice_ar
+from .miniaturas import (
+    MEDIA_TYPE as MEDIA_TYPE_MINIATURA, ORIGINAL, TAMANHOS, caminho_derivada, gerador,
+    pasta_derivadas, remover_derivadas,
+)
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 # Diretório para guardar imagens
 IMAGES_DIR = Path("assets/images/artigos")
 IMAGES_DIR.mkdir(parents=True, exist_ok=True)
 
 
+# Instalar um ficheiro, mudar o campo Imagem e apagar o que ficou sem uso é feito
+# sob este lock: um upload da mesma imagem nunca vê o ficheiro ser apagado a meio
+_lock_ficheiros = threading.Lock()
+
+
+def _apagar_se_orfa(cur, imagem: Optional[str]) -> bool:
+    """
+    Apaga o ficheiro `imagem` (e as derivadas) se já nenhum artigo o referenciar.
+    Só mexe em ficheiros dentro de IMAGES_DIR. Chamar com _lock_ficheiros.
+    """
+    if not imagem:
+        return False
+    caminho = Path(imagem)
+    if caminho.resolve().parent != IMAGES_DIR.resolve():
+        return False
+    cur.execute("SELECT COUNT(*) FROM Artigo WHERE Imagem = ?", (imagem,))
+    if cur.fetchone()[0] > 0:
+        return False
+    caminho.unlink(missing_ok=True)
+    remover_derivadas(caminho)
+    indice_ar.remover(caminho)
+    print(f" Imagem removida: {caminho}")
+    return True
+
+
+def _atualizar_imagem_bd(id_artigo: int, image_path: Optional[str]):
+    """Atualiza o campo Imagem de um artigo."""
+    with get_connection("imagens.atualizar") as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE Artigo 
+            SET Imagem = ? 
+            WHERE ID_artigo = ?
+        """, (image_path, id_artigo))
+        
+        conn.commit()
+        cur.close()
+    
+    atualizar_artigo_no_indice(id_artigo)
+
+
+def _finalizar_upload(id_artigo: int, temporario: Path, nome: str) -> Path:
+    """
+    Instala o temporário como IMAGES_DIR/<nome> (se já existir, é a mesma imagem e
+    fica só um ficheiro), aponta o artigo para ele e apaga a imagem anterior se
+    mais nenhum artigo a usar.
+    """
+    destino = IMAGES_DIR / nome
+    with _lock_ficheiros:
+        instalar(temporario, destino)
+        with get_connection("imagens.upload") as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT Imagem FROM Artigo WHERE ID_artigo = ?", (id_artigo,))
+            row = cur.fetchone()
+            if row is None:
+                _apagar_se_orfa(cur, str(destino))
+                cur.close()
+                raise HTTPException(status_code=404, detail="Artigo não encontrado")
+            anterior = row[0]
+            cur.execute("""
+                UPDATE Artigo 
+                SET Imagem = ? 
+                WHERE ID_artigo = ?
+            """, (str(destino), id_artigo))
+            conn.commit()
+            if anterior and anterior != str(destino):
+                try:
+                    _apagar_se_orfa(cur, anterior)
+                except OSError as e:
+                    # Fica para recolher_orfas(); o upload já está feito
+                    logger.warning("Não foi possível apagar a imagem anterior %s: %s", anterior, e)
+            cur.close()
+
+    atualizar_artigo_no_indice(id_artigo)
+    return destino
+
+
 @router.post("/artigos/{id_artigo}/imagem")
 async def upload_imagem_artigo(
     id_artigo: int,
@@ -22,90 +113,116 @@ async def upload_imagem_artigo(
 ):
     """
     Upload de imagem para um artigo.
-    Guarda a imagem no disco e atualiza o campo Imagem na BD.
+    A imagem é copiada para o disco em blocos (fora do event loop), até
+    IMAGENS_MAX_BYTES, e fica com o nome do conteúdo: a mesma imagem é guardada
+    uma só vez. A imagem anterior do artigo é apagada se mais nenhum a usar.
+    Os tamanhos derivados (thumb, list, detail) são gerados em background.
     """
+    temporario = None
     try:
         # Validar tipo de ficheiro
-        if not file.content_type.startswith('image/'):
+        if not file.content_type or not file.content_type.startswith('image/'):
             raise HTTPException(
                 status_code=400, 
                 detail="Ficheiro deve ser uma imagem"
             )
         
-        # Gerar nome único para o ficheiro
-        file_extension = file.filename.split('.')[-1]
-        unique_filename = f"{id_artigo}_{uuid.uuid4().hex[:8]}.{file_extension}"
-        file_path = IMAGES_DIR / unique_filename
-        
-        # Guardar ficheiro
-        content = await file.read()
-        with open(file_path, 'wb') as f:
-            f.write(content)
+        # Nome pelo conteúdo (sha256): a mesma imagem fica sempre no mesmo ficheiro
+        temporario, nome = await run_in_threadpool(
+            receber_por_conteudo, IMAGES_DIR, file.file,
+            extensao_segura(file.filename), settings.imagens_max_bytes,
+        )
         
+        # Instalar o ficheiro e atualizar BD com caminho da imagem
+        file_path = await run_db(_finalizar_upload, id_artigo, temporario, nome)
         print(f" Imagem guardada: {file_path}")
-        
-        # Atualizar BD com caminho da imagem
-        conn = get_connection()
-        cur = conn.cursor()
-        
-        cur.execute("""
-            UPDATE Artigo 
-            SET Imagem = ? 
-            WHERE ID_artigo = ?
-        """, (str(file_path), id_artigo))
-        
-        conn.commit()
-        cur.close()
-        conn.close()
+        gerador.agendar(file_path)
+        indice_ar.agendar(file_path)
         
         return {
             "success": True,
             "message": "Imagem carregada com sucesso",
             "image_path": str(file_path),
+            "image_url": f"/imagens/{file_path.name}",
             "id_artigo": id_artigo
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500, 
             detail=f"Erro ao carregar imagem: {str(e)}"
         )
+    finally:
+        if temporario is not None:
+            temporario.unlink(missing_ok=True)
+
+
+def _tamanho_valido(size: str):
+    if size != ORIGINAL and size not in TAMANHOS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"size deve ser um de: {', '.join([*TAMANHOS, ORIGINAL])}"
+        )
+
+
+def _servir(request: Request, image_path: Path, size: str, cache_control: str, headers: dict):
+    """
+    Serve a imagem (ou a derivada `size`) com ETag forte pelo conteúdo.
+    Se a derivada ainda não existir, serve a original e agenda a geração;
+    essa resposta nunca é imutável, para o cliente voltar a pedir o tamanho certo.
+    """
+    hash_imagem = hash_do_ficheiro(image_path)
+    if size != ORIGINAL:
+        derivada = caminho_derivada(image_path, size)
+        if derivada.is_file():
+            return resposta_imagem(
+                request, derivada, f'"{hash_imagem}-{size}"', cache_control,
+                media_type=MEDIA_TYPE_MINIATURA, headers={**headers, "X-Imagem-Tamanho": size},
+            )
+        gerador.agendar(image_path)
+        cache_control = CACHE_REVALIDAR
+    return resposta_imagem(
+        request, image_path, f'"{hash_imagem}"', cache_control,
+        headers={**headers, "X-Imagem-Tamanho": ORIGINAL},
+    )
 
 
 @router.get("/artigos/{id_artigo}/imagem")
-def get_imagem_artigo(id_artigo: int):
+@em_executor
+def get_imagem_artigo(request: Request, id_artigo: int, size: str = ORIGINAL):
     """
     Retorna a imagem de um artigo.
+    `size`: thumb, list ou detail (WebP) ou original. Se o tamanho pedido ainda
+    não tiver sido gerado, serve a original e agenda a geração; o header
+    X-Imagem-Tamanho diz qual foi servido.
+    O caminho vem do índice de artigos em memória (sem ir à BD). A resposta tem
+    ETag e Last-Modified (304 com If-None-Match) e aceita Range; o URL imutável
+    da imagem vai no header Content-Location.
     """
+    _tamanho_valido(size)
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        
-        cur.execute("""
-            SELECT Imagem 
-            FROM Artigo 
-            WHERE ID_artigo = ?
-        """, (id_artigo,))
-        
-        result = cur.fetchone()
-        cur.close()
-        conn.close()
-        
-        if not result or not result[0]:
+        imagem = imagem_do_artigo(id_artigo)
+        if not imagem:
             raise HTTPException(
                 status_code=404,
                 detail="Artigo não tem imagem"
             )
         
-        image_path = Path(result[0])
+        image_path = Path(imagem)
         
-        if not image_path.exists():
+        if not image_path.is_file():
             raise HTTPException(
                 status_code=404,
                 detail="Ficheiro de imagem não encontrado"
             )
         
-        return FileResponse(image_path)
+        headers = {}
+        if NOME_HASH.match(image_path.name):
+            url = f"/imagens/{image_path.name}"
+            headers["Content-Location"] = url if size == ORIGINAL else f"{url}?size={size}"
+        return _servir(request, image_path, size, CACHE_REVALIDAR, headers)
         
     except HTTPException:
         raise
@@ -116,32 +233,42 @@ def get_imagem_artigo(id_artigo: int):
         )
 
 
+@router.get("/imagens/{nome}")
+@em_executor
+def get_imagem_por_conteudo(request: Request, nome: str, size: str = ORIGINAL):
+    """
+    Imagem pelo nome do conteúdo (<sha256>.<ext>, ver image_url no upload).
+    O conteúdo de um nome nunca muda: Cache-Control immutable, ETag forte, 304 e Range.
+    """
+    _tamanho_valido(size)
+    image_path = IMAGES_DIR / nome
+    if not NOME_HASH.match(nome) or not image_path.is_file():
+        raise HTTPException(status_code=404, detail="Imagem não encontrada")
+    try:
+        return _servir(request, image_path, size, CACHE_IMUTAVEL, {})
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Erro ao obter imagem: {str(e)}"
+        )
+
+
 @router.get("/artigos/{id_artigo}/imagem/base64")
+@em_executor
 def get_imagem_base64(id_artigo: int):
     """
     Retorna a imagem em base64 (útil para sincronização mobile).
     """
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        
-        cur.execute("""
-            SELECT Imagem 
-            FROM Artigo 
-            WHERE ID_artigo = ?
-        """, (id_artigo,))
+        imagem = imagem_do_artigo(id_artigo)
         
-        result = cur.fetchone()
-        cur.close()
-        conn.close()
-        
-        if not result or not result[0]:
+        if not imagem:
             return {
                 "success": False,
                 "message": "Artigo não tem imagem"
             }
         
-        image_path = Path(result[0])
+        image_path = Path(imagem)
         
         if not image_path.exists():
             return {
@@ -168,42 +295,126 @@ def get_imagem_base64(id_artigo: int):
         )
 
 
+def migrar_para_conteudo() -> dict:
+    """
+    Passa as imagens com nome antigo ({id}_{uuid}.ext) para nomes pelo conteúdo,
+    atualizando o campo Imagem. O ficheiro antigo só é apagado quando já nenhum
+    artigo o referencia.
+    """
+    migradas, falhas = 0, 0
+    with get_connection("imagens.migrar") as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT ID_artigo, Imagem FROM Artigo WHERE Imagem IS NOT NULL")
+        rows = cur.fetchall()
+        cur.close()
+
+    antigos = {}
+    for id_artigo, imagem in rows:
+        antigo = Path(imagem)
+        if NOME_HASH.match(antigo.name) or not antigo.is_file():
+            continue
+        try:
+            if imagem not in antigos:
+                novo = guardar_por_conteudo(
+                    IMAGES_DIR, antigo.read_bytes(), extensao_segura(antigo.name)
+                )
+                antigos[imagem] = novo
+                gerador.agendar(novo)
+                indice_ar.agendar(novo)
+            _atualizar_imagem_bd(id_artigo, str(antigos[imagem]))
+            migradas += 1
+        except Exception as e:
+            falhas += 1
+            logger.warning("Falha ao migrar a imagem do artigo %s: %s", id_artigo, e)
+
+    # Todos os artigos que usavam cada ficheiro antigo já apontam para o novo
+    with _lock_ficheiros, get_connection("imagens.migrar_recolher") as conn:
+        cur = conn.cursor()
+        for imagem in antigos:
+            _apagar_se_orfa(cur, imagem)
+        cur.close()
+    return {"migradas": migradas, "ficheiros": len(antigos), "falhas": falhas}
+
+
+def recolher_orfas(idade: Optional[int] = None) -> dict:
+    """
+    Apaga de IMAGES_DIR as imagens que nenhum artigo referencia, as derivadas cuja
+    original já não existe e temporários de uploads interrompidos. Só ficheiros
+    com mais de `idade` segundos (IMAGENS_ORFAS_IDADE), para não apanhar um upload a decorrer.
+    """
+    idade = settings.imagens_orfas_idade if idade is None else idade
+    limite = time.time() - idade
+    imagens, derivadas, temporarios = 0, 0, 0
+
+    with _lock_ficheiros:
+        with get_connection("imagens.recolher") as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT DISTINCT Imagem FROM Artigo WHERE Imagem IS NOT NULL")
+            em_uso = {Path(row[0]).resolve() for row in cur.fetchall()}
+            cur.close()
+
+        for ficheiro in IMAGES_DIR.iterdir():
+            if not ficheiro.is_file() or ficheiro.stat().st_mtime > limite:
+                continue
+            if ficheiro.name.startswith("."):
+                ficheiro.unlink(missing_ok=True)
+                temporarios += 1
+            elif ficheiro.resolve() not in em_uso:
+                ficheiro.unlink(missing_ok=True)
+                remover_derivadas(ficheiro)
+                indice_ar.remover(ficheiro)
+                imagens += 1
+
+        pasta_miniaturas = pasta_derivadas(IMAGES_DIR)
+        if pasta_miniaturas.is_dir():
+            for ficheiro in pasta_miniaturas.iterdir():
+                if not ficheiro.is_file() or ficheiro.stat().st_mtime > limite:
+                    continue
+                if ficheiro.name.startswith("."):
+                    ficheiro.unlink(missing_ok=True)
+                    temporarios += 1
+                elif not (IMAGES_DIR / ficheiro.name.rsplit(".", 2)[0]).is_file():
+                    ficheiro.unlink(missing_ok=True)
+                    derivadas += 1
+
+    return {"imagens": imagens, "derivadas": derivadas, "temporarios": temporarios}
+
+
 @router.delete("/artigos/{id_artigo}/imagem")
+@em_executor
 def delete_imagem_artigo(id_artigo: int):
     """
     Remove a imagem de um artigo.
     """
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        
-        # Buscar caminho da imagem
-        cur.execute("""
-            SELECT Imagem 
-            FROM Artigo 
-            WHERE ID_artigo = ?
-        """, (id_artigo,))
-        
-        result = cur.fetchone()
-        
-        if result and result[0]:
-            image_path = Path(result[0])
+        with get_connection("imagens.apagar") as conn:
+            cur = conn.cursor()
             
-            # Remover ficheiro se existir
-            if image_path.exists():
-                os.remove(image_path)
-                print(f" Imagem removida: {image_path}")
-        
-        # Atualizar BD
-        cur.execute("""
-            UPDATE Artigo 
-            SET Imagem = NULL 
-            WHERE ID_artigo = ?
-        """, (id_artigo,))
+            # Buscar caminho da imagem
+            cur.execute("""
+                SELECT Imagem 
+                FROM Artigo 
+                WHERE ID_artigo = ?
+            """, (id_artigo,))
+            
+            result = cur.fetchone()
+            
+            # Atualizar BD
+            cur.execute("""
+                UPDATE Artigo 
+                SET Imagem = NULL 
+                WHERE ID_artigo = ?
+            """, (id_artigo,))
+            
+            conn.commit()
+            
+            # O mesmo ficheiro pode ser a imagem de outros artigos (nome pelo conteúdo)
+            if result and result[0]:
+                with _lock_ficheiros:
+                    _apagar_se_orfa(cur, result[0])
+            cur.close()
         
-        conn.commit()
-        cur.close()
-        conn.close()
+        atualizar_artigo_no_indice(id_artigo)
         
         return {
             "success": True,
@@ -218,28 +429,27 @@ def delete_imagem_artigo(id_artigo: int):
 
 
 @router.get("/artigos/imagens/stats")
+@em_executor
 def get_imagens_stats():
     """
     Estatísticas sobre imagens dos artigos.
     """
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        
-        # Total de artigos
-        cur.execute("SELECT COUNT(*) FROM Artigo")
-        total_artigos = cur.fetchone()[0]
-        
-        # Artigos com imagem
-        cur.execute("SELECT COUNT(*) FROM Artigo WHERE Imagem IS NOT NULL")
-        artigos_com_imagem = cur.fetchone()[0]
+        with get_connection("imagens.stats") as conn:
+            cur = conn.cursor()
+            
+            # Total de artigos
+            cur.execute("SELECT COUNT(*) FROM Artigo")
+            total_artigos = cur.fetchone()[0]
+            
+            # Artigos com imagem
+            cur.execute("SELECT COUNT(*) FROM Artigo WHERE Imagem IS NOT NULL")
+            artigos_com_imagem = cur.fetchone()[0]
+            cur.close()
         
         # Artigos sem imagem
         artigos_sem_imagem = total_artigos - artigos_com_imagem
         
-        cur.close()
-        conn.close()
-        
         return {
             "total_artigos": total_artigos,
             "artigos_com_imagem": artigos_com_imagem,
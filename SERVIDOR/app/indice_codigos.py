@@ -0,0 +1,134 @@
+# SERVIDOR/app/indice_codigos.py
+"""
+Índice em memória: código lido (QR, barras, NFC, RFID ou referência) -> artigo.
+"""
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Ordem de prioridade quando o mesmo código aparece em colunas diferentes
+COLUNAS_CODIGO = ("Cod_bar", "Cod_NFC", "Cod_RFID", "Referencia")
+
+
+def normalizar_codigo(codigo: Any) -> Optional[str]:
+    """
+    Normaliza um código como o SQL Server o compara (collation sem distinção de
+    maiúsculas), tirando também espaços e quebras de linha que alguns leitores acrescentam.
+    """
+    if codigo is None:
+        return None
+    codigo = str(codigo).strip().upper()
+    return codigo or None
+
+
+class IndiceCodigos:
+    """
+    Hash map de códigos normalizados para artigos já montados (com tipo e família).
+    As leituras não usam lock: as escritas substituem entradas inteiras.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._artigos: Dict[int, Dict[str, Any]] = {}
+        # codigo -> [(prioridade, ID_artigo)] ordenado por prioridade
+        self._codigos: Dict[str, List[Tuple[int, int]]] = {}
+        self._construido_em: Optional[float] = None
+
+    @property
+    def construido(self) -> bool:
+        return self._construido_em is not None
+
+    def idade(self) -> Optional[float]:
+        if self._construido_em is None:
+            return None
+        return time.monotonic() - self._construido_em
+
+    def carregar(self, artigos: Iterable[Dict[str, Any]]):
+        """Reconstrói o índice inteiro a partir de todos os artigos."""
+        novos_artigos: Dict[int, Dict[str, Any]] = {}
+        novos_codigos: Dict[str, List[Tuple[int, int]]] = {}
+        for artigo in artigos:
+            novos_artigos[artigo["ID_artigo"]] = artigo
+            self._indexar(novos_codigos, artigo)
+        for entradas in novos_codigos.values():
+            entradas.sort()
+        with self._lock:
+            self._artigos = novos_artigos
+            self._codigos = novos_codigos
+            self._construido_em = time.monotonic()
+
+    def atualizar(self, artigos: Iterable[Dict[str, Any]], removidos: Iterable[int] = ()):
+        """Aplica alterações a alguns artigos (upsert) e remove os apagados."""
+        with self._lock:
+            for id_artigo in removidos:
+                self._remover(id_artigo)
+            for artigo in artigos:
+                self._remover(artigo["ID_artigo"])
+                self._artigos[artigo["ID_artigo"]] = artigo
+                self._indexar(self._codigos, artigo, ordenar=True)
+
+    def artigo(self, id_artigo: int) -> Optional[Dict[str, Any]]:
+        return self._artigos.get(id_artigo)
+
+    def procurar(self, codigo: str) -> Optional[Dict[str, Any]]:
+        chave = normalizar_codigo(codigo)
+        if chave is None:
+            return None
+        entradas = self._codigos.get(chave)
+        if not entradas:
+            return None
+        return self._artigos.get(entradas[0][1])
+
+    def colisoes(self) -> List[Dict[str, Any]]:
+        """Códigos que apontam para mais do que um artigo."""
+        resultado = []
+        for codigo, entradas in list(self._codigos.items()):
+            if len({id_artigo for _, id_artigo in entradas}) < 2:
+                continue
+            resultado.append({
+                "codigo": codigo,
+                "artigos": [
+                    {"ID_artigo": id_artigo, "coluna": COLUNAS_CODIGO[prioridade]}
+                    for prioridade, id_artigo in entradas
+                ],
+            })
+        resultado.sort(key=lambda c: c["codigo"])
+        return resultado
+
+    def stats(self) -> dict:
+        idade = self.idade()
+        return {
+            "construido": self.construido,
+            "artigos": len(self._artigos),
+            "codigos": len(self._codigos),
+            "idade_s": round(idade, 1) if idade is not None else None,
+        }
+
+    @staticmethod
+    def _indexar(
+        codigos: Dict[str, List[Tuple[int, int]]], artigo: Dict[str, Any], ordenar: bool = False
+    ):
+        for prioridade, coluna in enumerate(COLUNAS_CODIGO):
+            chave = normalizar_codigo(artigo.get(coluna))
+            if chave is None:
+                continue
+            entrada = (prioridade, artigo["ID_artigo"])
+            if ordenar:
+                # Lista nova em vez de sort() no sítio: há leituras a decorrer sem lock
+                codigos[chave] = sorted(codigos.get(chave, []) + [entrada])
+            else:
+                codigos.setdefault(chave, []).append(entrada)
+
+    def _remover(self, id_artigo: int):
+        artigo = self._artigos.pop(id_artigo, None)
+        if artigo is None:
+            return
+        for coluna in COLUNAS_CODIGO:
+            chave = normalizar_codigo(artigo.get(coluna))
+            if chave is None or chave not in self._codigos:
+                continue
+            restantes = [e for e in self._codigos[chave] if e[1] != id_artigo]
+            if restantes:
+                self._codigos[chave] = restantes
+            else:
+                del self._codigos[chave]
@@ -0,0 +1,194 @@
+# SERVIDOR/app/leitura.py
+"""
+Leitura de várias tabelas em paralelo (uma conexão do pool por tabela), todas no
+mesmo ponto no tempo.
+
+Cada leitura corre numa transação SNAPSHOT e começa por ler a versão do change
+tracking, o que fixa o snapshot dessa conexão. Se todas as leituras virem a mesma
+versão, viram os mesmos commits. Se alguma não coincidir (houve um commit entre
+arranques), repete-se; à terceira (ou logo, sem change tracking) lê-se tudo em
+série numa só transação.
+Sem SNAPSHOT isolation na BD (ver BD_ONLINE/SNAPSHOT_ISOLATION.sql), as leituras
+são paralelas mas sem garantia de consistência, e a versão devolvida é a menor
+(um delta a partir dela cobre tudo o que possa faltar).
+"""
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .config import settings
+from .db import get_connection
+
+# converter(chave, colunas, rows) -> dados da tabela na resposta
+Conversor = Callable[[str, List[str], list], Any]
+
+_leitores: Optional[ThreadPoolExecutor] = None
+_leitores_lock = threading.Lock()
+_snapshot_disponivel: Optional[bool] = None
+
+
+def _get_leitores() -> ThreadPoolExecutor:
+    # Pool próprio: as leituras são lançadas a partir de um worker do executor da BD,
+    # e esperar por tarefas no mesmo executor podia bloqueá-lo quando está cheio
+    global _leitores
+    if _leitores is None:
+        with _leitores_lock:
+            if _leitores is None:
+                _leitores = ThreadPoolExecutor(
+                    max_workers=settings.sync_paralelo_workers, thread_name_prefix="sync-leitura"
+                )
+    return _leitores
+
+
+def snapshot_disponivel() -> bool:
+    """
+    True se a BD tiver ALLOW_SNAPSHOT_ISOLATION ativo. Só a resposta lida de
+    sys.databases é guardada: se a BD não responder, devolve False e volta a
+    verificar na chamada seguinte.
+    """
+    global _snapshot_disponivel
+    if _snapshot_disponivel is None:
+        try:
+            with get_connection() as conn:
+                cur = conn.cursor()
+                cur.execute(
+                    "SELECT snapshot_isolation_state FROM sys.databases WHERE database_id = DB_ID()"
+                )
+                row = cur.fetchone()
+                cur.close()
+        except Exception:
+            return False
+        _snapshot_disponivel = bool(row and row[0] == 1)
+    return _snapshot_disponivel
+
+
+def _versao_ct(cur) -> Optional[int]:
+    try:
+        cur.execute("SELECT CHANGE_TRACKING_CURRENT_VERSION()")
+        row = cur.fetchone()
+        return int(row[0]) if row and row[0] is not None else None
+    except Exception:
+        return None
+
+
+@contextmanager
+def transacao_snapshot(cur, snapshot: bool):
+    """
+    Abre (se `snapshot`) uma transação SNAPSHOT no cursor e devolve a versão do
+    change tracking vista por ela. O nível de isolamento é reposto no fim, porque
+    fica na sessão e a conexão volta para o pool.
+    """
+    if snapshot:
+        cur.execute("SET TRANSACTION ISOLATION LEVEL SNAPSHOT")
+    try:
+        yield _versao_ct(cur)
+    finally:
+        if snapshot:
+            cur.connection.rollback()
+            cur.execute("SET TRANSACTION ISOLATION LEVEL READ COMMITTED")
+
+
+def _ler(
+    chave: str, sql: str, converter: Conversor, snapshot: bool
+) -> Tuple[Optional[int], Any, float]:
+    inicio = time.perf_counter()
+    with get_connection() as conn:
+        cur = conn.cursor()
+        with transacao_snapshot(cur, snapshot) as versao:
+            cur.execute(sql)
+            colunas = [desc[0] for desc in cur.description]
+            dados = converter(chave, colunas, cur.fetchall())
+        cur.close()
+    return versao, dados, (time.perf_counter() - inicio) * 1000
+
+
+def _ler_em_serie(consultas: Dict[str, str], converter: Conversor, snapshot: bool):
+    dados: Dict[str, Any] = {}
+    tempos: Dict[str, float] = {}
+    with get_connection() as conn:
+        cur = conn.cursor()
+        with transacao_snapshot(cur, snapshot) as versao:
+            for chave, sql in consultas.items():
+                inicio = time.perf_counter()
+                cur.execute(sql)
+                colunas = [desc[0] for desc in cur.description]
+                dados[chave] = converter(chave, colunas, cur.fetchall())
+                tempos[chave] = (time.perf_counter() - inicio) * 1000
+        cur.close()
+    return versao, dados, tempos
+
+
+def ler_tabelas(
+    consultas: Dict[str, str],
+    converter: Conversor,
+    tentativas: int = 3,
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Corre as `consultas` ({chave: SELECT}) em paralelo e devolve (dados, leitura), em que
+    leitura = {"versao", "consistente", "modo", "tentativas", "tempos_ms", "total_ms"}.
+    """
+    inicio = time.perf_counter()
+    snapshot = snapshot_disponivel()
+    leitores = _get_leitores()
+
+    for tentativa in range(1, max(tentativas, 1) + 1):
+        futuros = {
+            chave: leitores.submit(
+                contextvars.copy_context().run, _ler, chave, sql, converter, snapshot
+            )
+            for chave, sql in consultas.items()
+        }
+        resultados = {chave: futuro.result() for chave, futuro in futuros.items()}
+        versoes = {versao for versao, _, _ in resultados.values()}
+        if snapshot and None in versoes:
+            # Sem change tracking não há como comparar: só a leitura em série é consistente
+            break
+        iguais = len(versoes) == 1
+        if iguais or not snapshot:
+            conhecidas = [v for v in versoes if v is not None]
+            return (
+                {chave: dados for chave, (_, dados, _) in resultados.items()},
+                _info(
+                    min(conhecidas) if conhecidas else None,
+                    consistente=snapshot and iguais,
+                    modo="paralelo",
+                    tentativas=tentativa,
+                    tempos={chave: t for chave, (_, _, t) in resultados.items()},
+                    inicio=inicio,
+                ),
+            )
+
+    versao, dados, tempos = _ler_em_serie(consultas, converter, snapshot)
+    return dados, _info(
+        versao, consistente=snapshot, modo="serie", tentativas=tentativa + 1,
+        tempos=tempos, inicio=inicio,
+    )
+
+
+def _info(
+    versao, consistente: bool, modo: str, tentativas: int, tempos: Dict[str, float], inicio: float
+) -> Dict[str, Any]:
+    return {
+        "versao": versao,
+        "consistente": consistente,
+        "modo": modo,
+        "tentativas": tentativas,
+        "tempos_ms": {chave: round(t, 1) for chave, t in tempos.items()},
+        "total_ms": round((time.perf_counter() - inicio) * 1000, 1),
+    }
+
+
+def consultas_select(tabelas: Sequence[Tuple[str, str]], columns: str = "*") -> Dict[str, str]:
+    """{chave: SELECT} para uma lista (chave, tabela) como SYNC_TABELAS."""
+    return {chave: f"SELECT {columns} FROM {tabela}" for chave, tabela in tabelas}
+
+
+def fechar_leitores():
+    global _leitores
+    with _leitores_lock:
+        leitores, _leitores = _leitores, None
+    if leitores is not None:
+        leitores.shutdown(wait=False, cancel_futures=True)
@@ -1,14 +1,104 @@
-﻿from fastapi import FastAPI, HTTPException
+﻿from contextlib import asynccontextmanager
+import logging
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.staticfiles import StaticFiles
 from .config import settings
-from .db import ping_db
+from .db import ping_db, get_pool, pool_stats, fechar_pool
+from .executor import em_executor, run_db, executor_stats, fechar_executor
+from .leitura import fechar_leitores
+from .alteracoes import monitor
 from .auth import router as auth_router
-from .artigos import router as artigos_router
+from .senhas import fechar_pool_senhas
+from .artigos import router as artigos_router, construir_indice
 from .sync import router as sync_router
-from .imagens import router as imagens_router  
+from .imagens import router as imagens_router, IMAGES_DIR as IMAGENS_ARTIGOS_DIR
+from .miniaturas import gerador as gerador_miniaturas
+from .reconhecimento import router as reconhecimento_router, indice_ar
+from .bundle_imagens import router as bundle_imagens_router
+from .CARREGAR_DADOS import router as carregar_dados_router
+from .stock import router as stock_router, construir_stock
+from .analytics import router as analytics_router
+from .snapshot import router as snapshot_router, construtor as construtor_snapshot
+from .replica import replica
+from .admin import router as admin_router
+from .compressao import CompressaoMiddleware
+from .tracing import TracingMiddleware
+from .metricas import (
+    MEDIA_TYPE as MEDIA_TYPE_METRICAS, MetricasMiddleware, registo as registo_metricas,
+)
 from pathlib import Path
 
-app = FastAPI(title="ARMAZÉM API", version="2.0.0")
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Arranque: aquece o pool de conexões, constrói o índice de códigos e o stock, arranca
+    a réplica local (modo edge), o monitor de alterações e a construção do snapshot SQLite
+    e agenda as miniaturas e os descritores de reconhecimento em falta.
+    Shutdown: para as threads de background e fecha o executor e o pool.
+    """
+    try:
+        await run_db(get_pool().aquecer)
+    except Exception as e:
+        # A API arranca na mesma; as conexões são abertas quando houver BD
+        logger.warning("Não foi possível aquecer o pool de conexões: %s", e)
+    try:
+        await run_db(construir_indice)
+    except Exception as e:
+        # Sem índice, a leitura de códigos vai à BD até ele ser construído
+        logger.warning("Não foi possível construir o índice de códigos: %s", e)
+    try:
+        await run_db(construir_stock)
+    except Exception as e:
+        # Sem stock calculado, o primeiro pedido a /stock calcula-o
+        logger.warning("Não foi possível calcular o stock: %s", e)
+    if settings.replica_ativa:
+        replica.iniciar()
+    monitor.iniciar()
+    construtor_snapshot.carregar_existente()
+    if settings.snapshot_ativo:
+        construtor_snapshot.iniciar()
+    if settings.miniaturas_preencher_arranque:
+        gerador_miniaturas.preencher(IMAGENS_ARTIGOS_DIR)
+    try:
+        indice_ar.carregar()
+    except Exception as e:
+        # Índice guardado ilegível: é refeito a partir das imagens
+        logger.warning("Não foi possível ler o índice de reconhecimento: %s", e)
+    indice_ar.preencher(IMAGENS_ARTIGOS_DIR)
+    yield
+    construtor_snapshot.parar()
+    gerador_miniaturas.parar()
+    indice_ar.parar()
+    replica.parar()
+    monitor.parar()
+    fechar_executor()
+    fechar_leitores()
+    fechar_pool_senhas()
+    fechar_pool()
+
+
+app = FastAPI(title="ARMAZÉM API", version="2.0.0", lifespan=lifespan)
+
+if settings.compressao_ativa:
+    app.add_middleware(
+        CompressaoMiddleware,
+        minimo=settings.compressao_minimo,
+        niveis={
+            "gzip": settings.compressao_nivel_gzip,
+            "br": settings.compressao_nivel_brotli,
+            "zstd": settings.compressao_nivel_zstd,
+        },
+    )
+
+# Por fora da compressão, para o Server-Timing já incluir o tempo de comprimir
+if settings.tracing_ativo:
+    app.add_middleware(TracingMiddleware, max_sql=settings.server_timing_max_sql)
+
+# Depois da compressão: é o mais exterior, e conta os bytes que vão para a rede
+app.add_middleware(MetricasMiddleware)
 
 # Criar diretório de imagens se não existir
 IMAGES_DIR = Path("assets/images")
@@ -22,6 +112,14 @@ app.include_router(auth_router)
 app.include_router(artigos_router)
 app.include_router(sync_router)
 app.include_router(imagens_router)  
+app.include_router(bundle_imagens_router)
+app.include_router(reconhecimento_router)
+# Depois do sync_router: as rotas /sync/* repetidas continuam a ser as de sync.py
+app.include_router(carregar_dados_router)
+app.include_router(stock_router)
+app.include_router(analytics_router)
+app.include_router(snapshot_router)
+app.include_router(admin_router)
 
 @app.get("/")
 def root():
@@ -41,20 +139,63 @@ def root():
             "auth": "/auth/login",
             "artigos": "/artigos",
             "sync": "/sync/*",
-            "imagens": "/artigos/{id}/imagem"
+            "stock": "/stock",
+            "analytics": "/analytics/movimentos/*",
+            "imagens": "/artigos/{id}/imagem",
+            "ar": "/ar/match"
         }
     }
 
 @app.get("/health")
-def health():
-    """Verifica se a API está online."""
-    return {"status": "ok", "env": settings.app_env}
+async def health():
+    """Verifica se a API está online; no modo edge, mostra também o atraso da réplica local."""
+    estado = {"status": "ok", "env": settings.app_env}
+    if settings.replica_ativa:
+        estado["replica"] = replica.saude()
+    return estado
 
 @app.get("/db/ping")
+@em_executor
 def db_ping():
     """Testa a conexão à base de dados."""
     try:
         ping_db()
         return {"db": "ok"}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"DB ping falhou: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"DB ping falhou: {e}")
+
+
+@app.get("/db/pool")
+async def db_pool():
+    """Estatísticas do pool de conexões (em uso, à espera, tempos de espera)."""
+    return pool_stats()
+
+
+@app.get("/db/executor")
+async def db_executor():
+    """Estatísticas do executor da BD (em execução, em fila, pedidos recusados)."""
+    return executor_stats()
+
+
+registo_metricas.gauge(
+    "armazem_bd_pool_em_uso", "Conexões do pool emprestadas.", lambda: pool_stats().get("em_uso", 0)
+)
+registo_metricas.gauge(
+    "armazem_bd_pool_a_espera",
+    "Pedidos à espera de uma conexão do pool.",
+    lambda: pool_stats().get("a_espera", 0),
+)
+registo_metricas.gauge(
+    "armazem_bd_executor_em_fila",
+    "Trabalhos na fila do executor da BD.",
+    lambda: executor_stats().get("em_fila", 0),
+)
+
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Métricas no formato de texto do Prometheus: pedidos, latência e bytes por rota,
+    pedidos em curso e, por consulta à BD, tempos de conexão, execute e fetch e linhas.
+    """
+    return Response(registo_metricas.expor(), media_type=MEDIA_TYPE_METRICAS)
@@ -0,0 +1,269 @@
+# SERVIDOR/app/metricas.py
+"""
+Métricas no formato de texto do Prometheus (GET /metrics), sem dependências.
+
+Pedidos HTTP: contagem, latência (histograma) e bytes enviados por rota (o
+template, ex. /artigos/{id_artigo}, nunca o caminho concreto), e pedidos em curso.
+BD: para cada consulta com nome (get_connection("artigos.por_id")), histogramas
+do tempo para obter a conexão, do execute e do fetch, e linhas devolvidas.
+Assim, quando uma sincronização fica lenta, vê-se se o tempo vai para o pool,
+para o SQL Server, para ler as linhas, para serializar ou para enviar a resposta.
+"""
+import bisect
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Segundos: de uma query por índice a uma sincronização completa
+BUCKETS_LATENCIA = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+Etiquetas = Tuple[str, ...]
+
+
+def _escapar(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _etiquetas(nomes: Sequence[str], valores: Etiquetas, extra: str = "") -> str:
+    partes = [f'{n}="{_escapar(str(v))}"' for n, v in zip(nomes, valores)]
+    if extra:
+        partes.append(extra)
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+def _numero(valor: float) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if not float(valor).is_integer() else str(int(valor))
+
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nome: str, ajuda: str, etiquetas: Sequence[str] = ()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.etiquetas = tuple(etiquetas)
+        self._lock = threading.Lock()
+
+    def _cabecalho(self) -> List[str]:
+        return [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} {self.tipo}"]
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def __init__(self, nome: str, ajuda: str, etiquetas: Sequence[str] = ()):
+        super().__init__(nome, ajuda, etiquetas)
+        self._valores: Dict[Etiquetas, float] = {}
+
+    def inc(self, *valores: str, n: float = 1):
+        with self._lock:
+            self._valores[valores] = self._valores.get(valores, 0) + n
+
+    def valor(self, *valores: str) -> float:
+        with self._lock:
+            return self._valores.get(valores, 0)
+
+    def expor(self) -> List[str]:
+        with self._lock:
+            itens = sorted(self._valores.items())
+        return self._cabecalho() + [
+            f"{self.nome}{_etiquetas(self.etiquetas, chave)} {_numero(v)}" for chave, v in itens
+        ]
+
+
+class Gauge(_Metrica):
+    """Valor atual; com `ler`, o valor é pedido a quem o tem no momento da exposição."""
+
+    tipo = "gauge"
+
+    def __init__(self, nome: str, ajuda: str, ler: Optional[Callable[[], float]] = None):
+        super().__init__(nome, ajuda)
+        self._ler = ler
+        self._valor = 0.0
+
+    def inc(self, n: float = 1):
+        with self._lock:
+            self._valor += n
+
+    def dec(self, n: float = 1):
+        self.inc(-n)
+
+    def valor(self) -> float:
+        if self._ler is not None:
+            return self._ler()
+        with self._lock:
+            return self._valor
+
+    def expor(self) -> List[str]:
+        try:
+            valor = self.valor()
+        except Exception:
+            return []
+        return self._cabecalho() + [f"{self.nome} {_numero(valor)}"]
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(
+        self, nome: str, ajuda: str, etiquetas: Sequence[str] = (),
+        buckets: Sequence[float] = BUCKETS_LATENCIA,
+    ):
+        super().__init__(nome, ajuda, etiquetas)
+        self.buckets = tuple(sorted(buckets))
+        # etiquetas -> [contagem por bucket (não cumulativa; a última é +Inf), soma]
+        self._series: Dict[Etiquetas, Tuple[List[int], List[float]]] = {}
+
+    def observar(self, valor: float, *valores: str):
+        posicao = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(valores)
+            if serie is None:
+                serie = self._series[valores] = ([0] * (len(self.buckets) + 1), [0.0])
+            serie[0][posicao] += 1
+            serie[1][0] += valor
+
+    def contagem(self, *valores: str) -> int:
+        with self._lock:
+            serie = self._series.get(valores)
+            return sum(serie[0]) if serie else 0
+
+    def expor(self) -> List[str]:
+        with self._lock:
+            series = sorted((chave, (list(c), s[0])) for chave, (c, s) in self._series.items())
+        linhas = self._cabecalho()
+        for chave, (contagens, soma) in series:
+            acumulado = 0
+            for limite, n in zip((*self.buckets, float("inf")), contagens):
+                acumulado += n
+                le = _etiquetas(self.etiquetas, chave, f'le="{_numero(limite)}"')
+                linhas.append(f"{self.nome}_bucket{le} {acumulado}")
+            base = _etiquetas(self.etiquetas, chave)
+            linhas.append(f"{self.nome}_sum{base} {_numero(soma)}")
+            linhas.append(f"{self.nome}_count{base} {acumulado}")
+        return linhas
+
+
+class Registo:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metricas: Dict[str, _Metrica] = {}
+
+    def _registar(self, metrica: _Metrica):
+        with self._lock:
+            if metrica.nome in self._metricas:
+                raise ValueError(f"Métrica repetida: {metrica.nome}")
+            self._metricas[metrica.nome] = metrica
+        return metrica
+
+    def contador(self, nome: str, ajuda: str, etiquetas: Sequence[str] = ()) -> Contador:
+        return self._registar(Contador(nome, ajuda, etiquetas))
+
+    def gauge(self, nome: str, ajuda: str, ler: Optional[Callable[[], float]] = None) -> Gauge:
+        return self._registar(Gauge(nome, ajuda, ler))
+
+    def histograma(
+        self, nome: str, ajuda: str, etiquetas: Sequence[str] = (),
+        buckets: Sequence[float] = BUCKETS_LATENCIA,
+    ) -> Histograma:
+        return self._registar(Histograma(nome, ajuda, etiquetas, buckets))
+
+    def expor(self) -> str:
+        with self._lock:
+            metricas = list(self._metricas.values())
+        linhas: List[str] = []
+        for metrica in metricas:
+            linhas.extend(metrica.expor())
+        return "\n".join(linhas) + "\n"
+
+
+registo = Registo()
+
+http_pedidos = registo.contador(
+    "armazem_http_pedidos_total",
+    "Pedidos HTTP por método, rota e estado.",
+    ("metodo", "rota", "estado"),
+)
+http_duracao = registo.histograma(
+    "armazem_http_duracao_segundos",
+    "Tempo até ao fim da resposta, por método e rota.",
+    ("metodo", "rota"),
+)
+http_bytes = registo.contador(
+    "armazem_http_resposta_bytes_total",
+    "Bytes do corpo das respostas (já comprimidos).",
+    ("metodo", "rota"),
+)
+http_em_curso = registo.gauge("armazem_http_pedidos_em_curso", "Pedidos HTTP a decorrer.")
+serializacao = registo.histograma(
+    "armazem_serializacao_segundos",
+    "Tempo a serializar respostas grandes (json_rapido, msgpack).",
+    ("formato",),
+)
+
+bd_conexao = registo.histograma(
+    "armazem_bd_conexao_segundos",
+    "Tempo para obter uma conexão do pool, por consulta.",
+    ("consulta",),
+)
+bd_execute = registo.histograma(
+    "armazem_bd_execute_segundos", "Tempo do execute (SQL Server), por consulta.", ("consulta",)
+)
+bd_fetch = registo.histograma(
+    "armazem_bd_fetch_segundos", "Tempo a ler as linhas do resultado, por consulta.", ("consulta",)
+)
+bd_linhas = registo.contador(
+    "armazem_bd_linhas_total", "Linhas devolvidas pela BD, por consulta.", ("consulta",)
+)
+
+# Pedidos que não chegaram a nenhuma rota (404): uma só série, não uma por caminho
+_SEM_ROTA = "<sem rota>"
+
+
+def _rota(scope: Scope) -> str:
+    rota = scope.get("route")
+    return getattr(rota, "path", None) or _SEM_ROTA
+
+
+class MetricasMiddleware:
+    """
+    Mede cada pedido HTTP do início até ao último bloco do corpo. Deve ser o
+    middleware mais exterior, para contar os bytes que vão de facto para a rede.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        inicio = time.perf_counter()
+        estado = [500]
+        enviados = [0]
+
+        async def _send(message: Message):
+            if message["type"] == "http.response.start":
+                estado[0] = message["status"]
+            elif message["type"] == "http.response.body":
+                enviados[0] += len(message.get("body", b""))
+            await send(message)
+
+        http_em_curso.inc()
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            http_em_curso.dec()
+            metodo, rota = scope["method"], _rota(scope)
+            http_pedidos.inc(metodo, rota, str(estado[0]))
+            http_duracao.observar(time.perf_counter() - inicio, metodo, rota)
+            http_bytes.inc(metodo, rota, n=enviados[0])
@@ -0,0 +1,184 @@
+# SERVIDOR/app/miniaturas.py
+"""
+Tamanhos derivados das imagens dos artigos (thumb, list, detail) em WebP, gerados
+com OpenCV fora do pedido: o upload só agenda a geração e, até ela acabar,
+GET /artigos/{id}/imagem?size= serve a original.
+
+As derivadas ficam em assets/images/artigos/miniaturas/<nome da original>.<tamanho>.webp;
+como cada upload tem um nome novo, uma imagem substituída nunca reaproveita
+derivadas antigas.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+import cv2
+import numpy as np
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Maior lado, em píxeis
+TAMANHOS: Dict[str, int] = {"thumb": 160, "list": 480, "detail": 1280}
+ORIGINAL = "original"
+MEDIA_TYPE = "image/webp"
+
+EXTENSOES_IMAGEM = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff"}
+
+
+def pasta_derivadas(pasta: Path) -> Path:
+    return pasta / "miniaturas"
+
+
+def caminho_derivada(original: Path, tamanho: str) -> Path:
+    return pasta_derivadas(original.parent) / f"{original.name}.{tamanho}.webp"
+
+
+def derivadas_existentes(original: Path) -> Dict[str, Path]:
+    caminhos = {tamanho: caminho_derivada(original, tamanho) for tamanho in TAMANHOS}
+    return {tamanho: caminho for tamanho, caminho in caminhos.items() if caminho.is_file()}
+
+
+def _ler(original: Path) -> np.ndarray:
+    # imdecode em vez de imread: o imread não abre caminhos com acentos no Windows
+    dados = np.fromfile(str(original), dtype=np.uint8)
+    imagem = cv2.imdecode(dados, cv2.IMREAD_COLOR)
+    if imagem is None:
+        raise ValueError(f"Não foi possível ler a imagem {original}")
+    return imagem
+
+
+def _reduzir(imagem: np.ndarray, lado: int) -> np.ndarray:
+    altura, largura = imagem.shape[:2]
+    escala = lado / max(altura, largura)
+    if escala >= 1:
+        return imagem  # nunca se aumenta
+    tamanho = (max(1, round(largura * escala)), max(1, round(altura * escala)))
+    return cv2.resize(imagem, tamanho, interpolation=cv2.INTER_AREA)
+
+
+def _gravar(destino: Path, imagem: np.ndarray, qualidade: int):
+    ok, dados = cv2.imencode(".webp", imagem, [cv2.IMWRITE_WEBP_QUALITY, qualidade])
+    if not ok:
+        raise ValueError(f"Não foi possível codificar {destino.name}")
+    temporario = destino.with_name(f".{destino.name}.tmp")
+    with open(temporario, "wb") as f:
+        f.write(dados.tobytes())
+    # Um pedido nunca vê uma derivada a meio
+    os.replace(temporario, destino)
+
+
+def gerar_derivadas(original: Path, qualidade: Optional[int] = None) -> Dict[str, Path]:
+    """
+    Gera (ou regenera) todos os tamanhos de uma imagem. Cada tamanho é reduzido a
+    partir do anterior maior, que sai mais barato do que partir sempre da original.
+    """
+    qualidade = settings.miniaturas_qualidade if qualidade is None else qualidade
+    imagem = _ler(original)
+    caminho_derivada(original, "thumb").parent.mkdir(parents=True, exist_ok=True)
+    gerados: Dict[str, Path] = {}
+    for tamanho, lado in sorted(TAMANHOS.items(), key=lambda item: -item[1]):
+        imagem = _reduzir(imagem, lado)
+        destino = caminho_derivada(original, tamanho)
+        _gravar(destino, imagem, qualidade)
+        gerados[tamanho] = destino
+    return gerados
+
+
+def remover_derivadas(original: Path):
+    for tamanho in TAMANHOS:
+        caminho_derivada(original, tamanho).unlink(missing_ok=True)
+
+
+class GeradorMiniaturas:
+    """
+    Gera as derivadas num pool de threads próprio (o OpenCV liberta o GIL), sem
+    repetir uma imagem que já esteja na fila.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = max(workers, 1)
+        self._lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pendentes: set = set()
+        self._geradas = 0
+        self._falhas = 0
+        self._ultimo_erro: Optional[str] = None
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="miniaturas"
+                )
+            return self._pool
+
+    def agendar(self, original: Path) -> bool:
+        """Agenda a geração das derivadas. False se a imagem já estiver na fila."""
+        original = Path(original)
+        with self._lock:
+            if original in self._pendentes:
+                return False
+            self._pendentes.add(original)
+        self._get_pool().submit(self._gerar, original)
+        return True
+
+    def _gerar(self, original: Path):
+        try:
+            if original.is_file():
+                gerar_derivadas(original)
+                with self._lock:
+                    self._geradas += 1
+        except Exception as e:
+            with self._lock:
+                self._falhas += 1
+                self._ultimo_erro = str(e)
+            logger.warning("Falha ao gerar miniaturas de %s: %s", original, e)
+        finally:
+            with self._lock:
+                self._pendentes.discard(original)
+
+    def preencher(self, pasta: Path) -> int:
+        """
+        Agenda as imagens de `pasta` a que falte algum tamanho. Devolve quantas foram
+        agendadas.
+        """
+        agendadas = 0
+        for original in _originais(pasta):
+            if len(derivadas_existentes(original)) < len(TAMANHOS) and self.agendar(original):
+                agendadas += 1
+        return agendadas
+
+    def parar(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+            self._pendentes.clear()
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pendentes": len(self._pendentes),
+                "geradas": self._geradas,
+                "falhas": self._falhas,
+                "ultimo_erro": self._ultimo_erro,
+            }
+
+
+def _originais(pasta: Path) -> Iterable[Path]:
+    if not pasta.is_dir():
+        return []
+    return (
+        ficheiro for ficheiro in pasta.iterdir()
+        if ficheiro.is_file()
+        and ficheiro.suffix.lower() in EXTENSOES_IMAGEM
+        and not ficheiro.name.startswith(".")
+    )
+
+
+gerador = GeradorMiniaturas(settings.miniaturas_workers)
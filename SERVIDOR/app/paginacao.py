@@ -0,0 +1,130 @@
+# SERVIDOR/app/paginacao.py
+"""
+Paginação por cursor (keyset): `limit` + `after`, sem OFFSET.
+O cursor é opaco para o cliente: guarda os valores da chave de ordenação da última linha.
+A resposta continua a ser uma lista; o cursor da página seguinte vai nos headers
+X-Next-Cursor e Link (rel="next"). Sem cursor nesses headers, não há mais páginas.
+"""
+import base64
+import json
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Query, Request, Response
+
+from .config import settings
+
+
+def codificar_cursor(valores: Sequence[Any]) -> str:
+    dados = json.dumps(list(valores), separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(dados.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def descodificar_cursor(cursor: str, n_chaves: int) -> List[Any]:
+    """Raises HTTPException 400 se o cursor não for válido."""
+    try:
+        dados = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        valores = json.loads(dados)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor de paginação inválido")
+    if not isinstance(valores, list) or len(valores) != n_chaves:
+        raise HTTPException(status_code=400, detail="Cursor de paginação inválido")
+    return valores
+
+
+def limite_efetivo(limit: Optional[int], after: Optional[str]) -> Optional[int]:
+    """Sem `limit` nem `after` devolve None (lista completa, como antes)."""
+    if limit is None and after is not None:
+        return settings.paginacao_limit_omissao
+    return limit
+
+
+def consulta_keyset(
+    colunas: str,
+    origem: str,
+    chaves: Sequence[str],
+    limit: Optional[int],
+    after: Optional[Sequence[Any]],
+) -> Tuple[str, tuple]:
+    """
+    Constrói um SELECT ordenado por `chaves` (a última tem de ser única).
+    Com `after`, só devolve linhas depois dessa posição; com `limit`, pede limit+1
+    linhas para se saber se há página seguinte.
+    """
+    params: list = []
+    top = ""
+    if limit is not None:
+        top = "TOP (?) "
+        params.append(limit + 1)
+
+    where = ""
+    if after is not None:
+        # (k1 > ?) OR (k1 = ? AND k2 > ?) OR ...
+        ramos = []
+        for i, chave in enumerate(chaves):
+            partes = [f"{anterior} = ?" for anterior in chaves[:i]] + [f"{chave} > ?"]
+            ramos.append("(" + " AND ".join(partes) + ")")
+            params.extend(after[: i + 1])
+        where = "WHERE " + " OR ".join(ramos)
+
+    sql = f"SELECT {top}{colunas} FROM {origem} {where} ORDER BY {', '.join(chaves)}"
+    return sql, tuple(params)
+
+
+def cortar_pagina(
+    request: Request,
+    response: Response,
+    rows: list,
+    limit: Optional[int],
+    chave_da_linha: Callable[[Any], Sequence[Any]],
+) -> list:
+    """
+    Remove a linha extra pedida por consulta_keyset e, se houver mais páginas,
+    põe o cursor seguinte nos headers da resposta.
+    """
+    if limit is None or len(rows) <= limit:
+        return rows
+    rows = rows[:limit]
+    cursor = codificar_cursor(chave_da_linha(rows[-1]))
+    proxima = request.url.include_query_params(limit=limit, after=cursor)
+    response.headers["X-Next-Cursor"] = cursor
+    response.headers["Link"] = f'<{proxima}>; rel="next"'
+    return rows
+
+
+class Pagina:
+    """Parâmetros de paginação de um pedido (obtidos com Depends(pagina))."""
+
+    def __init__(
+        self, request: Request, response: Response, limit: Optional[int], after: Optional[str]
+    ):
+        self.request = request
+        self.response = response
+        self.limit = limite_efetivo(limit, after)
+        self.after = after
+
+    def consulta(self, colunas: str, origem: str, chaves: Sequence[str]) -> Tuple[str, tuple]:
+        valores = descodificar_cursor(self.after, len(chaves)) if self.after else None
+        return consulta_keyset(colunas, origem, chaves, self.limit, valores)
+
+    def cortar(self, rows: list, chave_da_linha: Callable[[Any], Sequence[Any]]) -> list:
+        return cortar_pagina(self.request, self.response, rows, self.limit, chave_da_linha)
+
+    def fatiar(
+        self, items: list, chave_do_item: Callable[[Any], Sequence[Any]], n_chaves: int = 1
+    ) -> list:
+        """Mesma paginação, mas sobre uma lista já em memória e ordenada pela chave."""
+        if self.after:
+            valores = descodificar_cursor(self.after, n_chaves)
+            items = [item for item in items if list(chave_do_item(item)) > valores]
+        if self.limit is not None:
+            items = items[: self.limit + 1]
+        return self.cortar(items, chave_do_item)
+
+
+async def pagina(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=settings.paginacao_max_limit),
+    after: Optional[str] = None,
+) -> Pagina:
+    return Pagina(request, response, limit, after)
@@ -0,0 +1,455 @@
+# SERVIDOR/app/reconhecimento.py
+"""
+Reconhecimento visual de artigos para o scanner AR: em vez de o telemóvel
+descarregar o catálogo e comparar localmente, envia um frame para POST /ar/match.
+
+Cada imagem em assets/images/artigos tem descritores ORB (256 bits = 32 bytes).
+Estão todos numa só matriz, (4, M) uint64 (transposta, para cada palavra de 64 bits
+ser contígua), com o dono de cada linha num array à parte. A distância de Hamming
+entre os descritores do frame e os do índice é um XOR + np.bitwise_count por
+blocos, sem ciclos em Python por descritor. Cada descritor do frame vota na
+imagem do seu vizinho mais próximo (teste do rácio de Lowe) e a confiança é a
+fração de votos.
+
+O índice é guardado em AR_INDICE_PATH (npz) e atualizado imagem a imagem
+quando há upload ou quando uma imagem é apagada.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from fastapi import APIRouter, File, HTTPException, UploadFile
+from starlette.concurrency import run_in_threadpool
+
+from .config import settings
+from .conteudo_imagens import NOME_HASH
+from .db import get_connection
+from .executor import run_db
+from .miniaturas import EXTENSOES_IMAGEM
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+BYTES_DESCRITOR = 32
+_PALAVRAS = BYTES_DESCRITOR // 8
+# Linhas do índice comparadas de cada vez: (frame x bloco) cabe na cache
+_BLOCO = 1024
+# Abaixo disto uma imagem não entra nos resultados (coincidências soltas)
+_MIN_VOTOS = 3
+# Muda se o formato ou os parâmetros ORB mudarem: o índice guardado é refeito
+_VERSAO = 1
+
+
+def _parametros() -> np.ndarray:
+    return np.array([_VERSAO, settings.ar_descritores_imagem, settings.ar_lado], dtype=np.int64)
+
+
+def _cinzento(dados: np.ndarray) -> np.ndarray:
+    imagem = cv2.imdecode(dados, cv2.IMREAD_GRAYSCALE)
+    if imagem is None:
+        raise ValueError("Não foi possível ler a imagem")
+    altura, largura = imagem.shape[:2]
+    escala = settings.ar_lado / max(altura, largura)
+    if escala < 1:
+        tamanho = (max(1, round(largura * escala)), max(1, round(altura * escala)))
+        imagem = cv2.resize(imagem, tamanho, interpolation=cv2.INTER_AREA)
+    return imagem
+
+
+def descritores(dados: np.ndarray, n: int) -> np.ndarray:
+    """Descritores ORB (até `n`) de uma imagem codificada (bytes em uint8): (k, 32) uint8."""
+    orb = cv2.ORB_create(nfeatures=n)
+    _, desc = orb.detectAndCompute(_cinzento(dados), None)
+    if desc is None:
+        return np.empty((0, BYTES_DESCRITOR), dtype=np.uint8)
+    return np.ascontiguousarray(desc, dtype=np.uint8)
+
+
+def descritores_ficheiro(caminho: Path) -> np.ndarray:
+    # np.fromfile + imdecode: o imread não abre caminhos com acentos no Windows
+    return descritores(np.fromfile(str(caminho), dtype=np.uint8), settings.ar_descritores_imagem)
+
+
+def vizinhos(consulta: np.ndarray, matriz: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Para cada descritor de `consulta` ((n, 32) uint8), a linha mais próxima em
+    `matriz` ((4, M) uint64) e as duas menores distâncias de Hamming.
+    Devolve (linha, d1, d2).
+    """
+    n, total = len(consulta), matriz.shape[1]
+    q = np.ascontiguousarray(consulta).view(np.uint64)
+    linha = np.zeros(n, dtype=np.int64)
+    d1 = np.full(n, 8 * BYTES_DESCRITOR + 1, dtype=np.uint16)
+    d2 = d1.copy()
+    if n == 0 or total == 0:
+        return linha, d1, d2
+
+    bloco = min(_BLOCO, total)
+    xor = np.empty((n, bloco), dtype=np.uint64)
+    bits = np.empty((n, bloco), dtype=np.uint8)
+    soma = np.empty((n, bloco), dtype=np.uint16)
+    filas = np.arange(n)
+    for inicio in range(0, total, bloco):
+        w = min(bloco, total - inicio)
+        x, b, s = xor[:, :w], bits[:, :w], soma[:, :w]
+        for palavra in range(_PALAVRAS):
+            np.bitwise_xor(q[:, palavra, None], matriz[palavra, None, inicio:inicio + w], out=x)
+            np.bitwise_count(x, out=b)
+            if palavra == 0:
+                s[...] = b
+            else:
+                np.add(s, b, out=s)
+        # Melhor e segunda melhor do bloco, juntas com as dos blocos anteriores
+        arg = s.argmin(axis=1)
+        m1 = s[filas, arg]
+        s[filas, arg] = np.iinfo(np.uint16).max
+        m2 = s.min(axis=1)
+        melhor = m1 < d1
+        d2 = np.minimum(np.where(melhor, d1, m1), np.minimum(d2, m2))
+        d1 = np.where(melhor, m1, d1)
+        linha = np.where(melhor, arg + inicio, linha)
+    return linha, d1, d2
+
+
+def votar(
+    consulta: np.ndarray,
+    matriz: np.ndarray,
+    dono: np.ndarray,
+    n_imagens: int,
+    distancia_maxima: int,
+    racio: float,
+) -> np.ndarray:
+    """
+    Votos por imagem: descritores da consulta cujo vizinho é bom e claramente melhor
+    que o segundo.
+    """
+    linha, d1, d2 = vizinhos(consulta, matriz)
+    bons = (d1 <= distancia_maxima) & (d1 < racio * d2)
+    return np.bincount(dono[linha[bons]], minlength=n_imagens)
+
+
+class IndiceReconhecimento:
+    """
+    Descritores ORB por imagem e a matriz empacotada usada na pesquisa. As
+    alterações correm numa só thread, por ordem; a pesquisa usa o último pacote
+    publicado, sem lock.
+    """
+
+    def __init__(self, caminho: Path):
+        self.caminho = Path(caminho)
+        self._lock = threading.Lock()
+        self._por_imagem: Dict[str, np.ndarray] = {}
+        # (matriz (4, M) uint64, dono (M,) int32, caminhos)
+        self._pacote: Tuple[np.ndarray, np.ndarray, List[str]] = (
+            np.empty((_PALAVRAS, 0), dtype=np.uint64), np.empty(0, dtype=np.int32), []
+        )
+        # Arrays por trás do pacote, com folga para os uploads seguintes: o pacote
+        # publicado é uma vista das primeiras colunas, que já não mudam
+        self._reserva: Tuple[np.ndarray, np.ndarray] = self._pacote[:2]
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pendentes = 0
+        self._alterado = False
+        self._falhas = 0
+        self._ultimo_erro: Optional[str] = None
+        self._guardado_em: Optional[float] = None
+
+    # ------------------------------------------------------------ alterações
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reconhecimento")
+            return self._pool
+
+    def _submeter(self, fn, *args):
+        with self._lock:
+            self._pendentes += 1
+        self._get_pool().submit(self._correr, fn, *args)
+
+    def _falhou(self, e: Exception):
+        with self._lock:
+            self._falhas += 1
+            self._ultimo_erro = str(e)
+        logger.warning("Falha no índice de reconhecimento: %s", e)
+
+    def _correr(self, fn, *args):
+        try:
+            fn(*args)
+        except Exception as e:
+            self._falhou(e)
+        finally:
+            with self._lock:
+                self._pendentes -= 1
+                guardar = self._pendentes == 0 and self._alterado
+            # Um upload de cada vez guarda logo; um preenchimento guarda no fim
+            if guardar:
+                try:
+                    self.guardar()
+                except Exception as e:
+                    logger.warning("Não foi possível guardar o índice de reconhecimento: %s", e)
+
+    def agendar(self, imagem: Path):
+        """Calcula (em background) os descritores de uma imagem e junta-os ao índice."""
+        self._submeter(self._adicionar, str(imagem))
+
+    def remover(self, imagem: Path):
+        """Tira uma imagem do índice (em background, pela ordem das alterações)."""
+        self._submeter(self._retirar, str(imagem))
+
+    def preencher(self, pasta: Path) -> int:
+        """
+        Junta as imagens de `pasta` que faltam e tira as que já não existem, numa só
+        alteração (a matriz é empacotada uma vez, no fim). Devolve quantas agendou.
+        """
+        existentes = set()
+        if pasta.is_dir():
+            existentes = {
+                str(f) for f in pasta.iterdir()
+                if f.is_file()
+                and f.suffix.lower() in EXTENSOES_IMAGEM
+                and not f.name.startswith(".")
+            }
+        with self._lock:
+            indexadas = set(self._por_imagem)
+        novas = sorted(existentes - indexadas)
+        self._submeter(self._preencher, sorted(indexadas - existentes), novas)
+        return len(novas)
+
+    def _preencher(self, retirar: List[str], novas: List[str]):
+        calculados = {}
+        for imagem in novas:
+            if not os.path.isfile(imagem):
+                continue
+            try:
+                calculados[imagem] = descritores_ficheiro(Path(imagem))
+            except Exception as e:
+                self._falhou(e)
+        with self._lock:
+            for imagem in retirar:
+                self._por_imagem.pop(imagem, None)
+            self._por_imagem.update(calculados)
+            self._empacotar()
+
+    def _adicionar(self, imagem: str):
+        if not os.path.isfile(imagem):
+            return
+        desc = descritores_ficheiro(Path(imagem))
+        with self._lock:
+            substituida = imagem in self._por_imagem
+            self._por_imagem[imagem] = desc
+            if substituida:
+                self._empacotar()
+            else:
+                self._acrescentar(imagem, desc)
+
+    def _retirar(self, imagem: str):
+        with self._lock:
+            if self._por_imagem.pop(imagem, None) is not None:
+                self._empacotar()
+
+    def _acrescentar(self, imagem: str, desc: np.ndarray):
+        """Junta as colunas de uma imagem nova ao fim da matriz. Chamar com _lock."""
+        matriz, dono, caminhos = self._pacote
+        reserva, reserva_dono = self._reserva
+        inicio, fim = matriz.shape[1], matriz.shape[1] + len(desc)
+        if fim > reserva.shape[1]:
+            capacidade = max(2 * fim, _BLOCO)
+            reserva = np.empty((_PALAVRAS, capacidade), dtype=np.uint64)
+            reserva_dono = np.empty(capacidade, dtype=np.int32)
+            reserva[:, :inicio] = matriz
+            reserva_dono[:inicio] = dono
+            self._reserva = (reserva, reserva_dono)
+        reserva[:, inicio:fim] = desc.view(np.uint64).T
+        reserva_dono[inicio:fim] = len(caminhos)
+        self._pacote = (reserva[:, :fim], reserva_dono[:fim], caminhos + [imagem])
+        self._alterado = True
+
+    def _empacotar(self):
+        """Refaz a matriz a partir dos descritores por imagem. Chamar com _lock."""
+        caminhos = list(self._por_imagem)
+        blocos = [self._por_imagem[c] for c in caminhos]
+        if blocos:
+            desc = np.concatenate(blocos)
+            dono = np.repeat(np.arange(len(caminhos), dtype=np.int32), [len(b) for b in blocos])
+        else:
+            desc = np.empty((0, BYTES_DESCRITOR), dtype=np.uint8)
+            dono = np.empty(0, dtype=np.int32)
+        matriz = np.ascontiguousarray(desc.view(np.uint64).T)
+        self._pacote = (matriz, dono, caminhos)
+        self._reserva = (matriz, dono)
+        self._alterado = True
+
+    # ------------------------------------------------------------ disco
+
+    def guardar(self):
+        """Grava o índice (npz) num temporário e troca-o de uma vez."""
+        with self._lock:
+            matriz, dono, caminhos = self._pacote
+            self._alterado = False
+        self.caminho.parent.mkdir(parents=True, exist_ok=True)
+        temporario = self.caminho.with_name(f".{self.caminho.name}.tmp")
+        with open(temporario, "wb") as f:
+            np.savez(
+                f,
+                parametros=_parametros(),
+                descritores=(
+                    np.ascontiguousarray(matriz.T).view(np.uint8).reshape(-1, BYTES_DESCRITOR)
+                ),
+                dono=dono,
+                caminhos=np.array(caminhos, dtype=str),
+            )
+        os.replace(temporario, self.caminho)
+        self._guardado_em = time.time()
+
+    def carregar(self) -> bool:
+        """Lê o índice guardado. False se não existir ou tiver sido feito com outros parâmetros."""
+        if not self.caminho.is_file():
+            return False
+        with np.load(self.caminho) as dados:
+            if not np.array_equal(dados["parametros"], _parametros()):
+                logger.info("Índice de reconhecimento com outros parâmetros: vai ser refeito")
+                return False
+            desc, dono, caminhos = dados["descritores"], dados["dono"], dados["caminhos"].tolist()
+        ordem = np.argsort(dono, kind="stable")
+        limites = np.searchsorted(dono[ordem], np.arange(len(caminhos) + 1))
+        with self._lock:
+            self._por_imagem = {
+                caminho: desc[ordem[limites[i]:limites[i + 1]]]
+                for i, caminho in enumerate(caminhos)
+            }
+            self._empacotar()
+            self._alterado = False
+        return True
+
+    def parar(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    # ------------------------------------------------------------ pesquisa
+
+    def procurar(self, consulta: np.ndarray, k: int) -> List[Tuple[str, float, int]]:
+        """[(caminho da imagem, confiança, votos)] das `k` imagens mais votadas."""
+        matriz, dono, caminhos = self._pacote
+        if not caminhos or len(consulta) == 0:
+            return []
+        votos = votar(
+            consulta, matriz, dono, len(caminhos),
+            settings.ar_distancia_maxima, settings.ar_racio,
+        )
+        k = min(k, len(caminhos))
+        melhores = np.argpartition(-votos, k - 1)[:k]
+        melhores = melhores[np.argsort(-votos[melhores], kind="stable")]
+        return [
+            (caminhos[i], min(float(votos[i]) / len(consulta), 1.0), int(votos[i]))
+            for i in melhores if votos[i] >= _MIN_VOTOS
+        ]
+
+    def stats(self) -> dict:
+        matriz, _, caminhos = self._pacote
+        with self._lock:
+            return {
+                "imagens": len(caminhos),
+                "descritores": int(matriz.shape[1]),
+                "bytes": int(matriz.nbytes),
+                "pendentes": self._pendentes,
+                "falhas": self._falhas,
+                "ultimo_erro": self._ultimo_erro,
+                "guardado_em": self._guardado_em,
+            }
+
+
+indice_ar = IndiceReconhecimento(Path(settings.ar_indice_path))
+
+
+def _artigos_das_imagens(caminhos: List[str]) -> Dict[str, List[dict]]:
+    """Artigos que usam cada imagem (a mesma imagem pode ser de vários artigos)."""
+    if not caminhos:
+        return {}
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            f"""
+            SELECT ID_artigo, Referencia, Designacao, Imagem
+            FROM Artigo
+            WHERE Imagem IN ({', '.join('?' * len(caminhos))})
+            ORDER BY ID_artigo
+            """,
+            caminhos,
+        )
+        rows = cur.fetchall()
+        cur.close()
+    artigos: Dict[str, List[dict]] = {}
+    for row in rows:
+        artigos.setdefault(row[3], []).append({
+            "ID_artigo": row[0],
+            "Referencia": row[1],
+            "Designacao": row[2],
+        })
+    return artigos
+
+
+def _frame(conteudo: bytes) -> np.ndarray:
+    try:
+        return descritores(
+            np.frombuffer(conteudo, dtype=np.uint8), settings.ar_descritores_consulta
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Frame não é uma imagem válida")
+
+
+@router.post("/ar/match")
+async def ar_match(file: UploadFile = File(...), k: int = 5):
+    """
+    Artigos mais parecidos com o frame enviado (JPEG/PNG/WebP), por ordem de confiança
+    (0 a 1: fração dos descritores do frame que encontraram par na imagem do artigo).
+    Imagens sem votos suficientes não aparecem, por isso a lista pode vir vazia.
+    """
+    if k < 1 or k > 50:
+        raise HTTPException(status_code=400, detail="k deve estar entre 1 e 50")
+    inicio = time.perf_counter()
+    conteudo = await file.read()
+    try:
+        consulta = await run_in_threadpool(_frame, conteudo)
+        encontrados = await run_in_threadpool(indice_ar.procurar, consulta, k)
+        artigos = await run_db(_artigos_das_imagens, [caminho for caminho, _, _ in encontrados])
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro no reconhecimento: {str(e)}")
+
+    resultados = []
+    for caminho, confianca, votos in encontrados:
+        # Imagens no disco que já nenhum artigo usa não contam
+        for artigo in artigos.get(caminho, []):
+            resultados.append({
+                **artigo,
+                "confianca": round(confianca, 4),
+                "votos": votos,
+                "image_url": (
+                    f"/imagens/{Path(caminho).name}" if NOME_HASH.match(Path(caminho).name)
+                    else f"/artigos/{artigo['ID_artigo']}/imagem"
+                ),
+            })
+    return {
+        "resultados": resultados[:k],
+        "descritores_frame": len(consulta),
+        "imagens_indexadas": indice_ar.stats()["imagens"],
+        "tempo_ms": round((time.perf_counter() - inicio) * 1000, 1),
+    }
+
+
+@router.get("/ar/indice")
+async def get_indice_ar():
+    """
+    Estado do índice de reconhecimento: imagens, descritores, memória e atualizações
+    pendentes.
+    """
+    return indice_ar.stats()
@@ -0,0 +1,464 @@
+# SERVIDOR/app/replica.py
+"""
+Modo edge: réplica SQLite local das tabelas do ERP (schema de BD_OFFLINE/TABELAS.sql)
+para as leituras de artigos.py e sync.py não atravessarem a WAN. As escritas
+continuam a ir ao SQL Server (get_connection).
+
+A réplica é copiada por inteiro no arranque (ou retomada a partir da versão
+guardada) e depois mantida pelo monitor de alterações: as alterações são aplicadas
+dentro da notificação, antes de o monitor avançar as versões, por isso um ETag
+nunca é servido com dados da réplica mais antigos do que ele. Sem change tracking,
+é copiada de novo a cada REPLICA_INTERVALO segundos.
+
+get_leitura() devolve uma conexão à réplica enquanto ela estiver em dia (atraso até
+REPLICA_ATRASO_MAX segundos) e ao SQL Server caso contrário. O atraso é o tempo desde
+o último momento em que se sabe que a réplica tinha tudo o que estava no SQL Server.
+"""
+import datetime
+import logging
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from .alteracoes import ler_alteracoes, monitor, versao_atual, versao_minima
+from .config import settings
+from .db import CursorMedido, get_connection
+from .formatos import SCHEMA_OFFLINE, converter_linhas
+from .indice_codigos import COLUNAS_CODIGO
+from .leitura import snapshot_disponivel, transacao_snapshot
+from .snapshot import copiar_tabela
+from .tabelas import TABELAS, Tabela
+from .tsql import CursorSQLite
+
+logger = logging.getLogger(__name__)
+
+# PRAGMA user_version da réplica: um ficheiro com outra versão do schema é apagado e copiado de novo
+_VERSAO_ESQUEMA = 1
+
+
+def esquema_replica() -> str:
+    """
+    O schema offline com as colunas de códigos do Artigo em COLLATE NOCASE, porque a
+    collation do SQL Server não distingue maiúsculas: Cod_RFID = ? e IN (...) têm de
+    encontrar na réplica os mesmos artigos (os índices dessas colunas herdam a collation).
+    """
+    esquema = SCHEMA_OFFLINE.read_text(encoding="utf-8-sig")
+    for coluna in COLUNAS_CODIGO:
+        # Estas colunas só existem no ARTIGO
+        esquema, n = re.subn(rf"^(\s+{coluna} TEXT)\b", r"\1 COLLATE NOCASE", esquema, flags=re.M)
+        if n != 1:
+            raise RuntimeError(f"Coluna {coluna} do ARTIGO não encontrada em {SCHEMA_OFFLINE}")
+    return esquema
+
+
+class ConexaoReplica:
+    """Conexão só de leitura à réplica (uma por thread, reutilizada); close() não a fecha."""
+
+    def __init__(self, raw: sqlite3.Connection, consulta: Optional[str]):
+        self._raw = raw
+        self.consulta = consulta
+
+    def cursor(self):
+        return CursorMedido(CursorSQLite(self._raw.cursor()), self.consulta)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        self._raw.rollback()
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class ReplicaLocal:
+    """
+    A réplica num ficheiro SQLite (WAL: as leituras não esperam pelas escritas).
+    Uma conexão de escrita, usada com o lock pela thread da réplica e pelo monitor;
+    uma conexão de leitura por thread.
+    """
+
+    def __init__(self, caminho: Path, intervalo: float, atraso_max: float):
+        self.caminho = Path(caminho)
+        self.intervalo = intervalo
+        self.atraso_max = atraso_max
+        self._lock = threading.Lock()           # uma sincronização de cada vez
+        self._lock_thread = threading.Lock()
+        self._lock_stats = threading.Lock()
+        self._escrita: Optional[sqlite3.Connection] = None
+        self._locais = threading.local()
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self._versao: Optional[int] = None
+        self._em_dia: Optional[float] = None       # time.monotonic()
+        self._atualizada_em: Optional[float] = None  # time.time(), para mostrar
+        self._atrasada = False
+        self._sem_ct = False                    # última cópia feita sem change tracking
+        self._copia_pedida = True
+        self._erro: Optional[str] = None
+        self._registos: Dict[str, int] = {}
+        self._copias = 0
+        self._aplicadas = 0
+        self._leituras = 0
+        self._leituras_primario = 0
+
+    # ------------------------------------------------------------------ ficheiro
+
+    def _abrir_escrita(self) -> sqlite3.Connection:
+        if self._escrita is None:
+            self.caminho.parent.mkdir(parents=True, exist_ok=True)
+            sq = self._ligar_escrita()
+            if sq.execute("PRAGMA user_version").fetchone()[0] != _VERSAO_ESQUEMA:
+                # Ficheiro de uma versão anterior da réplica: recomeça do zero
+                sq.close()
+                for sufixo in ("", "-wal", "-shm"):
+                    Path(f"{self.caminho}{sufixo}").unlink(missing_ok=True)
+                sq = self._ligar_escrita()
+                sq.execute(f"PRAGMA user_version = {_VERSAO_ESQUEMA}")
+            sq.executescript(esquema_replica())
+            # As rotas usam os nomes do SQL Server; só Utilizadores difere mais
+            # do que nas maiúsculas
+            for tabela in TABELAS:
+                if tabela.origem.upper() != tabela.offline.upper():
+                    sq.execute(
+                        f"CREATE VIEW IF NOT EXISTS {tabela.origem} "
+                        f"AS SELECT * FROM {tabela.offline}"
+                    )
+            sq.execute(
+                "CREATE TABLE IF NOT EXISTS REPLICA_META (chave TEXT PRIMARY KEY, valor TEXT)"
+            )
+            self._escrita = sq
+            self._ler_meta(sq)
+        return self._escrita
+
+    def _ligar_escrita(self) -> sqlite3.Connection:
+        sq = sqlite3.connect(self.caminho, check_same_thread=False, isolation_level=None)
+        sq.execute("PRAGMA journal_mode = WAL")
+        sq.execute("PRAGMA synchronous = NORMAL")
+        return sq
+
+    def _ler_meta(self, sq: sqlite3.Connection):
+        """Retoma a réplica que ficou no disco: versão e quando foi posta em dia."""
+        meta = dict(sq.execute("SELECT chave, valor FROM REPLICA_META").fetchall())
+        if "atualizada_em" not in meta:
+            return
+        self._versao = int(meta["versao"]) if meta.get("versao") else None
+        self._sem_ct = self._versao is None
+        self._copia_pedida = False
+        self._atualizada_em = float(meta["atualizada_em"])
+        self._em_dia = time.monotonic() - max(time.time() - self._atualizada_em, 0.0)
+
+    @contextmanager
+    def _transacao(self):
+        sq = self._abrir_escrita()
+        sq.execute("BEGIN IMMEDIATE")
+        try:
+            yield sq
+        except BaseException:
+            sq.execute("ROLLBACK")
+            raise
+        sq.execute("COMMIT")
+
+    def _guardar_meta(self, sq: sqlite3.Connection, versao: Optional[int], lida_em: float):
+        sq.executemany(
+            "INSERT OR REPLACE INTO REPLICA_META (chave, valor) VALUES (?, ?)",
+            [("versao", "" if versao is None else str(versao)), ("atualizada_em", repr(lida_em))],
+        )
+
+    def _marcar_em_dia(self, versao: Optional[int], inicio: float, lida_em: float):
+        self._versao = versao
+        self._em_dia = inicio
+        self._atualizada_em = lida_em
+        self._atrasada = False
+        self._erro = None
+
+    # ------------------------------------------------------------------ sincronização
+
+    def copiar(self) -> Dict[str, int]:
+        """
+        Copia todas as tabelas do SQL Server, numa transação da réplica
+        (as leituras veem a cópia anterior até ao fim).
+        """
+        with self._lock:
+            return self._copiar()
+
+    def _copiar(self) -> Dict[str, int]:
+        inicio, lida_em = time.monotonic(), time.time()
+        registos: Dict[str, int] = {}
+        with get_connection("replica.copia") as conn:
+            cur = conn.cursor()
+            # Todas as tabelas no mesmo ponto no tempo (SNAPSHOT, se a BD o permitir)
+            with transacao_snapshot(cur, snapshot_disponivel()) as versao:
+                with self._transacao() as sq:
+                    for tabela in TABELAS:
+                        sq.execute(f"DELETE FROM {tabela.offline}")
+                        registos[tabela.chave] = copiar_tabela(
+                            cur, sq, tabela, settings.sync_fetch_lote
+                        )
+                    self._guardar_meta(sq, versao, lida_em)
+            cur.close()
+        self._marcar_em_dia(versao, inicio, lida_em)
+        self._sem_ct = versao is None
+        self._copia_pedida = False
+        self._registos = registos
+        self._copias += 1
+        logger.info(
+            "Réplica local copiada em %.1fs (%d linhas, versão %s)",
+            time.monotonic() - inicio, sum(registos.values()), versao,
+        )
+        return registos
+
+    def _aplicar(
+        self,
+        sq: sqlite3.Connection,
+        tabela: Tabela,
+        alterados: List[Dict[str, Any]],
+        removidos: List[Any],
+    ):
+        if removidos:
+            sq.executemany(
+                f"DELETE FROM {tabela.offline} WHERE {tabela.pk} = ?", [(pk,) for pk in removidos]
+            )
+        if alterados:
+            _, linhas = converter_linhas(
+                tabela.offline,
+                tabela.colunas,
+                [[linha[c] for c in tabela.colunas] for linha in alterados],
+            )
+            sq.executemany(
+                f"INSERT OR REPLACE INTO {tabela.offline} ({', '.join(tabela.colunas)}) "
+                f"VALUES ({', '.join('?' * len(tabela.colunas))})",
+                linhas,
+            )
+
+    def atualizar(
+        self, chaves: Optional[Iterable[str]] = None, ate: Optional[int] = None
+    ) -> Dict[str, int]:
+        """
+        Põe a réplica em dia. Com change tracking, aplica as alterações desde a versão
+        da réplica (só das tabelas `chaves`, as alteradas até à versão `ate`, se o
+        SQL Server ainda estiver nessa versão); uma tabela cujo histórico
+        já não cobre essa versão é copiada de novo. Sem change tracking, copia tudo
+        se a última cópia tiver mais de `intervalo` segundos.
+        Devolve as linhas aplicadas por tabela.
+        """
+        with self._lock:
+            self._abrir_escrita()
+            if self._copia_pedida:
+                return self._copiar()
+            inicio, lida_em = time.monotonic(), time.time()
+            try:
+                with get_connection("replica.alteracoes") as conn:
+                    cur = conn.cursor()
+                    nova = versao_atual(cur)
+                    cur.close()
+            except Exception:
+                nova = None
+            if nova is None or self._sem_ct:
+                # Sem change tracking: cópia completa quando a última tiver mais de `intervalo`
+                if self._em_dia is None or time.monotonic() - self._em_dia >= self.intervalo:
+                    return self._copiar()
+                return {}
+            aplicadas: Dict[str, int] = {}
+            if chaves is not None and nova != ate:
+                chaves = None
+            if nova != self._versao:
+                selecionadas = [t for t in TABELAS if chaves is None or t.chave in chaves]
+                with get_connection("replica.alteracoes") as conn:
+                    cur = conn.cursor()
+                    with self._transacao() as sq:
+                        for tabela in selecionadas:
+                            if self._versao < versao_minima(cur, tabela):
+                                # Histórico já limpo: a tabela é copiada de novo
+                                sq.execute(f"DELETE FROM {tabela.offline}")
+                                aplicadas[tabela.chave] = copiar_tabela(
+                                    cur, sq, tabela, settings.sync_fetch_lote
+                                )
+                                continue
+                            alterados, removidos = ler_alteracoes(cur, tabela, self._versao)
+                            self._aplicar(sq, tabela, alterados, removidos)
+                            if alterados or removidos:
+                                aplicadas[tabela.chave] = len(alterados) + len(removidos)
+                        self._guardar_meta(sq, nova, lida_em)
+                    cur.close()
+            self._marcar_em_dia(nova, inicio, lida_em)
+            self._aplicadas += sum(aplicadas.values())
+            return aplicadas
+
+    def ao_alterar(self, alteradas: Dict[str, int], desde: int, ate: int):
+        """
+        Subscritor do monitor: aplica as alterações antes de o monitor avançar as
+        versões (e os ETags). Se falhar, as leituras vão ao SQL Server até a réplica
+        voltar a estar em dia.
+        """
+        if self._thread is None or self._em_dia is None:
+            return
+        try:
+            # Se a réplica já estava na versão anterior do monitor, só mudaram estas tabelas
+            self.atualizar(alteradas if self._versao == desde else None, ate)
+        except Exception as e:
+            self._atrasada = True
+            self._erro = str(e)
+            self._acordar.set()
+            logger.warning("Réplica local não aplicou as alterações %s-%s: %s", desde, ate, e)
+
+    def reconstruir(self):
+        """Pede uma cópia completa (corre na thread da réplica)."""
+        self._copia_pedida = True
+        self._acordar.set()
+
+    # ------------------------------------------------------------------ thread
+
+    def iniciar(self):
+        with self._lock_thread:
+            if self._thread is not None:
+                return
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._loop, name="replica-local", daemon=True)
+            self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+        self._acordar.set()
+        with self._lock_thread:
+            self._thread = None
+        # Se houver uma cópia a meio, a conexão fica para a thread (daemon) acabar
+        if self._lock.acquire(blocking=False):
+            try:
+                if self._escrita is not None:
+                    self._escrita.close()
+                    self._escrita = None
+            finally:
+                self._lock.release()
+
+    def _atras_do_monitor(self) -> bool:
+        """True se o monitor já viu uma versão que a réplica ainda não tem."""
+        versao = monitor.versao
+        if not monitor.saudavel() or versao is None:
+            return False
+        return self._versao is None or self._versao < versao
+
+    def _loop(self):
+        while not self._parar.is_set():
+            try:
+                self.atualizar()
+            except Exception as e:
+                if self._erro != str(e):
+                    logger.warning("Réplica local sem atualizar: %s", e)
+                self._erro = str(e)
+            if self._erro is None and self._atras_do_monitor():
+                # O monitor avançou durante a cópia: aplicar já o que falta
+                continue
+            # Com o monitor a funcionar, a réplica é atualizada por ele;
+            # aqui é só a rede de segurança
+            espera = self.intervalo
+            if self._atrasada or self._erro:
+                espera = min(espera, 30.0)
+            self._acordar.wait(espera)
+            self._acordar.clear()
+
+    # ------------------------------------------------------------------ leituras
+
+    def atraso(self) -> Optional[float]:
+        """Segundos desde o último momento em que a réplica tinha tudo o do SQL Server."""
+        em_dia = self._em_dia
+        if em_dia is None:
+            return None
+        # Sem alterações desde a versão da réplica, ela está em dia até à última
+        # verificação do monitor
+        ultima = monitor.ultima_verificacao
+        sem_alteracoes = monitor.saudavel() and monitor.versao == self._versao
+        if not self._atrasada and ultima is not None and sem_alteracoes:
+            em_dia = max(em_dia, ultima)
+        return max(time.monotonic() - em_dia, 0.0)
+
+    def utilizavel(self) -> bool:
+        # Atrás do monitor, a réplica pode ser mais antiga do que os ETags já servidos
+        if self._thread is None or self._atrasada or self._atras_do_monitor():
+            return False
+        atraso = self.atraso()
+        return atraso is not None and (self.atraso_max <= 0 or atraso <= self.atraso_max)
+
+    def conexao(self, consulta: Optional[str] = None) -> ConexaoReplica:
+        sq = getattr(self._locais, "conexao", None)
+        if sq is None:
+            sq = self._locais.conexao = sqlite3.connect(self.caminho, check_same_thread=False)
+            sq.execute("PRAGMA query_only = ON")
+        return ConexaoReplica(sq, f"replica:{consulta}" if consulta else None)
+
+    def contar_leitura(self, local: bool):
+        with self._lock_stats:
+            if local:
+                self._leituras += 1
+            else:
+                self._leituras_primario += 1
+
+    def saude(self) -> dict:
+        """Resumo para o /health: se as leituras estão a usar a réplica e o atraso."""
+        atraso = self.atraso()
+        return {
+            "em_uso": self.utilizavel(),
+            "atraso_s": None if atraso is None else round(atraso, 1),
+            "versao": self._versao,
+            "erro": self._erro,
+        }
+
+    def stats(self) -> dict:
+        atraso = self.atraso()
+        return {
+            "ativa": self._thread is not None,
+            "em_uso": self.utilizavel(),
+            "caminho": str(self.caminho),
+            "versao": self._versao,
+            "atraso_s": None if atraso is None else round(atraso, 1),
+            "atraso_max_s": self.atraso_max,
+            "atualizada_em": (
+                datetime.datetime.fromtimestamp(self._atualizada_em).isoformat(timespec="seconds")
+                if self._atualizada_em else None
+            ),
+            "erro": self._erro,
+            "copias": self._copias,
+            "alteracoes_aplicadas": self._aplicadas,
+            "registos": self._registos,
+            "leituras": self._leituras,
+            "leituras_sql_server": self._leituras_primario,
+        }
+
+
+replica = ReplicaLocal(
+    Path(settings.replica_path),
+    intervalo=settings.replica_intervalo,
+    atraso_max=settings.replica_atraso_max,
+)
+
+# Antes dos outros subscritores: as caches que eles invalidam podem voltar a ser lidas da réplica
+monitor.subscrever(replica.ao_alterar, primeiro=True)
+
+
+@contextmanager
+def get_leitura(consulta: Optional[str] = None):
+    """
+    Conexão para leituras: a réplica local se estiver ativa e em dia, senão o
+    SQL Server (get_connection). Não usar para escritas nem para o change tracking.
+    """
+    local = replica.utilizavel()
+    if settings.replica_ativa:
+        replica.contar_leitura(local)
+    if local:
+        with replica.conexao(consulta) as conn:
+            yield conn
+        return
+    with get_connection(consulta) as conn:
+        yield conn
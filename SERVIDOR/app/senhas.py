@@ -0,0 +1,105 @@
+# SERVIDOR/app/senhas.py
+"""
+Passwords com scrypt (KDF com custo de memória), calculadas num pool de processos:
+cada verificação gasta dezenas de ms de CPU e ~16 MB de memória, e fora do
+processo da API não bloqueia o event loop nem ocupa os workers do executor da BD.
+
+Formato guardado no campo Password: scrypt$<n>$<r>$<p>$<sal base64>$<hash base64>.
+Um valor sem este prefixo é uma password antiga em texto: continua a ser aceite
+e é trocada pelo hash no login seguinte (ver auth.py).
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+
+from .config import settings
+
+PREFIXO = "scrypt$"
+_BYTES_SAL = 16
+_BYTES_HASH = 32
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _b64(dados: bytes) -> str:
+    return base64.b64encode(dados).decode("ascii")
+
+
+def _scrypt(password: str, sal: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(
+        password.encode("utf-8"), salt=sal, n=n, r=r, p=p,
+        maxmem=256 * n * r + 1024 * 1024, dklen=_BYTES_HASH,
+    )
+
+
+def e_hash(guardado: Optional[str]) -> bool:
+    return bool(guardado) and guardado.startswith(PREFIXO)
+
+
+def gerar_hash(password: str, n: Optional[int] = None, r: int = 8, p: int = 1) -> str:
+    """Hash scrypt com sal aleatório, no formato do campo Password."""
+    n = settings.auth_scrypt_n if n is None else n
+    sal = os.urandom(_BYTES_SAL)
+    return f"{PREFIXO}{n}${r}${p}${_b64(sal)}${_b64(_scrypt(password, sal, n, r, p))}"
+
+
+def verificar(password: str, guardado: Optional[str]) -> Tuple[bool, bool]:
+    """
+    (password certa, o valor guardado deve ser substituído por um hash novo).
+    Substituir: password antiga em texto ou hash com um custo abaixo do atual.
+    """
+    if not guardado:
+        return False, False
+    if not e_hash(guardado):
+        ok = hmac.compare_digest(password.encode("utf-8"), guardado.encode("utf-8"))
+        return ok, ok
+    try:
+        n, r, p, sal, esperado = guardado[len(PREFIXO):].split("$")
+        n, r, p = int(n), int(r), int(p)
+        calculado = _scrypt(password, base64.b64decode(sal), n, r, p)
+        ok = hmac.compare_digest(calculado, base64.b64decode(esperado))
+    except (ValueError, TypeError):
+        return False, False
+    return ok, ok and n < settings.auth_scrypt_n
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # spawn: o processo da API tem threads (pool de conexões, monitor),
+                # e fork com threads não é seguro
+                _pool = ProcessPoolExecutor(
+                    max_workers=settings.auth_hash_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+    return _pool
+
+
+async def verificar_async(password: str, guardado: Optional[str]) -> Tuple[bool, bool]:
+    """verificar() no pool de processos; passwords em texto são comparadas aqui (não há KDF)."""
+    if not e_hash(guardado):
+        return verificar(password, guardado)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_pool(), verificar, password, guardado)
+
+
+async def gerar_hash_async(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_pool(), gerar_hash, password, settings.auth_scrypt_n)
+
+
+def fechar_pool_senhas():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
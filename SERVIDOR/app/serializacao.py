@@ -0,0 +1,63 @@
+# SERVIDOR/app/serializacao.py
+"""
+Serialização JSON rápida (orjson) para as respostas grandes.
+Devolver um RespostaJSON evita o jsonable_encoder do FastAPI, que percorre cada
+valor em Python e é a parte mais lenta de uma resposta com dezenas de milhares de linhas.
+"""
+import time
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import orjson
+from fastapi import Response
+
+from .metricas import serializacao
+from .tracing import somar as somar_traco
+
+
+def _default(value: Any) -> Any:
+    """
+    Tipos que o orjson não conhece. Decimal segue a regra do jsonable_encoder
+    (int se não tiver casas decimais).
+    """
+    if isinstance(value, Decimal):
+        return int(value) if value.as_tuple().exponent >= 0 else float(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.hex()
+    return str(value)
+
+
+def dumps(conteudo: Any) -> bytes:
+    """JSON em bytes (UTF-8). Datas e datetimes saem em ISO 8601, como com isoformat()."""
+    return orjson.dumps(conteudo, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def linhas_para_dicts(colunas: Sequence[str], rows: Iterable) -> List[Dict[str, Any]]:
+    """Linhas do pyodbc -> dicts, sem converter valores (o orjson trata datas e Decimal)."""
+    return [dict(zip(colunas, row)) for row in rows]
+
+
+class RespostaJSON(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        inicio = time.perf_counter()
+        corpo = dumps(content)
+        duracao = time.perf_counter() - inicio
+        serializacao.observar(duracao, "json")
+        somar_traco("ser", duracao)
+        return corpo
+
+
+def json_rapido(
+    conteudo: Any, base: Optional[Response] = None, status_code: int = 200
+) -> RespostaJSON:
+    """
+    Serializa já `conteudo` (chamar no executor, não no event loop).
+    `base` é a Response injetada pelo FastAPI: os headers que as dependências lá
+    puseram (ETag, cursor de paginação) passam para a resposta final.
+    """
+    resposta = RespostaJSON(conteudo, status_code=status_code)
+    if base is not None:
+        resposta.raw_headers.extend(base.raw_headers)
+    return resposta
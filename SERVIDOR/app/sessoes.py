@@ -0,0 +1,196 @@
+# SERVIDOR/app/sessoes.py
+"""
+Tokens de acesso assinados (HMAC-SHA256) emitidos no login e validados sem ir à BD.
+
+Formato: <payload base64url>.<assinatura base64url>, com payload JSON
+{"sub": ID_utilizador, "usr": Username, "iat": emitido, "exp": expira}.
+Os tokens não ficam guardados em lado nenhum; para um utilizador desativado
+deixar de conseguir usar o seu, há uma cache pequena do estado (Ativo) de cada
+utilizador verificado: limpa pelo monitor de alterações quando Utilizadores muda,
+ou ao fim de AUTH_CACHE_TTL segundos se o monitor não estiver a funcionar.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request
+
+from .alteracoes import monitor
+from .config import settings
+from .db import get_connection
+from .executor import run_db
+
+logger = logging.getLogger(__name__)
+
+_segredo: Optional[bytes] = None
+
+
+def _nao_autorizado(detalhe: str) -> HTTPException:
+    return HTTPException(status_code=401, detail=detalhe, headers={"WWW-Authenticate": "Bearer"})
+
+
+def _get_segredo() -> bytes:
+    global _segredo
+    if _segredo is None:
+        if settings.auth_segredo:
+            _segredo = settings.auth_segredo.encode("utf-8")
+        else:
+            # Sem segredo configurado, os tokens deixam de valer quando a API reinicia
+            logger.warning(
+                "AUTH_SEGREDO não definido: a usar um segredo aleatório (só deste processo)"
+            )
+            _segredo = os.urandom(32)
+    return _segredo
+
+
+def _b64(dados: bytes) -> str:
+    return base64.urlsafe_b64encode(dados).rstrip(b"=").decode("ascii")
+
+
+def _de_b64(texto: str) -> bytes:
+    return base64.urlsafe_b64decode(texto + "=" * (-len(texto) % 4))
+
+
+def _assinar(payload: str) -> str:
+    return _b64(hmac.new(_get_segredo(), payload.encode("ascii"), hashlib.sha256).digest())
+
+
+def emitir_token(
+    id_utilizador: int, username: str, validade: Optional[float] = None
+) -> Tuple[str, int]:
+    """(token, expira em epoch segundos)."""
+    agora = int(time.time())
+    expira = agora + int(settings.auth_token_validade if validade is None else validade)
+    dados = json.dumps(
+        {"sub": id_utilizador, "usr": username, "iat": agora, "exp": expira}, separators=(",", ":")
+    )
+    payload = _b64(dados.encode("utf-8"))
+    return f"{payload}.{_assinar(payload)}", expira
+
+
+def validar_token(token: str) -> Dict[str, Any]:
+    """
+    Payload de um token válido.
+
+    Raises:
+        HTTPException 401: token malformado, com assinatura errada ou expirado
+    """
+    try:
+        payload, assinatura = token.split(".")
+        valido = hmac.compare_digest(assinatura, _assinar(payload))
+        dados = json.loads(_de_b64(payload)) if valido else None
+    except (ValueError, TypeError):
+        dados = None
+    if not isinstance(dados, dict) or not isinstance(dados.get("sub"), int):
+        raise _nao_autorizado("Token inválido")
+    if dados.get("exp", 0) < time.time():
+        raise _nao_autorizado("Token expirado")
+    return dados
+
+
+class CacheUtilizadores:
+    """
+    Utilizadores já verificados: ID -> (dados ou None se inativo/inexistente, lido em).
+    revogar(id) força nova leitura; revogar() limpa tudo.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entradas: Dict[int, Tuple[Optional[Dict[str, Any]], float]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def obter(self, id_utilizador: int) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """(encontrado na cache, dados). Com o monitor a funcionar, as entradas não expiram."""
+        with self._lock:
+            entrada = self._entradas.get(id_utilizador)
+            if entrada and (monitor.saudavel() or time.monotonic() - entrada[1] < self.ttl):
+                self.hits += 1
+                return True, entrada[0]
+            self.misses += 1
+            return False, None
+
+    def guardar(self, id_utilizador: int, dados: Optional[Dict[str, Any]]):
+        with self._lock:
+            self._entradas[id_utilizador] = (dados, time.monotonic())
+
+    def revogar(self, id_utilizador: Optional[int] = None) -> int:
+        with self._lock:
+            if id_utilizador is None:
+                n = len(self._entradas)
+                self._entradas.clear()
+                return n
+            return 1 if self._entradas.pop(id_utilizador, None) else 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "utilizadores": len(self._entradas), "ttl": self.ttl,
+                "hits": self.hits, "misses": self.misses,
+            }
+
+
+cache_utilizadores = CacheUtilizadores(settings.auth_cache_ttl)
+
+
+def dados_utilizador(row) -> Dict[str, Any]:
+    """
+    Utilizador para as respostas (sem a password), a partir de
+    (ID, Nome, Email, Username, ..., Ativo).
+    """
+    return {
+        "ID_utilizador": row[0], "Nome": row[1], "Email": row[2], "Username": row[3],
+        "Ativo": row[-1],
+    }
+
+
+def _ler_utilizador(id_utilizador: int) -> Optional[Dict[str, Any]]:
+    with get_connection("auth.utilizador") as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT ID_utilizador, Nome, Email, Username, Ativo
+            FROM Utilizadores
+            WHERE ID_utilizador = ? AND Ativo = 1
+        """, (id_utilizador,))
+        row = cur.fetchone()
+        cur.close()
+    return dados_utilizador(row) if row else None
+
+
+def _ao_alterar(alteradas: Dict[str, int], desde: int, ate: int):
+    # Poucos utilizadores e alterações raras: limpar tudo sai mais simples do que ler o delta
+    if "utilizadores" in alteradas:
+        cache_utilizadores.revogar()
+
+
+monitor.subscrever(_ao_alterar)
+
+
+def _token_do_pedido(request: Request) -> str:
+    autorizacao = request.headers.get("authorization", "")
+    esquema, _, token = autorizacao.partition(" ")
+    if esquema.lower() != "bearer" or not token:
+        raise _nao_autorizado("Autenticação necessária")
+    return token.strip()
+
+
+async def utilizador_atual(request: Request) -> Dict[str, Any]:
+    """
+    Dependência para rotas autenticadas (Authorization: Bearer <token>): o token é
+    validado sem BD; o estado do utilizador vem da cache (só vai à BD num miss).
+    """
+    dados = validar_token(_token_do_pedido(request))
+    encontrado, utilizador = cache_utilizadores.obter(dados["sub"])
+    if not encontrado:
+        utilizador = await run_db(_ler_utilizador, dados["sub"])
+        cache_utilizadores.guardar(dados["sub"], utilizador)
+    if utilizador is None:
+        raise _nao_autorizado("Utilizador inativo")
+    return utilizador
@@ -0,0 +1,352 @@
+# SERVIDOR/app/snapshot.py
+"""
+Snapshot SQLite para o primeiro arranque da app: uma BD offline já preenchida
+(schema de BD_OFFLINE/TABELAS.sql), construída em background e servida comprimida.
+
+O snapshot guarda a versão do change tracking lida ANTES das tabelas; a app
+continua a partir daí com /sync/changes?since=<versao>. Alterações feitas durante
+a construção podem vir repetidas nesse delta, o que é inofensivo (são upserts).
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse
+
+from .alteracoes import monitor, versao_atual
+from .config import settings
+from .db import get_connection
+from .formatos import SCHEMA_OFFLINE, converter_linhas
+from .leitura import snapshot_disponivel, transacao_snapshot
+from .tabelas import TABELAS, Tabela
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MEDIA_TYPE = "application/gzip"
+
+
+def copiar_tabela(cur, sq: sqlite3.Connection, tabela: Tabela, lote: int = 1000) -> int:
+    """
+    Copia uma tabela do SQL Server (cursor `cur`) para a tabela offline na BD SQLite
+    `sq`, em lotes de `lote` linhas convertidas para os tipos offline. Devolve o número de linhas.
+    """
+    cur.execute(f"SELECT {', '.join(tabela.colunas)} FROM {tabela.origem}")
+    insert = (
+        f"INSERT INTO {tabela.offline} ({', '.join(tabela.colunas)}) "
+        f"VALUES ({', '.join('?' * len(tabela.colunas))})"
+    )
+    total = 0
+    while True:
+        rows = cur.fetchmany(lote)
+        if not rows:
+            break
+        _, linhas = converter_linhas(tabela.offline, tabela.colunas, rows)
+        sq.executemany(insert, linhas)
+        total += len(linhas)
+    return total
+
+
+def construir_ficheiro(pasta: Path, lote: int = 1000) -> Dict[str, Any]:
+    """
+    Lê todas as tabelas do SQL Server para uma BD SQLite nova e comprime-a em
+    `pasta`/armazem-<id>.sqlite.gz. Devolve a informação do snapshot (também
+    gravada ao lado, em armazem-<id>.json).
+    """
+    pasta.mkdir(parents=True, exist_ok=True)
+    inicio = time.monotonic()
+    criado_em = datetime.now()
+    temporario = pasta / f".construcao-{os.getpid()}-{threading.get_ident()}.sqlite"
+    temporario.unlink(missing_ok=True)
+
+    sq = sqlite3.connect(temporario)
+    try:
+        sq.execute("PRAGMA journal_mode = OFF")
+        sq.execute("PRAGMA synchronous = OFF")
+        sq.executescript(SCHEMA_OFFLINE.read_text(encoding="utf-8-sig"))
+        registos: Dict[str, int] = {}
+        with get_connection() as conn:
+            cur = conn.cursor()
+            # Todas as tabelas no mesmo ponto no tempo (SNAPSHOT, se a BD o permitir)
+            with transacao_snapshot(cur, snapshot_disponivel()) as versao:
+                for tabela in TABELAS:
+                    registos[tabela.chave] = copiar_tabela(cur, sq, tabela, lote)
+            cur.close()
+        sq.execute(
+            "INSERT INTO SYNC_LOG (ultima_sync, total_registos, sucesso) VALUES (?, ?, 1)",
+            (criado_em.isoformat(), sum(registos.values())),
+        )
+        sq.commit()
+        sq.execute("ANALYZE")
+        sq.commit()
+    finally:
+        sq.close()
+
+    ident = str(versao) if versao is not None else criado_em.strftime("t%Y%m%d%H%M%S")
+    nome = f"armazem-{ident}.sqlite.gz"
+    comprimido = temporario.with_suffix(".sqlite.gz")
+    sha256 = hashlib.sha256()
+    try:
+        with open(temporario, "rb") as origem, open(comprimido, "wb") as bruto:
+            with gzip.GzipFile(
+                filename=f"armazem-{ident}.sqlite", mode="wb", fileobj=bruto, mtime=0
+            ) as destino:
+                shutil.copyfileobj(origem, destino, 1024 * 1024)
+            bruto.flush()
+            os.fsync(bruto.fileno())
+        with open(comprimido, "rb") as f:
+            for bloco in iter(lambda: f.read(1024 * 1024), b""):
+                sha256.update(bloco)
+        os.replace(comprimido, pasta / nome)
+    finally:
+        temporario.unlink(missing_ok=True)
+        comprimido.unlink(missing_ok=True)
+
+    info = {
+        "id": ident,
+        "versao": versao,
+        "ficheiro": nome,
+        "tamanho": (pasta / nome).stat().st_size,
+        "sha256": sha256.hexdigest(),
+        "criado_em": criado_em.isoformat(),
+        "duracao_s": round(time.monotonic() - inicio, 2),
+        "registos": registos,
+    }
+    (pasta / f"armazem-{ident}.json").write_text(json.dumps(info), encoding="utf-8")
+    return info
+
+
+class ConstrutorSnapshot:
+    """
+    Thread que reconstrói o snapshot quando o monitor vê alterações (no máximo uma
+    vez a cada `intervalo_min` segundos) e, de qualquer forma, a cada `intervalo`.
+    Mantém os `manter` snapshots mais recentes, para não cortar downloads a meio.
+    """
+
+    def __init__(self, pasta: Path, intervalo: float, intervalo_min: float, manter: int):
+        self.pasta = Path(pasta)
+        self.intervalo = intervalo
+        self.intervalo_min = intervalo_min
+        self.manter = max(manter, 1)
+        self._lock = threading.Lock()          # uma construção de cada vez
+        self._lock_thread = threading.Lock()
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._atual: Optional[Dict[str, Any]] = None
+        self._pendente = True
+        self._forcar = False
+        self._ultima_construcao: Optional[float] = None
+        self._erro: Optional[str] = None
+
+    @property
+    def atual(self) -> Optional[Dict[str, Any]]:
+        return self._atual
+
+    def caminho(self, ident: str) -> Optional[Path]:
+        """Ficheiro de um snapshot ainda guardado, ou None."""
+        if not ident or "/" in ident or "\\" in ident or ident.startswith("."):
+            return None
+        caminho = self.pasta / f"armazem-{ident}.sqlite.gz"
+        return caminho if caminho.is_file() else None
+
+    def carregar_existente(self):
+        """No arranque, serve logo o snapshot mais recente que estiver no disco."""
+        infos = []
+        for ficheiro in self.pasta.glob("armazem-*.json"):
+            try:
+                info = json.loads(ficheiro.read_text(encoding="utf-8"))
+            except Exception:
+                continue
+            if (self.pasta / info.get("ficheiro", "")).is_file():
+                infos.append(info)
+        if infos:
+            self._atual = max(infos, key=lambda i: i["criado_em"])
+
+    def construir(self) -> Dict[str, Any]:
+        with self._lock:
+            anterior = self._atual
+            versao = None
+            try:
+                with get_connection() as conn:
+                    cur = conn.cursor()
+                    versao = versao_atual(cur)
+                    cur.close()
+            except Exception:
+                pass
+            if anterior is not None and versao is not None and anterior.get("versao") == versao:
+                # Nada mudou desde o último snapshot
+                self._ultima_construcao = time.monotonic()
+                return anterior
+            info = construir_ficheiro(self.pasta, settings.sync_fetch_lote)
+            self._atual = info
+            self._ultima_construcao = time.monotonic()
+            self._erro = None
+            self._limpar()
+            logger.info(
+                "Snapshot %s construído em %.1fs (%d bytes)",
+                info["id"], info["duracao_s"], info["tamanho"],
+            )
+            return info
+
+    def pedir(self, forcar: bool = False):
+        """Pede uma reconstrução (respeitando intervalo_min, a não ser que `forcar`)."""
+        self._pendente = True
+        self._forcar = self._forcar or forcar
+        self._acordar.set()
+
+    def iniciar(self):
+        with self._lock_thread:
+            if self._thread is not None:
+                return
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._loop, name="snapshot-sqlite", daemon=True)
+            self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+        self._acordar.set()
+        with self._lock_thread:
+            self._thread = None
+
+    def _loop(self):
+        while not self._parar.is_set():
+            agora = time.monotonic()
+            ultima = self._ultima_construcao
+            espera = self.intervalo
+            if ultima is None:
+                espera = 0
+            elif self._pendente:
+                espera = 0 if self._forcar else max(0.0, ultima + self.intervalo_min - agora)
+            elif agora - ultima < self.intervalo:
+                espera = ultima + self.intervalo - agora
+            else:
+                espera = 0
+
+            if espera > 0:
+                self._acordar.wait(espera)
+                self._acordar.clear()
+                continue
+
+            self._pendente = False
+            self._forcar = False
+            try:
+                self.construir()
+            except Exception as e:
+                self._erro = str(e)
+                self._ultima_construcao = time.monotonic()
+                self._pendente = True  # nova tentativa depois de intervalo_min
+                logger.warning("Falha ao construir o snapshot SQLite: %s", e)
+
+    def _limpar(self):
+        """Apaga os snapshots mais antigos, mantendo os `manter` mais recentes."""
+        infos = []
+        for ficheiro in self.pasta.glob("armazem-*.json"):
+            try:
+                criado_em = json.loads(ficheiro.read_text(encoding="utf-8"))["criado_em"]
+                infos.append((criado_em, ficheiro))
+            except Exception:
+                continue
+        infos.sort(reverse=True)
+        for _, ficheiro in infos[self.manter:]:
+            ident = ficheiro.name[len("armazem-"):-len(".json")]
+            (self.pasta / f"armazem-{ident}.sqlite.gz").unlink(missing_ok=True)
+            ficheiro.unlink(missing_ok=True)
+
+    def stats(self) -> dict:
+        return {
+            "ativo": self._thread is not None,
+            "atual": self._atual,
+            "pendente": self._pendente,
+            "erro": self._erro,
+        }
+
+
+construtor = ConstrutorSnapshot(
+    Path(settings.snapshot_dir),
+    intervalo=settings.snapshot_intervalo,
+    intervalo_min=settings.snapshot_intervalo_min,
+    manter=settings.snapshot_manter,
+)
+
+
+def _ao_alterar(alteradas: Dict[str, int], desde: int, ate: int):
+    construtor.pedir()
+
+
+monitor.subscrever(_ao_alterar)
+
+
+# ---------------------------------------------------------------- endpoints
+
+def _snapshot_atual() -> Dict[str, Any]:
+    info = construtor.atual
+    if info is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Snapshot ainda não disponível",
+            headers={"Retry-After": "30"},
+        )
+    return info
+
+
+def _resposta_ficheiro(info: Dict[str, Any], caminho: Path, cache_control: str) -> FileResponse:
+    return FileResponse(
+        caminho,
+        media_type=SNAPSHOT_MEDIA_TYPE,
+        filename=info["ficheiro"],
+        headers={
+            "Cache-Control": cache_control,
+            "X-Snapshot-Id": info["id"],
+            "X-Snapshot-Versao": "" if info["versao"] is None else str(info["versao"]),
+            "X-Snapshot-Sha256": info["sha256"],
+        },
+    )
+
+
+@router.get("/sync/snapshot/info")
+async def get_snapshot_info():
+    """Informação do snapshot atual: id, versão do change tracking, tamanho e sha256."""
+    info = _snapshot_atual()
+    return {**info, "url": f"/sync/snapshot/{info['id']}"}
+
+
+@router.get("/sync/snapshot")
+async def get_snapshot():
+    """
+    Descarrega o snapshot atual (SQLite comprimido com gzip). Aceita Range / If-Range.
+    Para retomar um download use o URL com o id (/sync/snapshot/{id}), que não muda.
+    """
+    info = _snapshot_atual()
+    caminho = construtor.caminho(info["id"])
+    if caminho is None:
+        raise HTTPException(
+            status_code=503, detail="Snapshot ainda não disponível", headers={"Retry-After": "30"}
+        )
+    return _resposta_ficheiro(info, caminho, "no-cache")
+
+
+@router.get("/sync/snapshot/{ident}")
+async def get_snapshot_por_id(ident: str):
+    """Descarrega um snapshot específico (imutável), enquanto ainda estiver guardado."""
+    caminho = construtor.caminho(ident)
+    nao_encontrado = HTTPException(
+        status_code=404, detail="Snapshot não encontrado (pode já ter sido substituído)"
+    )
+    if caminho is None:
+        raise nao_encontrado
+    try:
+        info = json.loads(caminho.with_name(f"armazem-{ident}.json").read_text(encoding="utf-8"))
+    except Exception:
+        raise nao_encontrado
+    return _resposta_ficheiro(info, caminho, "public, max-age=31536000, immutable")
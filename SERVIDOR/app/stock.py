@@ -0,0 +1,418 @@
+# SERVIDOR/app/stock.py
+"""
+Stock por artigo, armazém e localização (Zona / Corredor / Prateleira / Rack),
+mantido em memória a partir dos Movimentos.
+
+O histórico é lido uma vez no arranque; depois só se aplicam os movimentos
+inseridos, alterados ou apagados que o change tracking reporta. Cada movimento
+guarda o que contribuiu para o saldo, por isso aplicar o mesmo movimento duas
+vezes (ou uma alteração de quantidades ou localização) acerta o saldo em vez de
+o somar outra vez.
+"""
+import logging
+import threading
+import time
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, Response
+
+from .alteracoes import monitor, versao_atual, versao_minima
+from .config import settings
+from .db import get_connection
+from .etag import condicional
+from .executor import em_executor
+from .leitura import snapshot_disponivel, transacao_snapshot
+from .paginacao import Pagina, pagina
+from .serializacao import json_rapido
+from .tabelas import POR_CHAVE
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+COLUNAS_LOCALIZACAO = ("Zona", "NCorredor", "DCorredor", "NPrateleira", "DPrateleira", "Rack")
+_COLUNAS_MOVIMENTO = (
+    ("ID_movimento", "ID_artigo", "ID_armazem", "Qtd_entrada", "Qtd_saida") + COLUNAS_LOCALIZACAO
+)
+AGRUPAMENTOS = ("artigo", "armazem", "localizacao")
+
+# Mais alterações do que isto de uma vez: sai mais barato reler tudo
+_MAX_ALTERACOES = 10000
+
+_ZERO = Decimal(0)
+
+# (ID_armazem, Zona, NCorredor, DCorredor, NPrateleira, DPrateleira, Rack)
+Lugar = Tuple[Any, ...]
+
+
+def _quantidade(valor: Any) -> Decimal:
+    if valor is None:
+        return _ZERO
+    if isinstance(valor, Decimal):
+        return valor
+    if isinstance(valor, float):
+        # repr evita trazer o erro binário do float para o saldo
+        return Decimal(repr(valor))
+    return Decimal(valor)
+
+
+def _numero(valor: Decimal) -> Any:
+    """Saldo para a resposta: inteiro se não tiver casas decimais."""
+    return int(valor) if valor == valor.to_integral_value() else float(valor)
+
+
+def _texto_lugar(valor: Any) -> Any:
+    if isinstance(valor, str):
+        valor = valor.strip()
+        return valor or None
+    return valor
+
+
+def _ordem(valor: Any) -> list:
+    # None primeiro; em lista para poder ir no cursor de paginação (JSON)
+    return [valor is not None, valor]
+
+
+class _Saldo:
+    __slots__ = ("entradas", "saidas", "movimentos")
+
+    def __init__(self):
+        self.entradas = _ZERO
+        self.saidas = _ZERO
+        self.movimentos = 0
+
+    @property
+    def saldo(self) -> Decimal:
+        return self.entradas - self.saidas
+
+    def somar(self, entrada: Decimal, saida: Decimal, sinal: int):
+        self.entradas += sinal * entrada
+        self.saidas += sinal * saida
+        self.movimentos += sinal
+
+    def juntar(self, outro: "_Saldo"):
+        self.entradas += outro.entradas
+        self.saidas += outro.saidas
+        self.movimentos += outro.movimentos
+
+    def copia(self) -> "_Saldo":
+        novo = _Saldo()
+        novo.juntar(self)
+        return novo
+
+    def resposta(self) -> Dict[str, Any]:
+        return {
+            "saldo": _numero(self.saldo),
+            "entradas": _numero(self.entradas),
+            "saidas": _numero(self.saidas),
+            "movimentos": self.movimentos,
+        }
+
+
+class MotorStock:
+    """
+    Saldos por artigo -> (armazém + localização), e a contribuição de cada movimento.
+    As escritas e as leituras usam o mesmo lock; as leituras só copiam um artigo
+    ou percorrem os saldos, sem ir à BD.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._saldos: Dict[int, Dict[Lugar, _Saldo]] = {}
+        # ID_movimento -> (ID_artigo, lugar, entrada, saída)
+        self._movimentos: Dict[int, Tuple[int, Lugar, Decimal, Decimal]] = {}
+        self._versao: Optional[int] = None
+        self._atualizado_em: Optional[float] = None
+
+    @property
+    def construido(self) -> bool:
+        return self._atualizado_em is not None
+
+    @property
+    def versao(self) -> Optional[int]:
+        return self._versao
+
+    def idade(self) -> Optional[float]:
+        if self._atualizado_em is None:
+            return None
+        return time.monotonic() - self._atualizado_em
+
+    def carregar(self, movimentos: Iterable[Sequence[Any]], versao: Optional[int]):
+        """Recalcula tudo a partir de todos os movimentos (linhas em _COLUNAS_MOVIMENTO)."""
+        saldos: Dict[int, Dict[Lugar, _Saldo]] = {}
+        contribuicoes: Dict[int, Tuple[int, Lugar, Decimal, Decimal]] = {}
+        for row in movimentos:
+            self._somar(saldos, contribuicoes, row)
+        with self._lock:
+            self._saldos = saldos
+            self._movimentos = contribuicoes
+            self._versao = versao
+            self._atualizado_em = time.monotonic()
+
+    def aplicar(
+        self, alterados: Iterable[Sequence[Any]], removidos: Iterable[int], versao: Optional[int]
+    ):
+        """Aplica movimentos inseridos/alterados (upsert) e apagados."""
+        with self._lock:
+            for id_movimento in removidos:
+                self._retirar(id_movimento)
+            for row in alterados:
+                self._retirar(row[0])
+                self._somar(self._saldos, self._movimentos, row)
+            self._versao = versao
+            self._atualizado_em = time.monotonic()
+
+    def artigo(self, id_artigo: int, incluir_zeros: bool = False) -> Dict[str, Any]:
+        """Stock de um artigo: total e, por armazém, o saldo de cada localização."""
+        with self._lock:
+            lugares = [(lugar, s.copia()) for lugar, s in self._saldos.get(id_artigo, {}).items()]
+
+        total = _Saldo()
+        armazens: Dict[Any, Tuple[_Saldo, List[Dict[str, Any]]]] = {}
+        ordenados = sorted(
+            lugares, key=lambda item: [item[0][0]] + [_ordem(v) for v in item[0][1:]]
+        )
+        for lugar, saldo in ordenados:
+            total.juntar(saldo)
+            do_armazem, localizacoes = armazens.setdefault(lugar[0], (_Saldo(), []))
+            do_armazem.juntar(saldo)
+            if incluir_zeros or saldo.saldo != _ZERO:
+                localizacoes.append(
+                    {**dict(zip(COLUNAS_LOCALIZACAO, lugar[1:])), **saldo.resposta()}
+                )
+
+        return {
+            "ID_artigo": id_artigo,
+            **total.resposta(),
+            "armazens": [
+                {"ID_armazem": id_armazem, **saldo.resposta(), "localizacoes": localizacoes}
+                for id_armazem, (saldo, localizacoes) in armazens.items()
+                if incluir_zeros or saldo.saldo != _ZERO
+            ],
+            "versao": self._versao,
+        }
+
+    def linhas(
+        self,
+        agrupar: str = "armazem",
+        id_armazem: Optional[int] = None,
+        incluir_zeros: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """
+        Saldos de todos os artigos, por artigo, por artigo e armazém ou por
+        localização, ordenados pela chave do agrupamento (ver chave_linha).
+        """
+        with self._lock:
+            copia = [
+                (id_artigo, lugar, s.copia())
+                for id_artigo, lugares in self._saldos.items()
+                for lugar, s in lugares.items()
+                if id_armazem is None or lugar[0] == id_armazem
+            ]
+
+        grupos: Dict[tuple, Tuple[Dict[str, Any], _Saldo]] = {}
+        for id_artigo, lugar, saldo in copia:
+            if agrupar == "artigo":
+                chave, campos = (id_artigo,), {"ID_artigo": id_artigo}
+            elif agrupar == "armazem":
+                chave = (id_artigo, lugar[0])
+                campos = {"ID_artigo": id_artigo, "ID_armazem": lugar[0]}
+            else:
+                chave = (id_artigo,) + lugar
+                campos = {
+                    "ID_artigo": id_artigo, "ID_armazem": lugar[0],
+                    **dict(zip(COLUNAS_LOCALIZACAO, lugar[1:])),
+                }
+            _, soma = grupos.setdefault(chave, (campos, _Saldo()))
+            soma.juntar(saldo)
+
+        resultado = [
+            {**campos, **soma.resposta()}
+            for campos, soma in grupos.values()
+            if incluir_zeros or soma.saldo != _ZERO
+        ]
+        resultado.sort(key=lambda linha: chave_linha(linha, agrupar))
+        return resultado
+
+    def stats(self) -> dict:
+        idade = self.idade()
+        return {
+            "construido": self.construido,
+            "versao": self._versao,
+            "artigos": len(self._saldos),
+            "localizacoes": sum(len(lugares) for lugares in self._saldos.values()),
+            "movimentos": len(self._movimentos),
+            "idade_s": round(idade, 1) if idade is not None else None,
+        }
+
+    @staticmethod
+    def _somar(saldos, contribuicoes, row: Sequence[Any]):
+        id_movimento, id_artigo, id_armazem, entrada, saida = row[:5]
+        lugar = (id_armazem,) + tuple(_texto_lugar(v) for v in row[5:])
+        entrada, saida = _quantidade(entrada), _quantidade(saida)
+        lugares = saldos.setdefault(id_artigo, {})
+        saldo = lugares.get(lugar)
+        if saldo is None:
+            saldo = lugares[lugar] = _Saldo()
+        saldo.somar(entrada, saida, 1)
+        contribuicoes[id_movimento] = (id_artigo, lugar, entrada, saida)
+
+    def _retirar(self, id_movimento: int):
+        anterior = self._movimentos.pop(id_movimento, None)
+        if anterior is None:
+            return
+        id_artigo, lugar, entrada, saida = anterior
+        lugares = self._saldos[id_artigo]
+        saldo = lugares[lugar]
+        saldo.somar(entrada, saida, -1)
+        if saldo.movimentos == 0:
+            del lugares[lugar]
+            if not lugares:
+                del self._saldos[id_artigo]
+
+
+def chave_linha(linha: Dict[str, Any], agrupar: str) -> list:
+    """Chave de ordenação (e do cursor de paginação) de uma linha de MotorStock.linhas."""
+    if agrupar == "artigo":
+        return [linha["ID_artigo"]]
+    if agrupar == "armazem":
+        return [linha["ID_artigo"], linha["ID_armazem"]]
+    localizacao = [_ordem(linha[c]) for c in COLUNAS_LOCALIZACAO]
+    return [linha["ID_artigo"], linha["ID_armazem"]] + localizacao
+
+
+motor = MotorStock()
+_sincronizacao = threading.Lock()
+
+
+def construir_stock():
+    """Relê todos os movimentos e recalcula o stock."""
+    with _sincronizacao:
+        _construir()
+    logger.info("Stock calculado: %s", motor.stats())
+
+
+def _construir():
+    with get_connection() as conn:
+        cur = conn.cursor()
+        # Versão e movimentos do mesmo ponto no tempo; sem SNAPSHOT, a versão é lida
+        # antes e o que mudar entretanto é reaplicado (sem efeito) no delta seguinte
+        with transacao_snapshot(cur, snapshot_disponivel()) as versao:
+            cur.execute(f"SELECT {', '.join(_COLUNAS_MOVIMENTO)} FROM dbo.Movimentos")
+            linhas: list = []
+            while True:
+                rows = cur.fetchmany(settings.sync_fetch_lote)
+                if not rows:
+                    break
+                linhas.extend(rows)
+        cur.close()
+    motor.carregar(linhas, versao)
+
+
+def sincronizar_stock():
+    """
+    Aplica os movimentos alterados desde a versão do stock. Relê tudo se ainda não
+    houver stock, se não houver change tracking ou se o histórico já não cobrir essa versão.
+    """
+    with _sincronizacao:
+        desde = motor.versao
+        if desde is None:
+            _construir()
+            return
+        colunas = ", ".join(f"t.{c}" for c in _COLUNAS_MOVIMENTO)
+        with get_connection() as conn:
+            cur = conn.cursor()
+            nova = versao_atual(cur)
+            if desde > nova or desde < versao_minima(cur, POR_CHAVE["movimentos"]):
+                alteracoes = None
+            else:
+                cur.execute(f"""
+                    SELECT ct.SYS_CHANGE_OPERATION, ct.ID_movimento, {colunas}
+                    FROM CHANGETABLE(CHANGES dbo.Movimentos, ?) AS ct
+                    LEFT JOIN dbo.Movimentos AS t ON t.ID_movimento = ct.ID_movimento
+                """, (desde,))
+                alteracoes = cur.fetchall()
+            cur.close()
+
+        if alteracoes is None or len(alteracoes) > _MAX_ALTERACOES:
+            _construir()
+            return
+        # Um movimento alterado e depois apagado aparece sem dados no JOIN
+        removidos = [row[1] for row in alteracoes if row[0] == 'D' or row[2] is None]
+        alterados = [row[2:] for row in alteracoes if row[0] != 'D' and row[2] is not None]
+        motor.aplicar(alterados, removidos, nova)
+
+
+def _ao_alterar(alteradas: Dict[str, int], desde: int, ate: int):
+    """Aplica os movimentos novos assim que o monitor os deteta."""
+    if "movimentos" in alteradas and motor.construido:
+        sincronizar_stock()
+
+
+monitor.subscrever(_ao_alterar)
+
+
+def _stock_fresco() -> bool:
+    if not motor.construido:
+        return False
+    return monitor.saudavel() or motor.idade() < settings.stock_max_idade
+
+
+def _stock_atualizado() -> MotorStock:
+    """O motor, posto em dia se o monitor não o estiver a manter."""
+    if not _stock_fresco():
+        sincronizar_stock()
+    return motor
+
+
+# ---------------------------------------------------------------- endpoints
+
+_ETAG_STOCK = condicional("movimentos")
+
+
+@router.get("/stock", dependencies=[Depends(_ETAG_STOCK)])
+@em_executor
+def get_stock(
+    agrupar: str = "armazem",
+    id_armazem: Optional[int] = None,
+    incluir_zeros: bool = False,
+    pag: Pagina = Depends(pagina),
+):
+    """
+    Stock de todos os artigos, calculado a partir dos movimentos.
+    `agrupar`: artigo, armazem (artigo + armazém) ou localizacao
+    (artigo + armazém + Zona / Corredor / Prateleira / Rack).
+    Por omissão só aparecem saldos diferentes de zero.
+    """
+    if agrupar not in AGRUPAMENTOS:
+        raise HTTPException(
+            status_code=400, detail=f"agrupar deve ser um de: {', '.join(AGRUPAMENTOS)}"
+        )
+    try:
+        linhas = _stock_atualizado().linhas(agrupar, id_armazem, incluir_zeros)
+        n_chaves = {"artigo": 1, "armazem": 2}.get(agrupar, 2 + len(COLUNAS_LOCALIZACAO))
+        linhas = pag.fatiar(linhas, lambda linha: chave_linha(linha, agrupar), n_chaves)
+        return json_rapido(linhas, pag.response)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao calcular stock: {str(e)}")
+
+
+@router.get("/stock/estado")
+async def get_stock_estado():
+    """Estado do cálculo de stock (versão, número de movimentos e localizações, idade)."""
+    return {**motor.stats(), "fresco": _stock_fresco()}
+
+
+@router.get("/stock/{id_artigo}", dependencies=[Depends(_ETAG_STOCK)])
+@em_executor
+def get_stock_artigo(response: Response, id_artigo: int, incluir_zeros: bool = False):
+    """
+    Stock de um artigo: total e, por armazém, o saldo de cada localização.
+    Um artigo sem movimentos tem saldo 0 e nenhum armazém.
+    """
+    try:
+        return json_rapido(_stock_atualizado().artigo(id_artigo, incluir_zeros), response)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao calcular stock: {str(e)}")
@@ -1,91 +1,103 @@
 # SERVIDOR/app/sync.py
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from typing import Optional
 from .db import get_connection
+from .executor import em_executor
+from .paginacao import Pagina, pagina
+from .replica import get_leitura
+from .tabelas import TABELAS, POR_CHAVE
+from .alteracoes import alteracoes_desde
+from .cache import obter_referencia
+from .etag import condicional
+from .serializacao import json_rapido
+from .formatos import escolher_formato, resposta_compacta, tabela_compacta
 
 router = APIRouter()
 
-@router.get("/sync/tipos")
-def sync_tipos():
+
+def _compacta(compacto, chave: str, rows, pag: Pagina):
+    """Resposta em ?formato=colunas|linhas|msgpack (ver formatos.py) para a tabela `chave`."""
+    tabela = POR_CHAVE[chave]
+    if rows and isinstance(rows[0], dict):
+        rows = [[row[col] for col in tabela.colunas] for row in rows]
+    layout, em_msgpack = compacto
+    conteudo = tabela_compacta(tabela.offline, tabela.colunas, rows, layout)
+    return resposta_compacta(conteudo, em_msgpack, pag.response)
+
+
+@router.get("/sync/tipos", dependencies=[Depends(condicional("tipos"))])
+@em_executor
+def sync_tipos(request: Request, formato: Optional[str] = None, pag: Pagina = Depends(pagina)):
+    compacto = escolher_formato(request, formato)
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT ID_tipo, Designacao FROM Tipo")
-        rows = cur.fetchall()
-        result = [{"ID_tipo": row[0], "Designacao": row[1]} for row in rows]
-        cur.close()
-        conn.close()
-        return result
+        linhas = pag.fatiar(obter_referencia("tipos"), lambda row: [row["ID_tipo"]])
+        if compacto:
+            return _compacta(compacto, "tipos", linhas, pag)
+        return linhas
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/sync/familias")
-def sync_familias():
+@router.get("/sync/familias", dependencies=[Depends(condicional("familias"))])
+@em_executor
+def sync_familias(request: Request, formato: Optional[str] = None, pag: Pagina = Depends(pagina)):
+    compacto = escolher_formato(request, formato)
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT ID_familia, Designacao FROM Familia")
-        rows = cur.fetchall()
-        result = [{"ID_familia": row[0], "Designacao": row[1]} for row in rows]
-        cur.close()
-        conn.close()
-        return result
+        linhas = pag.fatiar(obter_referencia("familias"), lambda row: [row["ID_familia"]])
+        if compacto:
+            return _compacta(compacto, "familias", linhas, pag)
+        return linhas
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/sync/estados")
-def sync_estados():
+@router.get("/sync/estados", dependencies=[Depends(condicional("estados"))])
+@em_executor
+def sync_estados(request: Request, formato: Optional[str] = None, pag: Pagina = Depends(pagina)):
+    compacto = escolher_formato(request, formato)
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT ID_Estado, Designacao FROM Estado")
-        rows = cur.fetchall()
-        result = [{"ID_Estado": row[0], "Designacao": row[1]} for row in rows]
-        cur.close()
-        conn.close()
-        return result
+        linhas = pag.fatiar(obter_referencia("estados"), lambda row: [row["ID_Estado"]])
+        if compacto:
+            return _compacta(compacto, "estados", linhas, pag)
+        return linhas
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/sync/armazens")
-def sync_armazens():
+@router.get("/sync/armazens", dependencies=[Depends(condicional("armazens"))])
+@em_executor
+def sync_armazens(request: Request, formato: Optional[str] = None, pag: Pagina = Depends(pagina)):
     """Retorna todos os armazéns COM NOVOS CAMPOS de localização"""
+    compacto = escolher_formato(request, formato)
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        
-        cur.execute("""
-            SELECT 
-                ID_armazem, Descricao, Localizacao
-            FROM Armazem
-        """)
-        rows = cur.fetchall()
-        
-        result = [
-            {
-                "ID_armazem": row[0],
-                "Descricao": row[1],
-                "Localizacao": row[2]                
-            }
-            for row in rows
-        ]
-        
-        cur.close()
-        conn.close()
-        return result
+        linhas = pag.fatiar(obter_referencia("armazens"), lambda row: [row["ID_armazem"]])
+        if compacto:
+            return _compacta(compacto, "armazens", linhas, pag)
+        return linhas
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/sync/artigos")
-def sync_artigos():
+@router.get("/sync/artigos", dependencies=[Depends(condicional("artigos"))])
+@em_executor
+def sync_artigos(request: Request, formato: Optional[str] = None, pag: Pagina = Depends(pagina)):
+    compacto = escolher_formato(request, formato)
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT ID_artigo, ID_tipo, ID_familia, Referencia, Designacao, 
-                   Imagem, Cod_bar, Cod_NFC, Cod_RFID
-            FROM Artigo
-        """)
-        rows = cur.fetchall()
+        with get_leitura("sync.artigos") as conn:
+            cur = conn.cursor()
+            cur.execute(*pag.consulta(
+                "ID_artigo, ID_tipo, ID_familia, Referencia, Designacao, "
+                "Imagem, Cod_bar, Cod_NFC, Cod_RFID",
+                "Artigo", ["ID_artigo"],
+            ))
+            rows = pag.cortar(cur.fetchall(), lambda row: [row[0]])
+            cur.close()
+        if compacto:
+            return _compacta(compacto, "artigos", rows, pag)
         result = [
             {
                 "ID_artigo": row[0], "ID_tipo": row[1], "ID_familia": row[2],
@@ -94,23 +106,30 @@ def sync_artigos():
             }
             for row in rows
         ]
-        cur.close()
-        conn.close()
-        return result
+        return json_rapido(result, pag.response)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/sync/equipamentos")
-def sync_equipamentos():
+@router.get("/sync/equipamentos", dependencies=[Depends(condicional("equipamentos"))])
+@em_executor
+def sync_equipamentos(
+    request: Request, formato: Optional[str] = None, pag: Pagina = Depends(pagina)
+):
+    compacto = escolher_formato(request, formato)
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT ID_equipamento, ID_artigo, ID_Estado, N_serie, Marca, 
-                   Modelo, Data_aquisicao, Requer_inspecao, Ciclo_inspecao_dias
-            FROM Equipamento
-        """)
-        rows = cur.fetchall()
+        with get_leitura("sync.equipamentos") as conn:
+            cur = conn.cursor()
+            cur.execute(*pag.consulta(
+                "ID_equipamento, ID_artigo, ID_Estado, N_serie, Marca, "
+                "Modelo, Data_aquisicao, Requer_inspecao, Ciclo_inspecao_dias",
+                "Equipamento", ["ID_equipamento"],
+            ))
+            rows = pag.cortar(cur.fetchall(), lambda row: [row[0]])
+            cur.close()
+        if compacto:
+            return _compacta(compacto, "equipamentos", rows, pag)
         
         result = []
         for row in rows:
@@ -128,9 +147,9 @@ def sync_equipamentos():
                     equipamento["Data_aquisicao"] = str(row[6])
             result.append(equipamento)
         
-        cur.close()
-        conn.close()
-        return result
+        return json_rapido(result, pag.response)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro: {str(e)}")
 
@@ -141,19 +160,24 @@ def sync_equipamentos():
 
 
 
-@router.get("/sync/movimentos")
-def sync_movimentos():
+@router.get("/sync/movimentos", dependencies=[Depends(condicional("movimentos"))])
+@em_executor
+def sync_movimentos(request: Request, formato: Optional[str] = None, pag: Pagina = Depends(pagina)):
+    compacto = escolher_formato(request, formato)
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT ID_movimento, ID_artigo, ID_armazem, Data_mov, 
-                   Qtd_entrada, Qtd_saida, 
-                   Rack, NPrateleira, DPrateleira, 
-                   NCorredor, DCorredor, Zona
-            FROM Movimentos
-        """)
-        rows = cur.fetchall()
+        with get_leitura("sync.movimentos") as conn:
+            cur = conn.cursor()
+            cur.execute(*pag.consulta(
+                "ID_movimento, ID_artigo, ID_armazem, Data_mov, "
+                "Qtd_entrada, Qtd_saida, "
+                "Rack, NPrateleira, DPrateleira, "
+                "NCorredor, DCorredor, Zona",
+                "Movimentos", ["ID_movimento"],
+            ))
+            rows = pag.cortar(cur.fetchall(), lambda row: [row[0]])
+            cur.close()
+        if compacto:
+            return _compacta(compacto, "movimentos", rows, pag)
 
         result = [
             {
@@ -174,26 +198,33 @@ def sync_movimentos():
             for row in rows
         ]
 
-        cur.close()
-        conn.close()
-        return result
+        return json_rapido(result, pag.response)
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 
 
-@router.get("/sync/utilizadores")
-def sync_utilizadores():
+@router.get("/sync/utilizadores", dependencies=[Depends(condicional("utilizadores"))])
+@em_executor
+def sync_utilizadores(
+    request: Request, formato: Optional[str] = None, pag: Pagina = Depends(pagina)
+):
+    compacto = escolher_formato(request, formato)
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT ID_utilizador, Nome, Email, Username, Password, Ativo
-            FROM Utilizadores
-        """)
-        rows = cur.fetchall()
+        with get_leitura("sync.utilizadores") as conn:
+            cur = conn.cursor()
+            cur.execute(*pag.consulta(
+                "ID_utilizador, Nome, Email, Username, Password, Ativo",
+                "Utilizadores", ["ID_utilizador"],
+            ))
+            rows = pag.cortar(cur.fetchall(), lambda row: [row[0]])
+            cur.close()
+        if compacto:
+            return _compacta(compacto, "utilizadores", rows, pag)
         result = [
             {
                 "ID_utilizador": row[0], "Nome": row[1], "Email": row[2],
@@ -201,8 +232,56 @@ def sync_utilizadores():
             }
             for row in rows
         ]
-        cur.close()
-        conn.close()
         return result
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/sync/changes")
+@em_executor
+def sync_changes(since: Optional[str] = None, tabelas: Optional[str] = None):
+    """
+    Sincronização incremental: devolve só as linhas inseridas/alteradas e as chaves
+    removidas desde o token `since` (devolvido pela chamada anterior).
+    Sem token, ou com um token demasiado antigo, a tabela vem inteira com "reset": true.
+    `tabelas` restringe a resposta (ex: ?tabelas=artigos,movimentos).
+    """
+    desde = None
+    if since:
+        try:
+            desde = int(since)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Token de sincronização inválido")
+
+    selecionadas = TABELAS
+    if tabelas:
+        chaves = [t.strip() for t in tabelas.split(",") if t.strip()]
+        desconhecidas = [c for c in chaves if c not in POR_CHAVE]
+        if desconhecidas:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Tabelas desconhecidas: {', '.join(desconhecidas)}"
+            )
+        selecionadas = [POR_CHAVE[c] for c in chaves]
+
+    try:
+        with get_connection("sync.changes") as conn:
+            cur = conn.cursor()
+            resultado = alteracoes_desde(cur, selecionadas, desde)
+            cur.close()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro na sincronização incremental: {str(e)}")
+
+    dados = resultado["tabelas"]
+    return {
+        "success": True,
+        "token": str(resultado["versao"]),
+        "since": since,
+        "tabelas": dados,
+        "stats": {
+            "alterados": sum(len(t["alterados"]) for t in dados.values()),
+            "removidos": sum(len(t["removidos"]) for t in dados.values()),
+        },
+    }
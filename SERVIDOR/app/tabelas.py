@@ -0,0 +1,56 @@
+# SERVIDOR/app/tabelas.py
+"""
+Tabelas do ERP espelhadas pela app móvel (ver BD_OFFLINE/TABELAS.sql).
+"""
+from decimal import Decimal
+from typing import Any, Dict, NamedTuple, Sequence, Tuple
+
+
+class Tabela(NamedTuple):
+    chave: str                 # nome usado nas respostas de sincronização
+    offline: str               # tabela na BD offline (SQLite da app)
+    origem: str                # tabela no SQL Server
+    pk: str
+    colunas: Tuple[str, ...]
+
+
+TABELAS: Tuple[Tabela, ...] = (
+    Tabela("utilizadores", "UTILIZADOR", "Utilizadores", "ID_utilizador",
+           ("ID_utilizador", "Nome", "Email", "Username", "Password", "Ativo")),
+    Tabela("estados", "ESTADO", "Estado", "ID_Estado",
+           ("ID_Estado", "Designacao")),
+    Tabela("tipos", "TIPO", "Tipo", "ID_tipo",
+           ("ID_tipo", "Designacao")),
+    Tabela("familias", "FAMILIA", "Familia", "ID_familia",
+           ("ID_familia", "Designacao")),
+    Tabela("armazens", "ARMAZEM", "Armazem", "ID_armazem",
+           ("ID_armazem", "Descricao", "Localizacao")),
+    Tabela("artigos", "ARTIGO", "Artigo", "ID_artigo",
+           ("ID_artigo", "ID_tipo", "ID_familia", "Referencia", "Designacao",
+            "Imagem", "Cod_bar", "Cod_NFC", "Cod_RFID")),
+    Tabela("equipamentos", "EQUIPAMENTO", "Equipamento", "ID_equipamento",
+           ("ID_equipamento", "ID_artigo", "ID_Estado", "N_serie", "Marca",
+            "Modelo", "Data_aquisicao", "Requer_inspecao", "Ciclo_inspecao_dias")),
+    Tabela("movimentos", "MOVIMENTOS", "Movimentos", "ID_movimento",
+           ("ID_movimento", "ID_artigo", "ID_armazem", "Data_mov",
+            "Qtd_entrada", "Qtd_saida", "Rack", "NPrateleira", "DPrateleira",
+            "NCorredor", "DCorredor", "Zona")),
+)
+
+POR_CHAVE: Dict[str, Tabela] = {t.chave: t for t in TABELAS}
+
+
+def converter_valor(value: Any) -> Any:
+    """Converte valores do pyodbc para tipos JSON (datas em ISO, Decimal em float)."""
+    if value is None:
+        return None
+    if isinstance(value, Decimal):
+        return float(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def linha_para_dict(colunas: Sequence[str], row) -> Dict[str, Any]:
+    """Converte uma linha numa dict {coluna: valor}."""
+    return {col: converter_valor(row[i]) for i, col in enumerate(colunas)}
@@ -0,0 +1,185 @@
+# SERVIDOR/app/tracing.py
+"""
+Traço de cada pedido: um ID (header X-Trace-Id, aceite do cliente ou gerado) e
+onde foi o tempo, devolvido no header Server-Timing:
+
+    pool   espera por conexões do pool
+    sql    execute + fetch de todas as consultas (e uma entrada por consulta,
+           sqlN, com o nome, tempos e linhas, até SERVER_TIMING_MAX_SQL)
+    ser    serialização (json_rapido, msgpack)
+    comp   compressão (do que foi comprimido antes de os headers saírem)
+    total  do início do pedido até aos headers
+
+O traço vive numa ContextVar; o executor da BD e as leituras em paralelo copiam
+o contexto para as threads, por isso o que lá corre também conta.
+Consultas com mais de CONSULTA_LENTA_MS vão para o logger "app.consultas_lentas"
+numa linha JSON, com o SQL e a forma dos parâmetros (tipos e tamanhos, sem valores).
+"""
+import json
+import logging
+import re
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Sequence
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .config import settings
+
+logger_lentas = logging.getLogger("app.consultas_lentas")
+
+_ID_VALIDO = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+_ESPACOS = re.compile(r"\s+")
+
+
+class Consulta:
+    """Um execute e os fetch que se lhe seguem no mesmo cursor."""
+
+    __slots__ = ("nome", "sql", "parametros", "execute", "fetch", "linhas")
+
+    def __init__(self, nome: Optional[str], sql: str, parametros: Any):
+        self.nome = nome
+        self.sql = sql
+        self.parametros = parametros
+        self.execute = 0.0
+        self.fetch = 0.0
+        self.linhas = 0
+
+    @property
+    def total(self) -> float:
+        return self.execute + self.fetch
+
+
+class Traco:
+    def __init__(self, id_traco: str):
+        self.id = id_traco
+        self.inicio = time.perf_counter()
+        self._lock = threading.Lock()
+        self.tempos: Dict[str, float] = {}
+        self.consultas: List[Consulta] = []
+
+    def somar(self, chave: str, segundos: float):
+        with self._lock:
+            self.tempos[chave] = self.tempos.get(chave, 0.0) + segundos
+
+    def juntar(self, consulta: Consulta):
+        with self._lock:
+            self.consultas.append(consulta)
+
+    def server_timing(self, max_sql: int) -> str:
+        with self._lock:
+            tempos = dict(self.tempos)
+            consultas = list(self.consultas)
+        partes = []
+        if "pool" in tempos:
+            partes.append(f"pool;dur={tempos['pool'] * 1000:.1f}")
+        if consultas:
+            linhas = sum(c.linhas for c in consultas)
+            total = sum(c.total for c in consultas)
+            partes.append(
+                f'sql;dur={total * 1000:.1f};desc="{len(consultas)} consultas, {linhas} linhas"'
+            )
+            for i, c in enumerate(consultas[:max_sql], 1):
+                desc = (
+                    f"{c.nome or 'sem nome'}: execute {c.execute * 1000:.1f} ms, "
+                    f"fetch {c.fetch * 1000:.1f} ms, {c.linhas} linhas"
+                )
+                partes.append(f'sql{i};dur={c.total * 1000:.1f};desc="{desc}"')
+        for chave in ("ser", "comp"):
+            if chave in tempos:
+                partes.append(f"{chave};dur={tempos[chave] * 1000:.1f}")
+        partes.append(f"total;dur={(time.perf_counter() - self.inicio) * 1000:.1f}")
+        return ", ".join(partes)
+
+
+_traco: ContextVar[Optional[Traco]] = ContextVar("traco", default=None)
+
+
+def traco_atual() -> Optional[Traco]:
+    return _traco.get()
+
+
+def somar(chave: str, segundos: float):
+    """Junta `segundos` a uma das fases do traço do pedido atual (pool, ser, comp), se houver."""
+    traco = _traco.get()
+    if traco is not None:
+        traco.somar(chave, segundos)
+
+
+def forma_parametros(parametros: Any) -> Any:
+    """Tipos e tamanhos dos parâmetros, sem os valores: ["int", "str(12)", "1000 x int"]."""
+    if parametros is None:
+        return []
+    if not isinstance(parametros, (list, tuple)):
+        parametros = [parametros]
+    if len(parametros) > 10:
+        tipos = sorted({type(p).__name__ for p in parametros})
+        return [f"{len(parametros)} x {'|'.join(tipos)}"]
+    forma = []
+    for p in parametros:
+        nome = type(p).__name__
+        forma.append(f"{nome}({len(p)})" if isinstance(p, (str, bytes)) else nome)
+    return forma
+
+
+def terminar_consulta(consulta: Consulta):
+    """Fecha uma consulta: junta-a ao traço do pedido e regista-a se for lenta."""
+    traco = _traco.get()
+    if traco is not None:
+        traco.juntar(consulta)
+    limite = settings.consulta_lenta_ms
+    if limite > 0 and consulta.total * 1000 >= limite:
+        logger_lentas.warning(json.dumps({
+            "evento": "consulta_lenta",
+            "trace_id": traco.id if traco else None,
+            "consulta": consulta.nome,
+            "ms": round(consulta.total * 1000, 1),
+            "execute_ms": round(consulta.execute * 1000, 1),
+            "fetch_ms": round(consulta.fetch * 1000, 1),
+            "linhas": consulta.linhas,
+            "sql": _ESPACOS.sub(" ", consulta.sql).strip(),
+            "parametros": forma_parametros(consulta.parametros),
+        }, ensure_ascii=False))
+
+
+def _id_do_pedido(headers: Sequence) -> str:
+    for nome, valor in headers:
+        if nome == b"x-trace-id":
+            valor = valor.decode("latin-1")
+            if _ID_VALIDO.match(valor):
+                return valor
+    return uuid.uuid4().hex
+
+
+class TracingMiddleware:
+    """
+    Abre um traço por pedido HTTP e põe X-Trace-Id e Server-Timing nos headers.
+    Deve ficar por fora da compressão, para o tempo de compressão já lá estar.
+    """
+
+    def __init__(self, app: ASGIApp, max_sql: int = 10):
+        self.app = app
+        self.max_sql = max_sql
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        traco = Traco(_id_do_pedido(scope["headers"]))
+        token = _traco.set(traco)
+
+        async def _send(message: Message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers["X-Trace-Id"] = traco.id
+                headers.append("Server-Timing", traco.server_timing(self.max_sql))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            _traco.reset(token)
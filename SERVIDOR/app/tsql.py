@@ -0,0 +1,109 @@
+# SERVIDOR/app/tsql.py
+"""
+Consultas das rotas (T-SQL) sobre SQLite, com o schema de BD_OFFLINE/TABELAS.sql.
+Usado pela réplica local (replica.py) e pela BD dos benchmarks (benchmarks/bd_local.py).
+
+Só se traduz o T-SQL que as rotas de leitura usam: TOP n e TOP (?) passam a LIMIT
+no fim, DATEDIFF(DAY, '19700101', x), GETDATE() e ISNULL. As datas (colunas Data_*)
+estão em TEXT no SQLite e voltam a date/datetime, como vêm do SQL Server.
+Não importa o pyodbc: os benchmarks carregam este módulo antes de o substituírem.
+"""
+import datetime
+import functools
+import re
+import sqlite3
+from typing import Any, List, Tuple
+
+_TOP_PARAM = re.compile(r"\bSELECT\s+TOP\s*\(\?\)\s*", re.IGNORECASE)
+_TOP_N = re.compile(r"\bSELECT\s+TOP\s*\(?(\d+)\)?\s+", re.IGNORECASE)
+_DATEDIFF_DIA = re.compile(
+    r"DATEDIFF\(\s*DAY\s*,\s*'19700101'\s*,\s*([\w.]+)\s*\)", re.IGNORECASE
+)
+_GETDATE = re.compile(r"\bGETDATE\(\)", re.IGNORECASE)
+_ISNULL = re.compile(r"\bISNULL\(", re.IGNORECASE)
+_FIM = re.compile(r"[\s;]*$")
+
+
+@functools.lru_cache(maxsize=512)
+def traduzir(sql: str) -> Tuple[str, bool]:
+    """(SQL para o SQLite, o primeiro parâmetro é o do TOP (?) e passa para o LIMIT no fim)."""
+    top_param = bool(_TOP_PARAM.search(sql))
+    limite = None
+    if top_param:
+        sql = _TOP_PARAM.sub("SELECT ", sql, count=1)
+        limite = "?"
+    else:
+        m = _TOP_N.search(sql)
+        if m:
+            sql = _TOP_N.sub("SELECT ", sql, count=1)
+            limite = m.group(1)
+    sql = _DATEDIFF_DIA.sub(r"CAST(julianday(\1) - 2440587.5 AS INTEGER)", sql)
+    sql = _GETDATE.sub("CURRENT_TIMESTAMP", sql)
+    sql = _ISNULL.sub("IFNULL(", sql)
+    if limite is not None:
+        sql = f"{_FIM.sub('', sql)} LIMIT {limite}"
+    return sql, top_param
+
+
+def para_data(valor: Any) -> Any:
+    if not isinstance(valor, str):
+        return valor
+    try:
+        if len(valor) == 10:
+            return datetime.date.fromisoformat(valor)
+        return datetime.datetime.fromisoformat(valor)
+    except ValueError:
+        return valor
+
+
+class CursorSQLite:
+    """Cursor sqlite3 com a interface do pyodbc usada pelas rotas."""
+
+    def __init__(self, raw: sqlite3.Cursor):
+        self._raw = raw
+        self._datas: List[int] = []
+
+    def execute(self, sql: str, *params):
+        if len(params) == 1 and isinstance(params[0], (list, tuple)):
+            params = tuple(params[0])
+        sql, top_param = traduzir(sql)
+        if top_param:
+            params = tuple(params[1:]) + (params[0],)
+        self._raw.execute(sql, params)
+        descricao = self._raw.description or ()
+        self._datas = [i for i, d in enumerate(descricao) if d[0].lower().startswith("data_")]
+        return self
+
+    def executemany(self, sql: str, seq_params):
+        self._raw.executemany(traduzir(sql)[0], seq_params)
+        return self
+
+    def _converter(self, linha):
+        if linha is None or not self._datas:
+            return linha
+        linha = list(linha)
+        for i in self._datas:
+            linha[i] = para_data(linha[i])
+        return tuple(linha)
+
+    @property
+    def description(self):
+        return self._raw.description
+
+    @property
+    def rowcount(self):
+        return self._raw.rowcount
+
+    def fetchone(self):
+        return self._converter(self._raw.fetchone())
+
+    def fetchall(self):
+        linhas = self._raw.fetchall()
+        return [self._converter(linha) for linha in linhas] if self._datas else linhas
+
+    def fetchmany(self, n: int = 1):
+        linhas = self._raw.fetchmany(n)
+        return [self._converter(linha) for linha in linhas] if self._datas else linhas
+
+    def close(self):
+        self._raw.close()
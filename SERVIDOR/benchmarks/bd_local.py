@@ -0,0 +1,314 @@
+"""
+BD local para os benchmarks: um ficheiro SQLite com o esquema de BD_OFFLINE/TABELAS.sql
+e um catálogo gerado (artigos, movimentos, imagens), servido à API por um módulo
+compatível com o pyodbc no lugar do driver do SQL Server.
+
+O T-SQL é traduzido por app/tsql.py, o mesmo adaptador da réplica local.
+Change tracking e snapshot isolation não existem aqui: essas consultas
+falham com pyodbc.Error e a API segue pelo caminho de quando a BD não os tem
+(monitor parado, sem ETag, índices com reconstrução por idade).
+
+Uso (na pasta SERVIDOR):
+    python -m benchmarks.bd_local criar bench.db --artigos 10000 --movimentos 100000
+    python -m benchmarks.bd_local servir bench.db --porta 8100 --pasta /tmp/bench
+"""
+import argparse
+import datetime
+import hashlib
+import os
+import random
+import sqlite3
+import sys
+import time
+import types
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+from app.tsql import CursorSQLite
+
+RAIZ = Path(__file__).resolve().parent.parent
+TABELAS_SQL = RAIZ / "BD_OFFLINE" / "TABELAS.sql"
+
+# Relativa à pasta de trabalho da API (ver app/imagens.py)
+PASTA_IMAGENS = Path("assets/images/artigos")
+
+_LOTE = 50000
+_PALAVRAS = (
+    "Parafuso", "Porca", "Anilha", "Rolamento", "Correia", "Filtro", "Válvula", "Junta",
+    "Cabo", "Sensor", "Motor", "Bomba", "Mangueira", "Fusível", "Relé", "Disjuntor",
+)
+_MATERIAIS = ("Inox", "Aço", "Latão", "Nylon", "Borracha", "Cobre", "Alumínio", "PVC")
+
+
+# --- Catálogo -----------------------------------------------------------------
+
+def _gerar_imagens(pasta: Path, n: int, semente: int) -> List[str]:
+    """N imagens JPEG diferentes, com texturas (o reconhecimento AR precisa de cantos)."""
+    import cv2
+    import numpy as np
+
+    destino = pasta / PASTA_IMAGENS
+    destino.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(semente)
+    caminhos = []
+    for i in range(n):
+        imagem = rng.integers(0, 256, (480, 640, 3), dtype=np.uint8)
+        imagem = cv2.GaussianBlur(imagem, (0, 0), 3)
+        for _ in range(12):
+            x, y = (int(v) for v in rng.integers(0, 600, 2))
+            cor = tuple(int(c) for c in rng.integers(0, 256, 3))
+            cv2.rectangle(imagem, (x, y % 440), (x + 40, y % 440 + 40), cor, -1)
+        cv2.putText(imagem, f"ART {i}", (40, 240), cv2.FONT_HERSHEY_SIMPLEX, 3, (255, 255, 255), 6)
+        ok, jpeg = cv2.imencode(".jpg", imagem, [cv2.IMWRITE_JPEG_QUALITY, 85])
+        dados = jpeg.tobytes()
+        nome = f"{hashlib.sha256(dados).hexdigest()}.jpg"
+        (destino / nome).write_bytes(dados)
+        caminhos.append(str(PASTA_IMAGENS / nome))
+    return caminhos
+
+
+def codigos_do_artigo(i: int) -> Tuple[str, str, str, str]:
+    """(Referencia, Cod_bar, Cod_NFC, Cod_RFID) do artigo gerado com ID i."""
+    return f"REF{i:07d}", f"560{i:010d}", f"NFC{i:08X}", f"E200{i:012X}"
+
+
+def _artigos(n: int, imagens: List[str], com_imagem: float, rng: random.Random) -> Iterator[tuple]:
+    for i in range(1, n + 1):
+        referencia, cod_bar, cod_nfc, cod_rfid = codigos_do_artigo(i)
+        designacao = f"{rng.choice(_PALAVRAS)} {rng.choice(_MATERIAIS)} M{rng.randint(2, 48)} {i}"
+        imagem = imagens[i % len(imagens)] if imagens and rng.random() < com_imagem else None
+        yield (i, 1 + i % 5, 1 + i % 8, referencia, designacao, imagem, cod_bar, cod_nfc, cod_rfid)
+
+
+def _movimentos(n: int, artigos: int, rng: random.Random) -> Iterator[tuple]:
+    inicio = datetime.datetime(2023, 1, 1, 8, 0)
+    for i in range(1, n + 1):
+        data = inicio + datetime.timedelta(minutes=rng.randint(0, 2 * 365 * 24 * 60))
+        entrada = rng.random() < 0.4
+        yield (
+            i, rng.randint(1, artigos), 1 + i % 4, data.isoformat(sep=" "),
+            float(rng.randint(1, 50)) if entrada else 0.0,
+            0.0 if entrada else float(rng.randint(1, 10)),
+            rng.randint(1, 6), f"Nível {rng.randint(1, 6)}",
+            rng.randint(1, 12), f"Corredor {rng.randint(1, 12)}",
+            rng.randint(1, 4), rng.randint(1, 30),
+        )
+
+
+def _inserir(con: sqlite3.Connection, sql: str, linhas: Iterator[tuple]):
+    lote = []
+    for linha in linhas:
+        lote.append(linha)
+        if len(lote) >= _LOTE:
+            con.executemany(sql, lote)
+            lote.clear()
+    if lote:
+        con.executemany(sql, lote)
+
+
+def criar(
+    caminho: Path,
+    artigos: int,
+    movimentos: int,
+    imagens: int = 20,
+    com_imagem: float = 0.3,
+    pasta: Optional[Path] = None,
+    semente: int = 1,
+) -> dict:
+    """
+    Cria (ou substitui) a BD em `caminho` com o esquema offline e um catálogo gerado.
+    As imagens vão para `pasta`/assets/images/artigos; `pasta` é a pasta de trabalho
+    da API (por omissão a da BD). Com a mesma semente o catálogo é sempre igual.
+    """
+    caminho = Path(caminho)
+    pasta = Path(pasta) if pasta is not None else caminho.parent
+    caminho.parent.mkdir(parents=True, exist_ok=True)
+    if caminho.exists():
+        caminho.unlink()
+
+    rng = random.Random(semente)
+    inicio = time.perf_counter()
+    nomes_imagens = _gerar_imagens(pasta, imagens, semente) if imagens else []
+
+    con = sqlite3.connect(caminho)
+    try:
+        con.execute("PRAGMA journal_mode = WAL")
+        con.execute("PRAGMA synchronous = OFF")
+        con.executescript(TABELAS_SQL.read_text(encoding="utf-8"))
+        # No SQL Server a tabela chama-se Utilizadores
+        con.execute("CREATE VIEW IF NOT EXISTS Utilizadores AS SELECT * FROM UTILIZADOR")
+        con.execute(
+            "INSERT INTO UTILIZADOR (Nome, Email, Username, Password, Ativo)"
+            " VALUES (?, ?, ?, ?, 1)",
+            ("Benchmark", "bench@local", "bench", "bench"),
+        )
+        con.executemany("INSERT INTO TIPO VALUES (?, ?)", [(i, f"Tipo {i}") for i in range(1, 6)])
+        con.executemany(
+            "INSERT INTO FAMILIA VALUES (?, ?)", [(i, f"Família {i}") for i in range(1, 9)]
+        )
+        con.executemany(
+            "INSERT INTO ESTADO VALUES (?, ?)", [(1, "Operacional"), (2, "Em reparação")]
+        )
+        con.executemany(
+            "INSERT INTO ARMAZEM VALUES (?, ?, ?)",
+            [(i, f"Armazém {i}", f"Local {i}") for i in range(1, 5)],
+        )
+        _inserir(
+            con, "INSERT INTO ARTIGO VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            _artigos(artigos, nomes_imagens, com_imagem, rng),
+        )
+        _inserir(
+            con,
+            "INSERT INTO MOVIMENTOS (ID_movimento, ID_artigo, ID_armazem, Data_mov, Qtd_entrada, "
+            "Qtd_saida, NPrateleira, DPrateleira, NCorredor, DCorredor, Zona, Rack) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            _movimentos(movimentos, max(artigos, 1), rng),
+        )
+        equipamentos = max(artigos // 20, 1)
+        _inserir(
+            con, "INSERT INTO EQUIPAMENTO VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                (i, 1 + (i * 7) % max(artigos, 1), 1 + i % 2, f"SN{i:08d}", "Marca",
+                 f"Modelo {i % 30}", f"202{i % 5}-0{1 + i % 9}-1{i % 9}", i % 2, 30 * (1 + i % 12))
+                for i in range(1, equipamentos + 1)
+            ),
+        )
+        con.commit()
+        con.execute("ANALYZE")
+    finally:
+        con.close()
+
+    return {
+        "bd": str(caminho),
+        "artigos": artigos,
+        "movimentos": movimentos,
+        "equipamentos": equipamentos,
+        "imagens": nomes_imagens,
+        "segundos": round(time.perf_counter() - inicio, 1),
+    }
+
+
+# --- Substituto do pyodbc -------------------------------------------------------
+
+class Error(Exception):
+    pass
+
+
+class Cursor(CursorSQLite):
+    """O cursor de app/tsql.py com os erros como pyodbc.Error; SET TRANSACTION não faz nada."""
+
+    def __init__(self, conexao: "Conexao"):
+        super().__init__(conexao._con.cursor())
+        self.connection = conexao
+
+    def execute(self, sql: str, *params):
+        if sql.lstrip().upper().startswith("SET TRANSACTION ISOLATION LEVEL"):
+            return self
+        try:
+            return super().execute(sql, *params)
+        except sqlite3.Error as e:
+            raise Error(str(e)) from e
+
+    def executemany(self, sql: str, seq_params):
+        try:
+            return super().executemany(sql, seq_params)
+        except sqlite3.Error as e:
+            raise Error(str(e)) from e
+
+
+class Conexao:
+    autocommit = False
+
+    def __init__(self, caminho: str):
+        try:
+            self._con = sqlite3.connect(caminho, check_same_thread=False, timeout=30)
+            # As consultas com o esquema (dbo.Artigo) vão à mesma BD
+            self._con.execute("ATTACH DATABASE ? AS dbo", (caminho,))
+        except sqlite3.Error as e:
+            raise Error(str(e)) from e
+
+    def cursor(self) -> Cursor:
+        return Cursor(self)
+
+    def execute(self, sql: str, *params) -> Cursor:
+        return self.cursor().execute(sql, *params)
+
+    def commit(self):
+        self._con.commit()
+
+    def rollback(self):
+        self._con.rollback()
+
+    def close(self):
+        self._con.close()
+
+
+def instalar(caminho: Path):
+    """
+    Põe em sys.modules["pyodbc"] um módulo que liga todas as conexões à BD em
+    `caminho`. Tem de ser chamado antes de importar a app.
+    """
+    caminho = str(Path(caminho).resolve())
+    if not Path(caminho).is_file():
+        raise FileNotFoundError(f"BD local não encontrada: {caminho} (criar com `criar`)")
+    modulo = types.ModuleType("pyodbc")
+    modulo.Error = Error
+    modulo.Connection = Conexao
+    modulo.connect = lambda *args, **kwargs: Conexao(caminho)
+    sys.modules["pyodbc"] = modulo
+    # A configuração exige as variáveis do SQL Server; aqui não são usadas
+    for nome in ("DB_SERVER", "DB_DATABASE", "DB_USERNAME", "DB_PASSWORD"):
+        os.environ.setdefault(nome, "bd_local")
+
+
+def servir(caminho: Path, porta: int, pasta: Optional[Path] = None, host: str = "127.0.0.1"):
+    """Arranca a API (uvicorn, um processo) sobre a BD local, com `pasta` como pasta de trabalho."""
+    caminho = Path(caminho).resolve()
+    instalar(caminho)
+    if pasta is not None:
+        os.chdir(pasta)
+    if str(RAIZ) not in sys.path:
+        sys.path.insert(0, str(RAIZ))
+
+    import uvicorn
+
+    uvicorn.run("app.main:app", host=host, port=porta, log_level="warning")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    p_criar = comandos.add_parser("criar", help="gerar a BD e as imagens")
+    p_criar.add_argument("bd", type=Path)
+    p_criar.add_argument("--artigos", type=int, default=10000)
+    p_criar.add_argument("--movimentos", type=int, default=100000)
+    p_criar.add_argument("--imagens", type=int, default=20)
+    p_criar.add_argument(
+        "--pasta", type=Path, default=None, help="pasta de trabalho da API (imagens)"
+    )
+    p_criar.add_argument("--semente", type=int, default=1)
+
+    p_servir = comandos.add_parser("servir", help="arrancar a API sobre a BD local")
+    p_servir.add_argument("bd", type=Path)
+    p_servir.add_argument("--porta", type=int, default=8100)
+    p_servir.add_argument("--pasta", type=Path, default=None, help="pasta de trabalho da API")
+
+    args = parser.parse_args()
+    if args.comando == "criar":
+        info = criar(
+            args.bd, args.artigos, args.movimentos, args.imagens,
+            pasta=args.pasta, semente=args.semente,
+        )
+        print(
+            f"{info['bd']}: {info['artigos']} artigos, {info['movimentos']} movimentos, "
+            f"{len(info['imagens'])} imagens ({info['segundos']} s)"
+        )
+    else:
+        servir(args.bd, args.porta, args.pasta)
+
+
+if __name__ == "__main__":
+    main()
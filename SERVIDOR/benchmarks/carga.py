@@ -0,0 +1,374 @@
+"""
+Benchmark de carga da API sobre a BD local (benchmarks/bd_local.py).
+
+Gera (ou reutiliza) um catálogo, arranca a API num processo uvicorn à parte e, para
+cada cenário, faz pedidos com N clientes em simultâneo. Mede, por cenário, pedidos
+por segundo, latência p50/p95/p99 (do envio ao último byte do corpo), erros e o
+pico de RSS do processo da API; no fim, o pico de RSS do processo inteiro.
+
+Com --baseline compara com um resultado guardado (--guardar) e termina com
+código 1 se algum cenário piorar mais do que --tolerancia (p95, pedidos/s ou RSS).
+Os números só são comparáveis na mesma máquina e com o mesmo catálogo.
+
+Uso (na pasta SERVIDOR):
+    python -m benchmarks.carga --catalogo pequeno --guardar benchmarks/resultados/base.json
+    python -m benchmarks.carga --catalogo pequeno --baseline benchmarks/resultados/base.json
+    python -m benchmarks.carga --artigos 1000000 --movimentos 1000000 --cenarios codigo,artigos
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import httpx
+
+from .bd_local import RAIZ, codigos_do_artigo, criar
+
+# (artigos, movimentos)
+CATALOGOS = {
+    "pequeno": (10_000, 100_000),
+    "medio": (100_000, 500_000),
+    "grande": (1_000_000, 1_000_000),
+}
+
+# A API é arrancada com a configuração por omissão, menos o trabalho de fundo que
+# competiria com os pedidos de forma diferente em cada execução
+AMBIENTE_API = {
+    "SNAPSHOT_ATIVO": "false",
+    "MINIATURAS_PREENCHER_ARRANQUE": "false",
+    "APP_ENV": "benchmark",
+}
+
+
+class Contexto(NamedTuple):
+    artigos: int
+    imagens: List[str]
+    rng: random.Random
+
+
+class Cenario(NamedTuple):
+    nome: str
+    descricao: str
+    url: Callable[[Contexto], str]
+    pedidos: int
+    clientes: int
+
+
+def _codigo_aleatorio(ctx: Contexto) -> str:
+    i = ctx.rng.randint(1, ctx.artigos)
+    return f"/artigos/codigo/{ctx.rng.choice(codigos_do_artigo(i))}"
+
+
+def _imagem_aleatoria(ctx: Contexto) -> str:
+    return f"/imagens/{Path(ctx.rng.choice(ctx.imagens)).name}"
+
+
+def _miniatura_aleatoria(ctx: Contexto) -> str:
+    return f"/imagens/{Path(ctx.rng.choice(ctx.imagens)).name}?size=thumb"
+
+
+CENARIOS = [
+    Cenario(
+        "codigo", "GET /artigos/codigo/{codigo} (índice em memória)", _codigo_aleatorio, 5000, 32
+    ),
+    Cenario("artigos", "GET /artigos?limit=100", lambda ctx: "/artigos?limit=100", 1000, 16),
+    Cenario(
+        "movimentos", "GET /sync/movimentos?limit=1000",
+        lambda ctx: "/sync/movimentos?limit=1000", 500, 8,
+    ),
+    Cenario("sync", "GET /sync (catálogo completo)", lambda ctx: "/sync", 10, 2),
+    Cenario("imagem", "GET /imagens/{nome} (original)", _imagem_aleatoria, 2000, 16),
+    Cenario("miniatura", "GET /imagens/{nome}?size=thumb", _miniatura_aleatoria, 2000, 16),
+]
+
+
+def percentil(valores: List[float], p: float) -> float:
+    """Percentil pelo método do posto mais próximo (valores já ordenados)."""
+    if not valores:
+        return 0.0
+    posicao = max(int(-(-p * len(valores) // 100)) - 1, 0)
+    return valores[min(posicao, len(valores) - 1)]
+
+
+def _rss_kib(pid: int, campo: str = "VmRSS") -> Optional[int]:
+    """RSS (ou VmHWM, o pico) de um processo, em KiB; None fora do Linux."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for linha in f:
+                if linha.startswith(campo + ":"):
+                    return int(linha.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+async def _amostrar_rss(pid: int, pico: List[int], parar: asyncio.Event):
+    while not parar.is_set():
+        rss = _rss_kib(pid)
+        if rss is not None:
+            pico[0] = max(pico[0], rss)
+        try:
+            await asyncio.wait_for(parar.wait(), 0.05)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def correr_cenario(
+    cliente: httpx.AsyncClient, cenario: Cenario, ctx: Contexto, pid: int, escala: float = 1.0
+) -> dict:
+    total = max(int(cenario.pedidos * escala), cenario.clientes)
+    urls = [cenario.url(ctx) for _ in range(total)]
+    latencias: List[float] = []
+    estados: Dict[int, int] = {}
+    recebidos = [0]
+    proximo = iter(urls)
+
+    async def _cliente():
+        for url in proximo:
+            inicio = time.perf_counter()
+            try:
+                async with cliente.stream("GET", url) as resposta:
+                    async for bloco in resposta.aiter_raw():
+                        recebidos[0] += len(bloco)
+                    estado = resposta.status_code
+            except httpx.HTTPError:
+                estado = 0
+            latencias.append(time.perf_counter() - inicio)
+            estados[estado] = estados.get(estado, 0) + 1
+
+    pico = [_rss_kib(pid) or 0]
+    parar = asyncio.Event()
+    amostragem = asyncio.create_task(_amostrar_rss(pid, pico, parar))
+    inicio = time.perf_counter()
+    await asyncio.gather(*(_cliente() for _ in range(cenario.clientes)))
+    duracao = time.perf_counter() - inicio
+    parar.set()
+    await amostragem
+
+    latencias.sort()
+    erros = sum(n for estado, n in estados.items() if not 200 <= estado < 400)
+    return {
+        "pedidos": total,
+        "clientes": cenario.clientes,
+        "erros": erros,
+        "estados": {str(k): v for k, v in sorted(estados.items())},
+        "pedidos_s": round(total / duracao, 1),
+        "p50_ms": round(percentil(latencias, 50) * 1000, 2),
+        "p95_ms": round(percentil(latencias, 95) * 1000, 2),
+        "p99_ms": round(percentil(latencias, 99) * 1000, 2),
+        "bytes_pedido": recebidos[0] // total,
+        "rss_pico_mib": round(pico[0] / 1024, 1) if pico[0] else None,
+    }
+
+
+def comparar(resultado: dict, baseline: dict, tolerancia: float) -> List[str]:
+    """Regressões de `resultado` em relação a `baseline`: p95, pedidos/s e pico de RSS."""
+    regressoes = []
+    for nome, atual in resultado["cenarios"].items():
+        antes = baseline.get("cenarios", {}).get(nome)
+        if not antes:
+            continue
+        if antes["p95_ms"] and atual["p95_ms"] > antes["p95_ms"] * (1 + tolerancia):
+            regressoes.append(f"{nome}: p95 {antes['p95_ms']} -> {atual['p95_ms']} ms")
+        if antes["pedidos_s"] and atual["pedidos_s"] < antes["pedidos_s"] * (1 - tolerancia):
+            regressoes.append(f"{nome}: {antes['pedidos_s']} -> {atual['pedidos_s']} pedidos/s")
+        if antes.get("rss_pico_mib") and atual.get("rss_pico_mib") and (
+            atual["rss_pico_mib"] > antes["rss_pico_mib"] * (1 + tolerancia)
+        ):
+            regressoes.append(f"{nome}: RSS {antes['rss_pico_mib']} -> {atual['rss_pico_mib']} MiB")
+        if atual["erros"] > antes["erros"]:
+            regressoes.append(f"{nome}: erros {antes['erros']} -> {atual['erros']}")
+    return regressoes
+
+
+def _porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def arrancar_api(bd: Path, pasta: Path, porta: int) -> subprocess.Popen:
+    ambiente = {**os.environ, **{k: v for k, v in AMBIENTE_API.items() if k not in os.environ}}
+    ambiente["PYTHONPATH"] = os.pathsep.join(filter(None, [str(RAIZ), ambiente.get("PYTHONPATH")]))
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "benchmarks.bd_local", "servir", str(bd),
+            "--porta", str(porta), "--pasta", str(pasta),
+        ],
+        cwd=str(pasta),
+        env=ambiente,
+    )
+
+
+async def esperar_api(url: str, processo: subprocess.Popen, limite: float):
+    """Espera pelo /health (o arranque constrói os índices em memória: com 1M de artigos demora)."""
+    fim = time.monotonic() + limite
+    async with httpx.AsyncClient(base_url=url, timeout=2) as cliente:
+        while time.monotonic() < fim:
+            if processo.poll() is not None:
+                raise RuntimeError(f"A API terminou no arranque (código {processo.returncode})")
+            try:
+                if (await cliente.get("/health")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.25)
+    raise RuntimeError(f"A API não respondeu em {limite:.0f} s")
+
+
+def _imprimir(nome: str, r: dict):
+    rss = f"{r['rss_pico_mib']:8.1f}" if r["rss_pico_mib"] else "       -"
+    print(
+        f"  {nome:<11} {r['pedidos']:>6} {r['clientes']:>4} {r['pedidos_s']:>9.1f}"
+        f" {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f}"
+        f" {r['bytes_pedido']:>11,} {rss}"
+        f"{'  erros: ' + str(r['estados']) if r['erros'] else ''}"
+    )
+
+
+async def correr(args) -> dict:
+    pasta = Path(args.pasta).resolve()
+    pasta.mkdir(parents=True, exist_ok=True)
+    bd = pasta / f"bench-{args.artigos}-{args.movimentos}-{args.semente}.db"
+    info_path = bd.with_suffix(".json")
+    if args.recriar or not bd.exists() or not info_path.exists():
+        print(f"A gerar {args.artigos} artigos e {args.movimentos} movimentos em {bd} ...")
+        info = criar(
+            bd, args.artigos, args.movimentos, args.imagens, pasta=pasta, semente=args.semente
+        )
+        info_path.write_text(json.dumps(info), encoding="utf-8")
+        print(f"  feito em {info['segundos']} s")
+    info = json.loads(info_path.read_text(encoding="utf-8"))
+
+    escolhidos = [c for c in CENARIOS if not args.cenarios or c.nome in args.cenarios]
+    if not info["imagens"]:
+        escolhidos = [c for c in escolhidos if c.nome not in ("imagem", "miniatura")]
+    ctx = Contexto(info["artigos"], info["imagens"], random.Random(args.semente))
+
+    porta = args.porta or _porta_livre()
+    url = f"http://127.0.0.1:{porta}"
+    processo = arrancar_api(bd, pasta, porta)
+    resultado = {
+        "catalogo": {
+            "artigos": info["artigos"],
+            "movimentos": info["movimentos"],
+            "imagens": len(info["imagens"]),
+        },
+        "maquina": {
+            "python": platform.python_version(),
+            "sistema": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "data": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "cenarios": {},
+    }
+    try:
+        inicio = time.perf_counter()
+        await esperar_api(url, processo, args.arranque)
+        resultado["arranque_s"] = round(time.perf_counter() - inicio, 1)
+        print(f"API em {url} (arranque {resultado['arranque_s']} s)\n")
+
+        limites = httpx.Limits(
+            max_connections=max(c.clientes for c in escolhidos), max_keepalive_connections=64
+        )
+        async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limites) as cliente:
+            if "miniatura" in [c.nome for c in escolhidos]:
+                # As miniaturas são geradas em background no primeiro pedido:
+                # mede-se o estado estável
+                for imagem in info["imagens"]:
+                    await cliente.get(f"/imagens/{Path(imagem).name}?size=thumb")
+                await asyncio.sleep(2)
+            print(
+                f"  {'cenário':<11} {'pedidos':>6} {'cli':>4} {'pedidos/s':>9}"
+                f" {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'bytes/ped':>11} {'RSS MiB':>8}"
+            )
+            for cenario in escolhidos:
+                # Aquecimento: primeiros pedidos (caches, conexões) fora das contas
+                for _ in range(min(cenario.clientes, 5)):
+                    await cliente.get(cenario.url(ctx))
+                r = await correr_cenario(cliente, cenario, ctx, processo.pid, args.escala)
+                resultado["cenarios"][cenario.nome] = r
+                _imprimir(cenario.nome, r)
+        pico = _rss_kib(processo.pid, "VmHWM")
+        resultado["rss_pico_mib"] = round(pico / 1024, 1) if pico else None
+        if pico:
+            print(f"\nPico de RSS da API: {resultado['rss_pico_mib']} MiB")
+    finally:
+        processo.terminate()
+        try:
+            processo.wait(10)
+        except subprocess.TimeoutExpired:
+            processo.kill()
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--catalogo", choices=sorted(CATALOGOS), default="pequeno")
+    parser.add_argument("--artigos", type=int, default=None, help="substitui o do --catalogo")
+    parser.add_argument("--movimentos", type=int, default=None, help="substitui o do --catalogo")
+    parser.add_argument("--imagens", type=int, default=20)
+    parser.add_argument("--semente", type=int, default=1)
+    parser.add_argument(
+        "--cenarios",
+        default="",
+        help=f"separados por vírgulas (todos por omissão: {','.join(c.nome for c in CENARIOS)})",
+    )
+    parser.add_argument(
+        "--escala", type=float, default=1.0, help="multiplica o número de pedidos de cada cenário"
+    )
+    parser.add_argument("--pasta", default=os.path.join(tempfile.gettempdir(), "armazem-benchmark"))
+    parser.add_argument("--recriar", action="store_true", help="gerar a BD mesmo que já exista")
+    parser.add_argument("--porta", type=int, default=None)
+    parser.add_argument(
+        "--arranque", type=float, default=600.0, help="segundos máximos à espera da API"
+    )
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument(
+        "--guardar", type=Path, default=None, help="guardar o resultado (JSON)"
+    )
+    parser.add_argument(
+        "--baseline", type=Path, default=None, help="resultado guardado para comparar"
+    )
+    parser.add_argument("--tolerancia", type=float, default=0.2)
+    args = parser.parse_args()
+
+    artigos, movimentos = CATALOGOS[args.catalogo]
+    args.artigos = args.artigos or artigos
+    args.movimentos = args.movimentos or movimentos
+    args.cenarios = [c for c in args.cenarios.split(",") if c]
+
+    resultado = asyncio.run(correr(args))
+
+    if args.guardar:
+        args.guardar.parent.mkdir(parents=True, exist_ok=True)
+        args.guardar.write_text(
+            json.dumps(resultado, indent=2, ensure_ascii=False), encoding="utf-8"
+        )
+        print(f"Resultado guardado em {args.guardar}")
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        if baseline.get("catalogo") != resultado["catalogo"]:
+            print(f"Aviso: a baseline foi medida com outro catálogo ({baseline.get('catalogo')})")
+        regressoes = comparar(resultado, baseline, args.tolerancia)
+        if regressoes:
+            print(f"\nRegressões (tolerância {args.tolerancia:.0%}):")
+            for linha in regressoes:
+                print(f"  {linha}")
+            sys.exit(1)
+        print(f"\nSem regressões em relação a {args.baseline} (tolerância {args.tolerancia:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark da serialização e da compressão das respostas grandes (sem BD).
+
+Gera N linhas parecidas com Movimentos e mede, por pedido:
+  - CPU da serialização: jsonable_encoder + json (caminho antigo) vs orjson (serializacao.py)
+  - bytes na rede e CPU de cada codec de compressao.py
+
+Uso (na pasta SERVIDOR):
+    python -m benchmarks.serializacao --linhas 100000
+"""
+import argparse
+import datetime
+import json
+import time
+from decimal import Decimal
+
+from fastapi.encoders import jsonable_encoder
+
+from app.compressao import CompressaoMiddleware, codecs_disponiveis
+from app.serializacao import dumps, linhas_para_dicts
+
+COLUNAS = [
+    "ID_movimento", "ID_artigo", "ID_armazem", "Data_mov", "Qtd_entrada", "Qtd_saida",
+    "Rack", "NPrateleira", "DPrateleira", "NCorredor", "DCorredor", "Zona",
+]
+
+
+def gerar_linhas(n: int):
+    inicio = datetime.datetime(2024, 1, 1, 8, 0)
+    return [
+        (
+            i, i % 5000, i % 4, inicio + datetime.timedelta(minutes=i),
+            Decimal("%d.00" % (i % 7)), Decimal("0.00"),
+            i % 30, i % 6, "Nível %d" % (i % 6), i % 12, "Corredor %d" % (i % 12),
+            "Zona %s" % "ABCD"[i % 4],
+        )
+        for i in range(n)
+    ]
+
+
+def medir(fn, repeticoes: int):
+    """(segundos de CPU por chamada, resultado da última chamada)"""
+    resultado = None
+    inicio = time.process_time()
+    for _ in range(repeticoes):
+        resultado = fn()
+    return (time.process_time() - inicio) / repeticoes, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--linhas", type=int, default=50000)
+    parser.add_argument("--repeticoes", type=int, default=3)
+    args = parser.parse_args()
+
+    rows = gerar_linhas(args.linhas)
+    print(f"{args.linhas} linhas x {len(COLUNAS)} colunas\n")
+
+    print("Serialização (CPU por pedido)")
+    antigo, corpo_antigo = medir(
+        lambda: json.dumps(jsonable_encoder([dict(zip(COLUNAS, r)) for r in rows])).encode("utf-8"),
+        args.repeticoes,
+    )
+    novo, corpo = medir(lambda: dumps(linhas_para_dicts(COLUNAS, rows)), args.repeticoes)
+    print(f"  jsonable_encoder + json  {antigo * 1000:9.1f} ms  {len(corpo_antigo):>12,} bytes")
+    print(f"  orjson                   {novo * 1000:9.1f} ms  {len(corpo):>12,} bytes")
+    print(f"  ganho                    {antigo / novo:9.1f}x\n")
+
+    print("Compressão do corpo orjson (bytes na rede e CPU por pedido)")
+    middleware = CompressaoMiddleware(app=None)
+    print(f"  {'identity':<8} {0:9.1f} ms  {len(corpo):>12,} bytes")
+    for codec in codecs_disponiveis():
+        cpu, comprimido = medir(
+            lambda: middleware.compressor(codec).comprimir(corpo, True), args.repeticoes
+        )
+        print(
+            f"  {codec:<8} {cpu * 1000:9.1f} ms  {len(comprimido):>12,} bytes"
+            f"  ({len(comprimido) / len(corpo):.1%}, nível {middleware.niveis[codec]})"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+from app.alteracoes import alteracoes_desde
+from app.tabelas import POR_CHAVE
+
+
+class FakeCursor:
+    """Responde às queries de change tracking com dados fixos."""
+
+    def __init__(self, versao, minima, alteracoes, tabela):
+        self.versao = versao
+        self.minima = minima
+        self.alteracoes = alteracoes
+        self.tabela = tabela
+        self._rows = []
+
+    def execute(self, sql, *params):
+        if "CURRENT_VERSION" in sql:
+            self._rows = [(self.versao,)]
+        elif "MIN_VALID_VERSION" in sql:
+            self._rows = [(self.minima,)]
+        elif "CHANGETABLE" in sql:
+            self._rows = self.alteracoes
+        else:
+            self._rows = self.tabela
+
+    def fetchone(self):
+        return self._rows[0]
+
+    def fetchall(self):
+        return self._rows
+
+
+def test_devolve_alterados_e_removidos():
+    tipos = POR_CHAVE["tipos"]
+    alteracoes = [("I", 1, 1, "Ferramenta"), ("D", 2, None, None), ("U", 3, 3, "EPI")]
+    cur = FakeCursor(10, 2, alteracoes, [])
+    resultado = alteracoes_desde(cur, [tipos], 5)
+    assert resultado["versao"] == 10
+    delta = resultado["tabelas"]["tipos"]
+    assert delta["reset"] is False
+    assert delta["alterados"] == [
+        {"ID_tipo": 1, "Designacao": "Ferramenta"},
+        {"ID_tipo": 3, "Designacao": "EPI"},
+    ]
+    assert delta["removidos"] == [2]
+
+
+def test_token_antigo_faz_reset():
+    tipos = POR_CHAVE["tipos"]
+    cur = FakeCursor(10, 6, [], [(1, "Ferramenta")])
+    delta = alteracoes_desde(cur, [tipos], 5)["tabelas"]["tipos"]
+    assert delta["reset"] is True
+    assert delta["alterados"] == [{"ID_tipo": 1, "Designacao": "Ferramenta"}]
@@ -0,0 +1,61 @@
+from datetime import date
+
+import numpy as np
+
+from app.analytics import MovimentosColunares, consumo, series
+
+
+def _dia(d):
+    return (d - date(1970, 1, 1)).days
+
+
+def _movimentos():
+    return MovimentosColunares.de_linhas([
+        [
+            (1, _dia(date(2025, 3, 3)), 100, 0),   # segunda-feira
+            (1, _dia(date(2025, 3, 5)), 0, 10),
+            (1, _dia(date(2025, 3, 12)), 0, 20),
+            (2, _dia(date(2025, 3, 4)), 5, None),
+        ],
+        [(2, _dia(date(2025, 2, 1)), 0, 1)],
+    ])
+
+
+def test_series_por_semana_e_mes():
+    mov = _movimentos()
+    semanas = series(mov, "semana", np.datetime64("2025-03-01"), np.datetime64("2025-03-31"))
+    assert semanas["series"] == [
+        {"ID_artigo": 1, "periodos": ["2025-03-03", "2025-03-10"],
+         "entradas": [100.0, 0.0], "saidas": [10.0, 20.0]},
+        {"ID_artigo": 2, "periodos": ["2025-03-03"], "entradas": [5.0], "saidas": [0.0]},
+    ]
+    meses = series(
+        mov, "mes", np.datetime64("2025-01-01"), np.datetime64("2025-03-31"), artigos=[2]
+    )
+    assert meses["series"] == [
+        {"ID_artigo": 2, "periodos": ["2025-02", "2025-03"],
+         "entradas": [0.0, 5.0], "saidas": [1.0, 0.0]},
+    ]
+
+
+def test_consumo_cobertura_e_ponto_de_encomenda():
+    mov = _movimentos()
+    resultado = consumo(mov, np.datetime64("2025-03-12"), janela=10, prazo=5, seguranca=5)
+    assert resultado["ID_artigo"].tolist() == [1, 2]
+    assert resultado["saldo"].tolist() == [70.0, 4.0]
+    assert resultado["consumo_diario"].tolist() == [3.0, 0.0]
+    assert round(resultado["dias_cobertura"][0], 2) == 23.33
+    assert np.isinf(resultado["dias_cobertura"][1])
+    assert resultado["abaixo_ponto"].tolist() == [False, False]
+
+    apertado = consumo(mov, np.datetime64("2025-03-12"), janela=10, prazo=20, seguranca=5)
+    assert apertado["ponto_encomenda"][0] == 75.0
+    assert apertado["abaixo_ponto"].tolist() == [True, False]
+
+
+def test_resultados_em_cache_por_colunas():
+    mov = _movimentos()
+    chamadas = []
+    for _ in range(2):
+        mov.resultado("x", lambda: chamadas.append(1) or len(chamadas))
+    assert chamadas == [1]
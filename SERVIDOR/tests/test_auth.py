@@ -0,0 +1,86 @@
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import app.auth as auth
+from app import senhas, sessoes
+from app.main import app
+
+
+def test_hash_e_passwords_antigas():
+    guardado = senhas.gerar_hash("segredo", n=2 ** 10)
+    assert guardado.startswith(senhas.PREFIXO) and "segredo" not in guardado
+    assert senhas.verificar("segredo", guardado) == (True, True)  # custo abaixo do atual
+    assert senhas.verificar("outra", guardado) == (False, False)
+    assert senhas.verificar("segredo", senhas.gerar_hash("segredo")) == (True, False)
+    # Texto (antigo): aceite, mas para trocar pelo hash
+    assert senhas.verificar("segredo", "segredo") == (True, True)
+    assert senhas.verificar("segredo", None) == (False, False)
+    # Hash estragado na BD: password errada, não erro
+    assert senhas.verificar("segredo", guardado.rsplit("$", 1)[0] + "$A") == (False, False)
+    assert senhas.verificar("segredo", senhas.PREFIXO + "1$2$3") == (False, False)
+
+
+def test_token_assinado_e_expirado():
+    token, expira = sessoes.emitir_token(7, "ana")
+    dados = sessoes.validar_token(token)
+    assert dados["sub"] == 7 and dados["exp"] == expira
+    payload, assinatura = token.split(".")
+    for errado in (payload + "x." + assinatura, "lixo", token + "é"):
+        with pytest.raises(HTTPException) as erro:
+            sessoes.validar_token(errado)
+        assert erro.value.status_code == 401
+    antigo, _ = sessoes.emitir_token(7, "ana", validade=-1)
+    with pytest.raises(HTTPException) as erro:
+        sessoes.validar_token(antigo)
+    assert erro.value.detail == "Token expirado"
+
+
+def test_login_troca_password_e_token_serve_sem_bd(monkeypatch):
+    utilizadores = {"ana": [7, "Ana", "ana@x.pt", "ana", "segredo", True]}
+    leituras = []
+    monkeypatch.setattr(auth, "_ler_utilizador", lambda username: utilizadores.get(username))
+    monkeypatch.setattr(
+        auth, "_guardar_hash",
+        lambda id_utilizador, antigo, novo: utilizadores["ana"].__setitem__(4, novo),
+    )
+    monkeypatch.setattr(
+        sessoes, "_ler_utilizador", lambda id_utilizador: leituras.append(id_utilizador)
+    )
+    sessoes.cache_utilizadores.revogar()
+
+    c = TestClient(app)
+    errada = c.post("/auth/login", json={"username": "ana", "password": "errada"}).json()
+    assert not errada["success"]
+    r = c.post("/auth/login", json={"username": "ana", "password": "segredo"}).json()
+    assert r["success"] and r["token_type"] == "bearer" and "Password" not in r["utilizador"]
+    # Por omissão a password fica em texto (login offline da app)
+    assert utilizadores["ana"][4] == "segredo"
+    monkeypatch.setattr(auth.settings, "auth_atualizar_hash", True)
+    assert c.post("/auth/login", json={"username": "ana", "password": "segredo"}).json()["success"]
+    assert utilizadores["ana"][4].startswith(senhas.PREFIXO)
+    # Já com o hash (verificado no pool de processos)
+    assert c.post("/auth/login", json={"username": "ana", "password": "segredo"}).json()["success"]
+
+    cabecalho = {"Authorization": f"Bearer {r['access_token']}"}
+    assert c.get("/auth/me", headers=cabecalho).json()["ID_utilizador"] == 7
+    assert leituras == []
+    assert c.get("/auth/me").status_code == 401
+
+    # Utilizador desativado: a cache é limpa e a BD diz que já não está ativo
+    sessoes.cache_utilizadores.revogar(7)
+    assert c.get("/auth/me", headers=cabecalho).status_code == 401
+    assert leituras == [7]
+    senhas.fechar_pool_senhas()
+
+
+def test_admin_exige_token(monkeypatch):
+    monkeypatch.setattr(sessoes, "_ler_utilizador", lambda id_utilizador: {"ID_utilizador": 7})
+    sessoes.cache_utilizadores.revogar()
+    c = TestClient(app)
+    for metodo, rota in [("get", "/admin/cache"), ("post", "/admin/auth/revogar"),
+                         ("post", "/admin/imagens/recolher")]:
+        assert getattr(c, metodo)(rota).status_code == 401
+    token, _ = sessoes.emitir_token(7, "ana")
+    r = c.get("/admin/cache", headers={"Authorization": f"Bearer {token}"})
+    assert r.status_code == 200
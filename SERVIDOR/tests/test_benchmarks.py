@@ -0,0 +1,54 @@
+import datetime
+
+from benchmarks import bd_local
+from benchmarks.carga import comparar, percentil
+
+
+def test_bd_local_responde_como_o_pyodbc(tmp_path):
+    info = bd_local.criar(tmp_path / "bench.db", artigos=50, movimentos=200, imagens=0)
+    assert info["artigos"] == 50 and info["imagens"] == []
+
+    con = bd_local.Conexao(str(tmp_path / "bench.db"))
+    cur = con.cursor()
+    cur.execute(
+        "SELECT TOP (?) ID_movimento, Data_mov FROM dbo.Movimentos ORDER BY ID_movimento", (10,)
+    )
+    linhas = cur.fetchall()
+    assert len(linhas) == 10
+    assert isinstance(linhas[0][1], datetime.datetime)
+
+    referencia, cod_bar, _, _ = bd_local.codigos_do_artigo(7)
+    cur.execute("SELECT ID_artigo, Referencia FROM Artigo WHERE Cod_bar = ?", cod_bar)
+    assert cur.fetchone() == (7, referencia)
+
+    cur.execute("SELECT COUNT(*) FROM Utilizadores WHERE Ativo = 1")
+    assert cur.fetchone()[0] == 1
+    con.close()
+
+
+def test_percentil_posto_mais_proximo():
+    valores = [float(i) for i in range(1, 101)]
+    assert percentil(valores, 50) == 50.0
+    assert percentil(valores, 95) == 95.0
+    assert percentil(valores, 99) == 99.0
+    assert percentil([3.0], 99) == 3.0
+    assert percentil([], 50) == 0.0
+
+
+def test_comparar_assinala_regressoes():
+    def resultado(p95, pedidos_s, rss):
+        return {"cenarios": {"codigo": {
+            "p95_ms": p95, "pedidos_s": pedidos_s, "rss_pico_mib": rss, "erros": 0,
+        }}}
+
+    base = resultado(10.0, 1000.0, 100.0)
+    igual = resultado(11.0, 900.0, 110.0)
+    assert comparar(igual, base, 0.2) == []
+
+    pior = {"cenarios": {
+        "codigo": {"p95_ms": 15.0, "pedidos_s": 700.0, "rss_pico_mib": 130.0, "erros": 2},
+        "novo": {"p95_ms": 1.0, "pedidos_s": 1.0, "rss_pico_mib": None, "erros": 0},
+    }}
+    regressoes = comparar(pior, base, 0.2)
+    assert len(regressoes) == 4
+    assert all(r.startswith("codigo:") for r in regressoes)
@@ -0,0 +1,34 @@
+import io
+import json
+import tarfile
+
+from app.bundle_imagens import ler_partes, montar_bundle, tamanho_partes
+from app.conteudo_imagens import guardar_por_conteudo
+
+
+def test_tar_com_manifesto_e_cada_ficheiro_uma_vez(tmp_path):
+    a = guardar_por_conteudo(tmp_path, b"A" * 700, "jpg")
+    b = guardar_por_conteudo(tmp_path, b"B" * 10, "png")
+    manifesto, partes = montar_bundle(
+        [(1, str(a)), (2, str(a)), (3, str(b)), (4, None), (5, str(tmp_path / "nao_existe.jpg"))],
+        since="7",
+    )
+    assert [i["ID_artigo"] for i in manifesto["imagens"]] == [1, 2, 3]
+    assert manifesto["removidos"] == [4] and manifesto["em_falta"] == [5]
+
+    dados = b"".join(ler_partes(partes))
+    assert len(dados) == tamanho_partes(partes) and len(dados) % 512 == 0
+    with tarfile.open(fileobj=io.BytesIO(dados)) as tar:
+        nomes = tar.getnames()
+        assert nomes[0] == "manifest.json" and len(nomes) == 3
+        assert json.loads(tar.extractfile("manifest.json").read()) == manifesto
+        assert tar.extractfile(manifesto["imagens"][0]["ficheiro"]).read() == b"A" * 700
+
+
+def test_intervalos_juntos_dao_o_tar_inteiro(tmp_path):
+    a = guardar_por_conteudo(tmp_path, bytes(range(256)) * 9, "jpg")
+    _, partes = montar_bundle([(1, str(a))])
+    inteiro = b"".join(ler_partes(partes))
+    cortes = [0, 100, 513, 1500, 2900, len(inteiro)]
+    pedacos = [b"".join(ler_partes(partes, i, f)) for i, f in zip(cortes, cortes[1:])]
+    assert b"".join(pedacos) == inteiro
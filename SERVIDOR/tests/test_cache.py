@@ -0,0 +1,28 @@
+from app.cache import CacheTTL
+
+
+def test_cache_hit_miss_e_invalidacao():
+    cache = CacheTTL({"tipos": 60})
+    cargas = []
+
+    def carregar():
+        cargas.append(1)
+        return [{"ID_tipo": 1, "Designacao": "Ferramenta"}]
+
+    assert cache.obter("tipos", carregar) == cache.obter("tipos", carregar)
+    assert len(cargas) == 1
+    assert cache.stats()["tipos"]["hits"] == 1
+    assert cache.stats()["tipos"]["misses"] == 1
+
+    cache.invalidar("tipos")
+    cache.obter("tipos", carregar)
+    assert len(cargas) == 2
+    assert cache.stats()["tipos"]["invalidacoes"] == 1
+
+
+def test_cache_expira():
+    cache = CacheTTL({"armazens": 0})
+    cargas = []
+    cache.obter("armazens", lambda: cargas.append(1))
+    cache.obter("armazens", lambda: cargas.append(1))
+    assert len(cargas) == 2
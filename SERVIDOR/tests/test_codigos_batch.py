@@ -0,0 +1,117 @@
+import asyncio
+from contextlib import contextmanager
+
+import pytest
+from fastapi import HTTPException
+
+from app import artigos
+from app.config import settings
+from app.indice_codigos import IndiceCodigos
+
+
+def _linha(id_artigo, referencia=None, cod_bar=None, cod_nfc=None, cod_rfid=None):
+    # Colunas de _COLUNAS_ARTIGO
+    return (id_artigo, None, None, referencia, f"Artigo {id_artigo}", None,
+            cod_bar, cod_nfc, cod_rfid)
+
+
+class FakeCursor:
+    """Devolve sempre as mesmas linhas; guarda os parâmetros de cada consulta."""
+
+    def __init__(self, linhas):
+        self.linhas = linhas
+        self.consultas = []
+
+    def execute(self, sql, params):
+        self.consultas.append(list(params))
+
+    def fetchall(self):
+        return self.linhas
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def bd(monkeypatch):
+    cur = FakeCursor([])
+
+    @contextmanager
+    def get_leitura(consulta=None):
+        yield type("Conexao", (), {"cursor": lambda self: cur})()
+
+    monkeypatch.setattr(artigos, "get_leitura", get_leitura)
+    monkeypatch.setattr(artigos, "_referencias", lambda cur: ({}, {}))
+    return cur
+
+
+@pytest.fixture
+def indice(monkeypatch):
+    async def run_db(fn, *args):
+        return fn(*args)
+
+    novo = IndiceCodigos()
+    monkeypatch.setattr(artigos, "indice", novo)
+    monkeypatch.setattr(artigos, "_indice_fresco", lambda: True)
+    monkeypatch.setattr(artigos, "run_db", run_db)
+    return novo
+
+
+def _batch(codigos):
+    return asyncio.run(artigos.get_artigos_by_codigos(artigos.CodigosBatchRequest(codigos=codigos)))
+
+
+def test_bd_respeita_prioridade_das_colunas_e_menor_id(bd):
+    bd.linhas = [
+        _linha(5, referencia="X1"),
+        _linha(3, cod_rfid="x1 "),
+        _linha(2, cod_rfid="X1"),
+        _linha(9, cod_bar="Y"),
+        _linha(4, cod_bar="Y", cod_nfc="X1"),
+        _linha(7, referencia="OUTRO"),
+    ]
+    resolvidos = artigos._resolver_codigos_bd(["X1", "Y"])
+    # Cod_NFC do 4 ganha ao Cod_RFID; no Y empatam no Cod_bar e fica o menor ID
+    assert resolvidos["X1"]["ID_artigo"] == 4
+    assert resolvidos["Y"]["ID_artigo"] == 4
+    assert set(resolvidos) == {"X1", "Y"}
+    assert bd.consultas == [["X1", "Y"] * len(artigos.COLUNAS_CODIGO)]
+
+    bd.linhas = [_linha(5, referencia="X1"), _linha(3, cod_rfid="X1"), _linha(2, cod_rfid="X1")]
+    assert artigos._resolver_codigos_bd(["X1"])["X1"]["ID_artigo"] == 2
+
+
+def test_bd_consulta_em_lotes(bd):
+    chaves = [f"C{i}" for i in range(artigos._LOTE_IN // 2 + 1)]
+    assert artigos._resolver_codigos_bd(chaves) == {}
+    assert [len(p) for p in bd.consultas] == [
+        artigos._LOTE_IN // 2 * len(artigos.COLUNAS_CODIGO), len(artigos.COLUNAS_CODIGO),
+    ]
+
+
+def test_batch_limite_413(monkeypatch, indice):
+    monkeypatch.setattr(settings, "codigos_batch_max", 2)
+    with pytest.raises(HTTPException) as erro:
+        _batch(["A", "B", "C"])
+    assert erro.value.status_code == 413
+
+
+def test_batch_devolve_cada_codigo_como_foi_enviado(monkeypatch, indice):
+    indice.carregar([{"ID_artigo": 1, "Designacao": "Um", "Cod_bar": "ABC", "Cod_NFC": None,
+                      "Cod_RFID": None, "Referencia": None}])
+    pedidos_bd = []
+
+    def resolver(chaves):
+        pedidos_bd.append(chaves)
+        return {"DEF": {"ID_artigo": 2}}
+
+    monkeypatch.setattr(artigos, "_resolver_codigos_bd", resolver)
+    resposta = _batch([" abc", "ABC", "abc", "def", "zzz", "   ", "zzz"])
+
+    # Só os códigos que não estão no índice vão à BD, normalizados e sem repetidos
+    assert pedidos_bd == [["DEF", "ZZZ"]]
+    assert resposta["total"] == 7
+    assert {codigo: a["ID_artigo"] for codigo, a in resposta["encontrados"].items()} == {
+        " abc": 1, "ABC": 1, "abc": 1, "def": 2,
+    }
+    assert resposta["desconhecidos"] == ["zzz", "   "]
@@ -0,0 +1,59 @@
+import gzip
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.compressao import CompressaoMiddleware, escolher_codec
+
+
+def test_escolher_codec():
+    disponiveis = ["zstd", "br", "gzip"]
+    assert escolher_codec("gzip, deflate", disponiveis) == "gzip"
+    assert escolher_codec("gzip, br, zstd", disponiveis) == "zstd"
+    assert escolher_codec("gzip;q=1.0, br;q=0.5", disponiveis) == "gzip"
+    assert escolher_codec("*", ["gzip"]) == "gzip"
+    assert escolher_codec("gzip;q=0", disponiveis) is None
+    assert escolher_codec("", disponiveis) is None
+
+
+def _app():
+    app = FastAPI()
+    app.add_middleware(CompressaoMiddleware, minimo=100)
+
+    @app.get("/grande")
+    def grande():
+        return PlainTextResponse("linha\n" * 1000, headers={"ETag": '"v1"'})
+
+    @app.get("/pequeno")
+    def pequeno():
+        return PlainTextResponse("ok")
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse((b"x" * 50 for _ in range(10)), media_type="application/x-ndjson")
+
+    return app
+
+
+def test_middleware_gzip():
+    client = TestClient(_app())
+    r = client.get("/grande", headers={"Accept-Encoding": "gzip"})
+    assert r.headers["content-encoding"] == "gzip"
+    assert r.headers["etag"] == 'W/"v1"'
+    assert "Accept-Encoding" in r.headers["vary"]
+    assert r.text == "linha\n" * 1000
+
+    r = client.get("/pequeno", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in r.headers
+
+    r = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+    assert r.headers["content-encoding"] == "gzip"
+    assert r.content == b"x" * 500
+
+
+def test_gzip_stream_descomprime_por_partes():
+    client = TestClient(_app())
+    with client.stream("GET", "/stream", headers={"Accept-Encoding": "gzip"}) as r:
+        bruto = b"".join(r.iter_raw())
+    assert gzip.decompress(bruto) == b"x" * 500
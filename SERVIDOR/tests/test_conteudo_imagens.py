@@ -0,0 +1,73 @@
+import io
+
+import pytest
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+
+from app.conteudo_imagens import (
+    CACHE_IMUTAVEL,
+    extensao_segura,
+    guardar_por_conteudo,
+    hash_do_ficheiro,
+    instalar,
+    nome_por_conteudo,
+    receber_por_conteudo,
+    resposta_imagem,
+)
+
+
+def test_extensao_segura():
+    assert extensao_segura("foto.JPG") == "jpg"
+    assert extensao_segura("sem_extensao") == "jpg"
+    assert extensao_segura("x.php/../a") == "jpg"
+
+
+def test_mesmo_conteudo_mesmo_ficheiro(tmp_path):
+    a = guardar_por_conteudo(tmp_path, b"imagem", "png")
+    b = guardar_por_conteudo(tmp_path, b"imagem", "png")
+    assert a == b and a.read_bytes() == b"imagem"
+    assert hash_do_ficheiro(a) == a.name.split(".")[0]
+    antigo = tmp_path / "1_abc.png"
+    antigo.write_bytes(b"imagem")
+    assert hash_do_ficheiro(antigo) == hash_do_ficheiro(a)
+    assert [p.name for p in tmp_path.iterdir() if p.name.startswith(".")] == []
+
+
+def test_receber_em_blocos(tmp_path):
+    conteudo = b"x" * (3 * 1024 * 1024 + 7)
+    temporario, nome = receber_por_conteudo(tmp_path, io.BytesIO(conteudo), "jpg", len(conteudo))
+    assert nome == nome_por_conteudo(conteudo, "jpg") and temporario.read_bytes() == conteudo
+    destino = instalar(temporario, tmp_path / nome)
+    assert destino.read_bytes() == conteudo and not temporario.exists()
+
+    # A mesma imagem outra vez: fica o ficheiro que já existia
+    temporario, _ = receber_por_conteudo(tmp_path, io.BytesIO(conteudo), "jpg", len(conteudo))
+    assert instalar(temporario, destino) == destino and not temporario.exists()
+
+    with pytest.raises(HTTPException) as erro:
+        receber_por_conteudo(tmp_path, io.BytesIO(conteudo), "jpg", len(conteudo) - 1)
+    assert erro.value.status_code == 413
+    assert [p.name for p in tmp_path.iterdir()] == [destino.name]
+
+
+def test_304_e_range(tmp_path):
+    caminho = guardar_por_conteudo(tmp_path, bytes(range(256)) * 4, "jpg")
+    app = FastAPI()
+
+    @app.get("/img")
+    def img(request: Request):
+        return resposta_imagem(request, caminho, '"abc"', CACHE_IMUTAVEL)
+
+    client = TestClient(app)
+    r = client.get("/img")
+    assert r.status_code == 200 and r.headers["etag"] == '"abc"'
+    assert r.headers["cache-control"] == CACHE_IMUTAVEL
+    assert client.get("/img", headers={"If-None-Match": 'W/"abc"'}).status_code == 304
+    desde = r.headers["last-modified"]
+    assert client.get("/img", headers={"If-Modified-Since": desde}).status_code == 304
+
+    parcial = client.get("/img", headers={"Range": "bytes=10-19", "If-Range": '"abc"'})
+    assert parcial.status_code == 206 and parcial.content == bytes(range(10, 20))
+    # If-Range com outro ETag: o ficheiro mudou, vai inteiro
+    inteiro = client.get("/img", headers={"Range": "bytes=10-19", "If-Range": '"outro"'})
+    assert inteiro.status_code == 200
@@ -0,0 +1,124 @@
+import threading
+import time
+
+import pytest
+
+from app.db import PoolConexoes, PoolEsgotadoError
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, *params):
+        if self.conn.partida:
+            raise RuntimeError("ligação perdida")
+
+    def fetchone(self):
+        return (1,)
+
+    def close(self):
+        pass
+
+
+class FakeConn:
+    def __init__(self):
+        self.partida = False
+        self.fechada = False
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.fechada = True
+
+
+def _pool(**kwargs):
+    criadas = []
+
+    def fabrica():
+        c = FakeConn()
+        criadas.append(c)
+        return c
+
+    opts = dict(minimo=0, maximo=2, timeout=0.2, validar_apos=0)
+    opts.update(kwargs)
+    return PoolConexoes(fabrica, **opts), criadas
+
+
+def test_reutiliza_conexoes():
+    pool, criadas = _pool()
+    with pool.obter() as conn:
+        conn.cursor().execute("SELECT 1")
+    with pool.obter():
+        pass
+    assert len(criadas) == 1
+    assert criadas[0].commits == 2
+    assert pool.stats()["em_uso"] == 0
+
+
+def test_close_devolve_ao_pool():
+    pool, criadas = _pool()
+    conn = pool.obter()
+    assert pool.stats()["em_uso"] == 1
+    conn.close()
+    assert pool.stats()["em_uso"] == 0
+    assert pool.stats()["livres"] == 1
+    assert not criadas[0].fechada
+
+
+def test_timeout_quando_esgotado():
+    pool, _ = _pool(maximo=1)
+    conn = pool.obter()
+    with pytest.raises(PoolEsgotadoError):
+        pool.obter()
+    assert pool.stats()["timeouts"] == 1
+    conn.close()
+
+
+def test_espera_por_conexao_libertada():
+    pool, criadas = _pool(maximo=1, timeout=2)
+    conn = pool.obter()
+
+    def libertar():
+        time.sleep(0.05)
+        conn.close()
+
+    threading.Thread(target=libertar).start()
+    with pool.obter():
+        pass
+    stats = pool.stats()
+    assert len(criadas) == 1
+    assert stats["esperas"] == 1
+    assert stats["tempo_espera_max_ms"] > 0
+
+
+def test_descarta_conexao_invalida_no_checkout():
+    pool, criadas = _pool()
+    with pool.obter():
+        pass
+    criadas[0].partida = True
+    with pool.obter():
+        pass
+    assert len(criadas) == 2
+    assert criadas[0].fechada
+    assert pool.stats()["falhas_validacao"] == 1
+
+
+def test_manutencao_remove_paradas_e_mantem_minimo():
+    pool, criadas = _pool(minimo=1, maximo=3, max_idle=0.01)
+    a, b = pool.obter(), pool.obter()
+    a.close()
+    b.close()
+    time.sleep(0.02)
+    pool.manutencao()
+    assert pool.stats()["total"] == 1
+    assert sum(c.fechada for c in criadas) == 1
@@ -0,0 +1,39 @@
+import app.etag as etag
+
+
+class MonitorFixo:
+    def __init__(self, versoes, saudavel=True):
+        self.versoes = versoes
+        self._saudavel = saudavel
+
+    def saudavel(self):
+        return self._saudavel
+
+    def versao_tabela(self, chave):
+        return self.versoes.get(chave)
+
+
+def test_etag_muda_com_a_versao(monkeypatch):
+    monitor = MonitorFixo({"artigos": 10, "tipos": 3})
+    monkeypatch.setattr(etag, "monitor", monitor)
+    antes = etag.etag_tabelas(["artigos", "tipos"], "/artigos?")
+    assert antes == etag.etag_tabelas(["artigos", "tipos"], "/artigos?")
+    assert antes != etag.etag_tabelas(["artigos", "tipos"], "/artigos?limit=10")
+    monitor.versoes["tipos"] = 4
+    assert antes != etag.etag_tabelas(["artigos", "tipos"], "/artigos?")
+
+
+def test_sem_monitor_nao_ha_etag(monkeypatch):
+    monkeypatch.setattr(etag, "monitor", MonitorFixo({"tipos": 1}, saudavel=False))
+    assert etag.etag_tabelas(["tipos"]) is None
+    monkeypatch.setattr(etag, "monitor", MonitorFixo({}))
+    assert etag.etag_tabelas(["tipos"]) is None
+
+
+def test_if_none_match():
+    assert etag.corresponde('"abc"', '"abc"')
+    assert etag.corresponde('"x", W/"abc"', '"abc"')
+    assert etag.corresponde('"abc"', 'W/"abc"')
+    assert etag.corresponde("*", '"abc"')
+    assert not etag.corresponde('"abd"', '"abc"')
+    assert not etag.corresponde(None, '"abc"')
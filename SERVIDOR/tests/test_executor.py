@@ -0,0 +1,88 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.executor import ExecutorBD, ExecutorSaturadoError
+
+
+def test_executa_no_worker():
+    executor = ExecutorBD(workers=2, max_fila=0, timeout_fila=0, retry_after=1)
+
+    async def correr():
+        return await executor.executar(threading.current_thread)
+
+    thread = asyncio.run(correr())
+    assert thread.name.startswith("db")
+    assert executor.stats()["concluidas"] == 1
+    executor.fechar()
+
+
+def test_recusa_com_503_quando_cheio():
+    executor = ExecutorBD(workers=1, max_fila=1, timeout_fila=0, retry_after=3)
+    libertar = threading.Event()
+
+    async def correr():
+        bloqueados = [
+            asyncio.ensure_future(executor.executar(libertar.wait)) for _ in range(2)
+        ]
+        await asyncio.sleep(0.05)
+        with pytest.raises(ExecutorSaturadoError) as exc:
+            await executor.executar(lambda: None)
+        libertar.set()
+        await asyncio.gather(*bloqueados)
+        return exc.value
+
+    erro = asyncio.run(correr())
+    assert erro.status_code == 503
+    assert erro.headers["Retry-After"] == "3"
+    assert executor.stats()["rejeitadas"] == 1
+    executor.fechar()
+
+
+def test_expira_pedidos_parados_na_fila():
+    executor = ExecutorBD(workers=1, max_fila=5, timeout_fila=0.05, retry_after=1)
+    libertar = threading.Event()
+    corridos = []
+
+    async def correr():
+        bloqueado = asyncio.ensure_future(executor.executar(libertar.wait))
+        await asyncio.sleep(0.01)
+        # O 503 chega sem esperar que o worker fique livre
+        with pytest.raises(ExecutorSaturadoError):
+            await asyncio.wait_for(executor.executar(corridos.append, 1), 1)
+        assert not libertar.is_set()
+        libertar.set()
+        await bloqueado
+        await executor.executar(lambda: None)
+
+    asyncio.run(correr())
+    assert corridos == []
+    assert executor.stats()["expiradas"] == 1
+    assert executor.stats()["concluidas"] == 2
+    executor.fechar()
+
+
+def test_pedido_cancelado_conta_ate_o_worker_acabar():
+    executor = ExecutorBD(workers=1, max_fila=0, timeout_fila=0, retry_after=1)
+    libertar = threading.Event()
+
+    async def correr():
+        pedido = asyncio.ensure_future(executor.executar(libertar.wait))
+        await asyncio.sleep(0.05)
+        # O cliente desistiu, mas o worker continua ocupado
+        pedido.cancel()
+        await asyncio.sleep(0.01)
+        with pytest.raises(ExecutorSaturadoError):
+            await executor.executar(lambda: None)
+        libertar.set()
+        for _ in range(100):
+            stats = executor.stats()
+            if stats["em_execucao"] == stats["em_fila"] == 0:
+                break
+            await asyncio.sleep(0.01)
+        return await executor.executar(lambda: "ok")
+
+    assert asyncio.run(correr()) == "ok"
+    assert executor.stats()["rejeitadas"] == 1
+    executor.fechar()
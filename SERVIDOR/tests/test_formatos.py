@@ -0,0 +1,34 @@
+import datetime
+from decimal import Decimal
+
+from app.formatos import tabela_compacta, tipos_offline
+
+
+def test_tipos_offline_do_schema():
+    tipos = tipos_offline()
+    assert tipos["MOVIMENTOS"]["Qtd_entrada"] == "REAL"
+    assert tipos["MOVIMENTOS"]["Data_mov"] == "TEXT"
+    assert tipos["ARTIGO"]["ID_artigo"] == "INTEGER"
+
+
+def test_tabela_compacta_converte_para_tipos_offline():
+    rows = [
+        (1, 10, 2, datetime.datetime(2024, 3, 1, 9, 0), Decimal("5.00"), None,
+         "7", 1, "Topo", 3, "Esq", "B"),
+        (2, 11, 2, datetime.datetime(2024, 3, 2, 9, 0), Decimal("0"), Decimal("1.5"),
+         8, 2, None, 3, "Dir", 4),
+    ]
+    colunas = ["ID_movimento", "ID_artigo", "ID_armazem", "Data_mov", "Qtd_entrada", "Qtd_saida",
+               "Rack", "NPrateleira", "DPrateleira", "NCorredor", "DCorredor", "Zona"]
+    resultado = tabela_compacta("MOVIMENTOS", colunas, rows, "colunas")
+    valores = dict(zip(resultado["colunas"], resultado["valores"]))
+    assert valores["Data_mov"] == ["2024-03-01T09:00:00", "2024-03-02T09:00:00"]
+    assert valores["Qtd_entrada"] == [5.0, 0.0]
+    assert valores["Qtd_saida"] == [None, 1.5]
+    # Afinidade do SQLite: texto numérico passa a número, o resto fica texto
+    assert valores["Rack"] == [7, 8]
+    assert valores["Zona"] == ["B", 4]
+
+    linhas = tabela_compacta("MOVIMENTOS", colunas, rows, "linhas")["linhas"]
+    assert linhas[0][:3] == [1, 10, 2]
+    assert tabela_compacta("TIPO", ["ID_tipo", "Designacao"], [], "colunas")["valores"] == [[], []]
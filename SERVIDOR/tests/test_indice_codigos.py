@@ -0,0 +1,47 @@
+from app.indice_codigos import IndiceCodigos, normalizar_codigo
+
+
+def _artigo(id_artigo, **codigos):
+    artigo = {"ID_artigo": id_artigo, "Designacao": f"Artigo {id_artigo}",
+              "Cod_bar": None, "Cod_NFC": None, "Cod_RFID": None, "Referencia": None}
+    artigo.update(codigos)
+    return artigo
+
+
+def test_normalizar_codigo():
+    assert normalizar_codigo(" abc123\n") == "ABC123"
+    assert normalizar_codigo("   ") is None
+    assert normalizar_codigo(None) is None
+
+
+def test_procura_por_qualquer_coluna():
+    indice = IndiceCodigos()
+    indice.carregar([_artigo(1, Cod_bar="560001", Cod_NFC="04:AB:CD", Referencia="REF-1")])
+    assert indice.procurar("560001")["ID_artigo"] == 1
+    assert indice.procurar("04:ab:cd")["ID_artigo"] == 1
+    assert indice.procurar(" ref-1 ")["ID_artigo"] == 1
+    assert indice.procurar("nada") is None
+
+
+def test_colisao_respeita_prioridade_das_colunas():
+    indice = IndiceCodigos()
+    indice.carregar([_artigo(1, Referencia="X1"), _artigo(2, Cod_bar="X1")])
+    assert indice.procurar("X1")["ID_artigo"] == 2
+    colisoes = indice.colisoes()
+    assert colisoes == [{
+        "codigo": "X1",
+        "artigos": [
+            {"ID_artigo": 2, "coluna": "Cod_bar"},
+            {"ID_artigo": 1, "coluna": "Referencia"},
+        ],
+    }]
+
+
+def test_atualizar_troca_codigos_e_remove():
+    indice = IndiceCodigos()
+    indice.carregar([_artigo(1, Cod_bar="A"), _artigo(2, Cod_bar="B")])
+    indice.atualizar([_artigo(1, Cod_bar="C")], removidos=[2])
+    assert indice.procurar("A") is None
+    assert indice.procurar("B") is None
+    assert indice.procurar("C")["ID_artigo"] == 1
+    assert indice.stats()["codigos"] == 1
@@ -0,0 +1,66 @@
+from contextlib import contextmanager
+
+import app.leitura as leitura
+
+CONSULTAS = {"artigos": "SELECT * FROM ARTIGO", "movimentos": "SELECT * FROM MOVIMENTOS"}
+
+
+def _simular(monkeypatch, versoes, snapshot=True):
+    versoes = iter(versoes)
+    monkeypatch.setattr(leitura, "snapshot_disponivel", lambda: snapshot)
+    monkeypatch.setattr(
+        leitura, "_ler", lambda chave, sql, conv, snap: (next(versoes), chave.upper(), 1.0)
+    )
+    monkeypatch.setattr(
+        leitura, "_ler_em_serie",
+        lambda consultas, conv, snap: (
+            99, {c: "SERIE" for c in consultas}, {c: 1.0 for c in consultas}
+        ),
+    )
+
+
+def test_versoes_iguais_a_primeira(monkeypatch):
+    _simular(monkeypatch, [7, 7])
+    dados, info = leitura.ler_tabelas(CONSULTAS, None)
+    assert dados == {"artigos": "ARTIGOS", "movimentos": "MOVIMENTOS"}
+    assert info["versao"] == 7 and info["consistente"] and info["modo"] == "paralelo"
+    assert set(info["tempos_ms"]) == set(CONSULTAS)
+
+
+def test_versoes_diferentes_repete_e_acaba_em_serie(monkeypatch):
+    _simular(monkeypatch, [7, 8, 8, 9, 9, 10])
+    dados, info = leitura.ler_tabelas(CONSULTAS, None, tentativas=3)
+    assert dados == {"artigos": "SERIE", "movimentos": "SERIE"}
+    assert info["modo"] == "serie" and info["versao"] == 99 and info["tentativas"] == 4
+
+
+def test_sem_snapshot_devolve_a_menor_versao(monkeypatch):
+    _simular(monkeypatch, [7, 8], snapshot=False)
+    _, info = leitura.ler_tabelas(CONSULTAS, None)
+    assert info["versao"] == 7 and not info["consistente"]
+
+
+def test_snapshot_disponivel_so_guarda_resposta_da_bd(monkeypatch):
+    respostas = [RuntimeError("BD em baixo"), (1,)]
+
+    class Cursor:
+        def execute(self, sql):
+            self.resposta = respostas.pop(0)
+            if isinstance(self.resposta, Exception):
+                raise self.resposta
+
+        def fetchone(self):
+            return self.resposta
+
+        def close(self):
+            pass
+
+    @contextmanager
+    def get_connection():
+        yield type("Conexao", (), {"cursor": lambda self: Cursor()})()
+
+    monkeypatch.setattr(leitura, "get_connection", get_connection)
+    monkeypatch.setattr(leitura, "_snapshot_disponivel", None)
+    assert leitura.snapshot_disponivel() is False
+    assert leitura.snapshot_disponivel() is True
+    assert leitura.snapshot_disponivel() is True and respostas == []
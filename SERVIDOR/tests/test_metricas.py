@@ -0,0 +1,63 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.db import CursorMedido
+from app.metricas import MetricasMiddleware, Registo, bd_execute, bd_linhas, http_pedidos, registo
+
+
+def test_histograma_em_formato_prometheus():
+    r = Registo()
+    h = r.histograma("t_segundos", "Teste.", ("rota",), buckets=(0.1, 1.0))
+    h.observar(0.05, "/a")
+    h.observar(0.5, "/a")
+    h.observar(5, "/a")
+    texto = r.expor()
+    assert "# TYPE t_segundos histogram" in texto
+    assert 't_segundos_bucket{rota="/a",le="0.1"} 1' in texto
+    assert 't_segundos_bucket{rota="/a",le="1"} 2' in texto
+    assert 't_segundos_bucket{rota="/a",le="+Inf"} 3' in texto
+    assert 't_segundos_count{rota="/a"} 3' in texto and 't_segundos_sum{rota="/a"} 5.55' in texto
+
+
+def test_middleware_usa_o_template_da_rota():
+    app = FastAPI()
+    app.add_middleware(MetricasMiddleware)
+
+    @app.get("/itens/{id_item}")
+    def item(id_item: int):
+        return {"id": id_item}
+
+    c = TestClient(app)
+    antes = http_pedidos.valor("GET", "/itens/{id_item}", "200")
+    c.get("/itens/1")
+    c.get("/itens/2")
+    c.get("/nao/existe")
+    assert http_pedidos.valor("GET", "/itens/{id_item}", "200") == antes + 2
+    assert http_pedidos.valor("GET", "<sem rota>", "404") >= 1
+    bucket = 'armazem_http_duracao_segundos_bucket{metodo="GET",rota="/itens/{id_item}"'
+    assert bucket in registo.expor()
+
+
+class _Cursor:
+    def __init__(self):
+        self.fast_executemany = False
+
+    def execute(self, sql, *args):
+        return self
+
+    def fetchall(self):
+        return [(1,), (2,), (3,)]
+
+    def fetchone(self):
+        return None
+
+
+def test_cursor_medido_conta_execute_e_linhas():
+    raw = _Cursor()
+    cur = CursorMedido(raw, "teste.consulta")
+    assert cur.execute("SELECT 1").fetchall() == [(1,), (2,), (3,)]
+    assert cur.fetchone() is None
+    cur.fast_executemany = True
+    assert raw.fast_executemany
+    assert bd_execute.contagem("teste.consulta") == 1
+    assert bd_linhas.valor("teste.consulta") == 3
@@ -0,0 +1,59 @@
+import time
+
+import cv2
+import numpy as np
+
+from app.miniaturas import (
+    TAMANHOS,
+    GeradorMiniaturas,
+    caminho_derivada,
+    gerar_derivadas,
+    remover_derivadas,
+)
+
+
+def _imagem(pasta, nome="1_abc.jpg", largura=2000, altura=1000):
+    caminho = pasta / nome
+    imagem = np.zeros((altura, largura, 3), dtype=np.uint8)
+    imagem[:, : largura // 2] = (0, 0, 255)
+    ok, dados = cv2.imencode(".jpg", imagem)
+    caminho.write_bytes(dados.tobytes())
+    return caminho
+
+
+def test_gera_todos_os_tamanhos_em_webp(tmp_path):
+    original = _imagem(tmp_path)
+    gerados = gerar_derivadas(original, qualidade=70)
+    assert set(gerados) == set(TAMANHOS)
+    for tamanho, caminho in gerados.items():
+        imagem = cv2.imdecode(np.fromfile(str(caminho), dtype=np.uint8), cv2.IMREAD_COLOR)
+        assert caminho.read_bytes()[8:12] == b"WEBP"
+        assert imagem.shape[1] == TAMANHOS[tamanho] and imagem.shape[0] == TAMANHOS[tamanho] // 2
+    remover_derivadas(original)
+    assert not any(caminho.exists() for caminho in gerados.values())
+
+
+def test_imagem_pequena_nao_e_aumentada(tmp_path):
+    original = _imagem(tmp_path, largura=300, altura=200)
+    gerados = gerar_derivadas(original)
+    imagem = cv2.imdecode(np.fromfile(str(gerados["detail"]), dtype=np.uint8), cv2.IMREAD_COLOR)
+    assert imagem.shape[:2] == (200, 300)
+
+
+def test_preencher_so_agenda_o_que_falta(tmp_path):
+    com = _imagem(tmp_path, "1_com.jpg", 400, 400)
+    gerar_derivadas(com)
+    sem = _imagem(tmp_path, "2_sem.jpg", 400, 400)
+    (tmp_path / "notas.txt").write_text("x")
+
+    gerador = GeradorMiniaturas(1)
+    try:
+        assert gerador.preencher(tmp_path) == 1
+        for _ in range(100):
+            if gerador.stats()["pendentes"] == 0:
+                break
+            time.sleep(0.05)
+        assert gerador.stats()["geradas"] == 1
+        assert caminho_derivada(sem, "thumb").is_file()
+    finally:
+        gerador.parar()
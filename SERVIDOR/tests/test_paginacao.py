@@ -0,0 +1,33 @@
+import pytest
+from fastapi import HTTPException
+
+from app.paginacao import codificar_cursor, consulta_keyset, descodificar_cursor
+
+
+def test_cursor_ida_e_volta():
+    cursor = codificar_cursor(["Parafuso M6", 42])
+    assert "=" not in cursor
+    assert descodificar_cursor(cursor, 2) == ["Parafuso M6", 42]
+
+
+def test_cursor_invalido():
+    with pytest.raises(HTTPException) as exc:
+        descodificar_cursor("nao-e-um-cursor", 2)
+    assert exc.value.status_code == 400
+    with pytest.raises(HTTPException):
+        descodificar_cursor(codificar_cursor([1]), 2)
+
+
+def test_consulta_sem_paginacao():
+    sql, params = consulta_keyset("ID_tipo, Designacao", "Tipo", ["ID_tipo"], None, None)
+    assert sql.split() == "SELECT ID_tipo, Designacao FROM Tipo ORDER BY ID_tipo".split()
+    assert params == ()
+
+
+def test_consulta_keyset_com_duas_chaves():
+    chaves = ["a.Designacao", "a.ID_artigo"]
+    sql, params = consulta_keyset("*", "Artigo a", chaves, 50, ["Broca", 7])
+    assert "TOP (?)" in sql
+    assert "(a.Designacao > ?) OR (a.Designacao = ? AND a.ID_artigo > ?)" in sql
+    assert sql.rstrip().endswith("ORDER BY a.Designacao, a.ID_artigo")
+    assert params == (51, "Broca", "Broca", 7)
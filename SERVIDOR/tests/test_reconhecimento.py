@@ -0,0 +1,71 @@
+import cv2
+import numpy as np
+
+from app.reconhecimento import IndiceReconhecimento, descritores, vizinhos
+
+
+def _textura(semente: int) -> np.ndarray:
+    rng = np.random.default_rng(semente)
+    ruido = rng.integers(0, 256, (60, 80), dtype=np.uint8)
+    return cv2.resize(ruido, (640, 480), interpolation=cv2.INTER_CUBIC)
+
+
+def _gravar(caminho, imagem):
+    caminho.write_bytes(cv2.imencode(".png", imagem)[1].tobytes())
+    return caminho
+
+
+def test_vizinhos_igual_a_forca_bruta():
+    rng = np.random.default_rng(0)
+    base = rng.integers(0, 256, (3000, 32), dtype=np.uint8)
+    consulta = rng.integers(0, 256, (40, 32), dtype=np.uint8)
+    linha, d1, d2 = vizinhos(consulta, np.ascontiguousarray(base.view(np.uint64).T))
+    distancias = np.unpackbits(consulta[:, None, :] ^ base[None, :, :], axis=2).sum(axis=2)
+    ordenadas = np.sort(distancias, axis=1)
+    assert (d1 == ordenadas[:, 0]).all() and (d2 == ordenadas[:, 1]).all()
+    assert (distancias[np.arange(40), linha] == d1).all()
+
+
+def test_reconhece_e_guarda(tmp_path):
+    indice = IndiceReconhecimento(tmp_path / "indice.npz")
+    imagens = [_gravar(tmp_path / f"{i}.png", _textura(i)) for i in range(3)]
+    for imagem in imagens:
+        indice._adicionar(str(imagem))
+
+    # O mesmo objeto, rodado e mais pequeno
+    frame = cv2.resize(cv2.rotate(_textura(1), cv2.ROTATE_90_CLOCKWISE), (300, 400))
+    consulta = descritores(cv2.imencode(".jpg", frame)[1], 200)
+    encontrados = indice.procurar(consulta, 2)
+    assert encontrados[0][0] == str(imagens[1]) and encontrados[0][1] > 0.1
+
+    indice.guardar()
+    outro = IndiceReconhecimento(tmp_path / "indice.npz")
+    assert outro.carregar()
+    assert outro.stats()["descritores"] == indice.stats()["descritores"]
+    assert outro.procurar(consulta, 2) == encontrados
+
+    outro._retirar(str(imagens[1]))
+    assert all(caminho != str(imagens[1]) for caminho, _, _ in outro.procurar(consulta, 3))
+
+
+def test_adicionar_igual_a_empacotar_de_uma_vez(tmp_path):
+    imagens = [str(_gravar(tmp_path / f"{i}.png", _textura(i))) for i in range(4)]
+    incremental = IndiceReconhecimento(tmp_path / "a.npz")
+    for imagem in imagens:
+        incremental._adicionar(imagem)
+
+    de_uma_vez = IndiceReconhecimento(tmp_path / "b.npz")
+    de_uma_vez._preencher([], imagens)
+
+    for indice in (incremental, de_uma_vez):
+        assert indice._pacote[2] == imagens
+    for a, b in zip(incremental._pacote[:2], de_uma_vez._pacote[:2]):
+        assert a.shape == b.shape and (a == b).all()
+    assert incremental.stats()["descritores"] == de_uma_vez.stats()["descritores"] > 0
+
+    # Uma imagem substituída ou retirada volta a empacotar tudo
+    incremental._adicionar(imagens[1])
+    incremental._retirar(imagens[0])
+    de_uma_vez._preencher([imagens[0]], [])
+    for a, b in zip(incremental._pacote, de_uma_vez._pacote):
+        assert len(a) == len(b) and (np.asarray(a) == np.asarray(b)).all()
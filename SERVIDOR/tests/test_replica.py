@@ -0,0 +1,157 @@
+import datetime
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import pytest
+
+from app import artigos
+from app import replica as modulo
+from app.formatos import SCHEMA_OFFLINE
+from app.replica import ReplicaLocal
+
+
+@pytest.fixture
+def primario(tmp_path, monkeypatch):
+    """SQL Server a fingir: SQLite com o schema offline e change tracking controlado pelo teste."""
+    con = sqlite3.connect(tmp_path / "primario.db", check_same_thread=False)
+    con.executescript(SCHEMA_OFFLINE.read_text(encoding="utf-8-sig"))
+    con.execute("CREATE VIEW Utilizadores AS SELECT * FROM UTILIZADOR")
+    con.execute(
+        "INSERT INTO UTILIZADOR (Nome, Email, Username, Password, Ativo)"
+        " VALUES ('Ana', 'a@x', 'ana', 'pw', 1)"
+    )
+    con.execute("INSERT INTO TIPO VALUES (1, 'Tipo 1')")
+    con.executemany(
+        "INSERT INTO ARTIGO (ID_artigo, ID_tipo, Designacao, Cod_NFC, Cod_RFID)"
+        " VALUES (?, 1, ?, ?, ?)",
+        [(1, "Um", None, None), (2, "Dois", "04:ab:cd", "e2000000abcd")],
+    )
+    con.execute(
+        "INSERT INTO MOVIMENTOS (ID_movimento, ID_artigo, ID_armazem, Data_mov, Qtd_entrada) "
+        "VALUES (1, 1, 1, '2025-01-02T10:00:00', 5)"
+    )
+    con.commit()
+    estado = {"versao": 5, "alteracoes": {}, "erro": None}
+
+    @contextmanager
+    def get_connection(consulta=None):
+        yield con
+
+    @contextmanager
+    def transacao_snapshot(cur, snapshot):
+        yield estado["versao"]
+
+    def ler_alteracoes(cur, tabela, desde):
+        if estado["erro"]:
+            raise RuntimeError(estado["erro"])
+        return estado["alteracoes"].get(tabela.chave, ([], []))
+
+    monkeypatch.setattr(modulo, "get_connection", get_connection)
+    monkeypatch.setattr(modulo, "snapshot_disponivel", lambda: False)
+    monkeypatch.setattr(modulo, "transacao_snapshot", transacao_snapshot)
+    monkeypatch.setattr(modulo, "versao_atual", lambda cur: estado["versao"])
+    monkeypatch.setattr(modulo, "versao_minima", lambda cur, tabela: 0)
+    monkeypatch.setattr(modulo, "ler_alteracoes", ler_alteracoes)
+    yield estado
+    con.close()
+
+
+def _ids(replica):
+    cur = replica.conexao("teste").cursor()
+    cur.execute("SELECT ID_artigo FROM Artigo ORDER BY ID_artigo")
+    ids = [row[0] for row in cur.fetchall()]
+    cur.close()
+    return ids
+
+
+def test_copia_e_alteracoes(tmp_path, primario):
+    replica = ReplicaLocal(tmp_path / "replica.sqlite", intervalo=300, atraso_max=600)
+    registos = replica.atualizar()
+    assert registos["artigos"] == 2 and registos["movimentos"] == 1
+    assert _ids(replica) == [1, 2]
+
+    cur = replica.conexao("teste").cursor()
+    cur.execute(
+        "SELECT TOP (?) ID_movimento, Data_mov FROM Movimentos ORDER BY ID_movimento", (10,)
+    )
+    assert cur.fetchall() == [(1, datetime.datetime(2025, 1, 2, 10, 0))]
+    cur.execute("SELECT Username FROM Utilizadores")
+    assert cur.fetchone() == ("ana",)
+    cur.close()
+
+    primario["versao"] = 6
+    primario["alteracoes"] = {
+        "artigos": ([{
+            "ID_artigo": 3, "ID_tipo": 1, "ID_familia": None, "Referencia": "R3",
+            "Designacao": "Três", "Imagem": None,
+            "Cod_bar": None, "Cod_NFC": None, "Cod_RFID": None,
+        }], [1]),
+    }
+    assert replica.atualizar(["artigos"], 6) == {"artigos": 2}
+    assert _ids(replica) == [2, 3]
+    assert replica.stats()["versao"] == 6
+
+    # Retoma a partir do disco, sem cópia completa
+    outra = ReplicaLocal(tmp_path / "replica.sqlite", intervalo=300, atraso_max=600)
+    assert outra.atualizar() == {}
+    assert outra.stats()["copias"] == 0 and _ids(outra) == [2, 3]
+    outra.parar()
+    replica.parar()
+
+
+def test_falha_ao_aplicar_manda_leituras_ao_primario(tmp_path, primario):
+    replica = ReplicaLocal(tmp_path / "replica.sqlite", intervalo=300, atraso_max=600)
+    replica.atualizar()
+    replica._thread = threading.current_thread()
+    assert replica.utilizavel()
+    assert replica.saude()["atraso_s"] is not None
+
+    primario["versao"] = 7
+    primario["erro"] = "rede em baixo"
+    replica.ao_alterar({"artigos": 7}, 5, 7)
+    assert not replica.utilizavel()
+    assert replica.saude()["erro"] == "rede em baixo"
+
+    primario["erro"] = None
+    replica.atualizar()
+    assert replica.utilizavel()
+
+    replica.atraso_max = 1
+    replica._em_dia -= 10
+    assert not replica.utilizavel()
+    replica._thread = None
+    replica.parar()
+
+
+def test_codigos_sem_distinguir_maiusculas(tmp_path, primario, monkeypatch):
+    """Como na collation do SQL Server: os códigos chegam normalizados em maiúsculas."""
+    replica = ReplicaLocal(tmp_path / "replica.sqlite", intervalo=300, atraso_max=600)
+    replica.atualizar()
+
+    @contextmanager
+    def get_leitura(consulta=None):
+        yield replica.conexao(consulta)
+
+    monkeypatch.setattr(artigos, "get_leitura", get_leitura)
+    monkeypatch.setattr(artigos, "_referencias", lambda cur: ({}, {}))
+    resolvidos = artigos._resolver_codigos_bd(["E2000000ABCD", "04:AB:CD", "NADA"])
+    assert {chave: a["ID_artigo"] for chave, a in resolvidos.items()} == {
+        "E2000000ABCD": 2, "04:AB:CD": 2,
+    }
+    assert artigos._get_artigo_by_codigo_bd(" E2000000abCD ")["ID_artigo"] == 2
+    replica.parar()
+
+
+def test_schema_antigo_e_copiado_de_novo(tmp_path, primario):
+    caminho = tmp_path / "replica.sqlite"
+    replica = ReplicaLocal(caminho, intervalo=300, atraso_max=600)
+    replica.atualizar()
+    replica.parar()
+    with sqlite3.connect(caminho) as sq:
+        sq.execute("PRAGMA user_version = 0")
+
+    outra = ReplicaLocal(caminho, intervalo=300, atraso_max=600)
+    assert outra.atualizar()["artigos"] == 2
+    assert outra.stats()["copias"] == 1 and _ids(outra) == [1, 2]
+    outra.parar()
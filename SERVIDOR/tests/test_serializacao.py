@@ -0,0 +1,14 @@
+import datetime
+from decimal import Decimal
+
+from app.serializacao import dumps, linhas_para_dicts
+
+
+def test_dumps_tipos_da_bd():
+    linhas = linhas_para_dicts(
+        ["ID", "Data", "Qtd", "Inteiro", "Nome"],
+        [(1, datetime.datetime(2024, 5, 1, 10, 30), Decimal("2.50"), Decimal("3"), "Ação")],
+    )
+    assert dumps(linhas) == (
+        '[{"ID":1,"Data":"2024-05-01T10:30:00","Qtd":2.5,"Inteiro":3,"Nome":"Ação"}]'
+    ).encode("utf-8")
@@ -0,0 +1,54 @@
+import json
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import snapshot
+from app.snapshot import ConstrutorSnapshot
+
+
+def _gravar(pasta, ident, criado_em):
+    (pasta / f"armazem-{ident}.sqlite.gz").write_bytes(b"x")
+    info = {
+        "id": ident,
+        "versao": None,
+        "ficheiro": f"armazem-{ident}.sqlite.gz",
+        "criado_em": criado_em,
+    }
+    (pasta / f"armazem-{ident}.json").write_text(json.dumps(info), encoding="utf-8")
+
+
+def test_carregar_existente_e_limpar(tmp_path):
+    for i, ident in enumerate(["10", "11", "12"]):
+        _gravar(tmp_path, ident, f"2024-01-0{i + 1}T00:00:00")
+    construtor = ConstrutorSnapshot(tmp_path, intervalo=3600, intervalo_min=60, manter=2)
+    construtor.carregar_existente()
+    assert construtor.atual["id"] == "12"
+
+    construtor._limpar()
+    assert construtor.caminho("10") is None
+    assert construtor.caminho("11") is not None
+    assert construtor.caminho("12") is not None
+
+
+def test_caminho_nao_sai_da_pasta(tmp_path):
+    construtor = ConstrutorSnapshot(tmp_path, intervalo=3600, intervalo_min=60, manter=2)
+    assert construtor.caminho("../segredo") is None
+    assert construtor.caminho(".construcao") is None
+
+
+def test_download_retoma_com_range(tmp_path, monkeypatch):
+    _gravar(tmp_path, "12", "2024-01-01T00:00:00")
+    (tmp_path / "armazem-12.sqlite.gz").write_bytes(bytes(range(100)))
+    info = json.loads((tmp_path / "armazem-12.json").read_text(encoding="utf-8"))
+    info["sha256"] = "abc"
+    (tmp_path / "armazem-12.json").write_text(json.dumps(info), encoding="utf-8")
+    construtor = ConstrutorSnapshot(tmp_path, intervalo=3600, intervalo_min=60, manter=2)
+    monkeypatch.setattr(snapshot, "construtor", construtor)
+    app = FastAPI()
+    app.include_router(snapshot.router)
+
+    resposta = TestClient(app).get("/sync/snapshot/12", headers={"Range": "bytes=90-"})
+    assert resposta.status_code == 206
+    assert resposta.headers["content-range"] == "bytes 90-99/100"
+    assert resposta.content == bytes(range(90, 100))
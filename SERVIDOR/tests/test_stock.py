@@ -0,0 +1,85 @@
+from decimal import Decimal
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import etag, stock
+from app.stock import MotorStock, chave_linha
+
+
+def _mov(id_movimento, id_artigo, id_armazem, entrada, saida,
+         zona=1, corredor=None, prateleira=None):
+    # ID_movimento, ID_artigo, ID_armazem, Qtd_entrada, Qtd_saida, Zona,
+    # NCorredor, DCorredor, NPrateleira, DPrateleira, Rack
+    return (id_movimento, id_artigo, id_armazem, entrada, saida,
+            zona, corredor, None, prateleira, None, None)
+
+
+def test_saldo_por_artigo_armazem_e_localizacao():
+    motor = MotorStock()
+    motor.carregar([
+        _mov(1, 10, 1, Decimal("5"), 0),
+        _mov(2, 10, 1, 0, Decimal("2")),
+        _mov(3, 10, 2, 7, 0, zona=3),
+        _mov(4, 11, 1, 1.1, 0),
+    ], versao=5)
+
+    artigo = motor.artigo(10)
+    assert artigo["saldo"] == 10 and artigo["movimentos"] == 3 and artigo["versao"] == 5
+    assert [a["ID_armazem"] for a in artigo["armazens"]] == [1, 2]
+    assert artigo["armazens"][1]["localizacoes"][0]["Zona"] == 3
+
+    por_armazem = motor.linhas("armazem")
+    saldos = [(linha["ID_artigo"], linha["ID_armazem"], linha["saldo"]) for linha in por_armazem]
+    assert saldos == [(10, 1, 3), (10, 2, 7), (11, 1, 1.1)]
+    assert [linha["saldo"] for linha in motor.linhas("artigo", id_armazem=1)] == [3, 1.1]
+    assert motor.artigo(99)["saldo"] == 0 and motor.artigo(99)["armazens"] == []
+
+
+def test_aplicar_alteracoes_e_repetidos():
+    motor = MotorStock()
+    motor.carregar([_mov(1, 10, 1, 5, 0), _mov(2, 10, 1, 0, 2)], versao=5)
+
+    # Movimento 2 passa para outra prateleira e com outra quantidade; 3 é novo
+    alterados = [_mov(2, 10, 1, 0, 5, prateleira=4), _mov(3, 10, 1, 1, 0)]
+    motor.aplicar(alterados, [], versao=6)
+    motor.aplicar(alterados, [], versao=6)  # o mesmo delta outra vez não muda nada
+    assert motor.artigo(10)["saldo"] == 1
+    localizacoes = motor.linhas("localizacao", incluir_zeros=True)
+    saldos = [(linha["NPrateleira"], linha["saldo"]) for linha in localizacoes]
+    assert saldos == [(None, 6), (4, -5)]
+
+    motor.aplicar([], [1, 2, 3], versao=7)
+    assert motor.linhas("armazem", incluir_zeros=True) == []
+    assert motor.stats()["movimentos"] == 0
+
+
+def test_chave_linha_ordena_nulos_primeiro():
+    motor = MotorStock()
+    motor.carregar([_mov(1, 10, 1, 1, 0, zona=2), _mov(2, 10, 1, 1, 0, zona=None)], versao=1)
+    linhas = motor.linhas("localizacao")
+    assert [linha["Zona"] for linha in linhas] == [None, 2]
+    assert chave_linha(linhas[0], "localizacao")[:3] == [10, 1, [False, None]]
+
+
+def test_stock_do_artigo_tem_etag(monkeypatch):
+    class Monitor:
+        def saudavel(self):
+            return True
+
+        def versao_tabela(self, chave):
+            return 5
+
+    motor = MotorStock()
+    motor.carregar([_mov(1, 10, 1, 5, 0)], versao=5)
+    monkeypatch.setattr(etag, "monitor", Monitor())
+    monkeypatch.setattr(stock, "_stock_atualizado", lambda: motor)
+    app = FastAPI()
+    app.include_router(stock.router)
+
+    with TestClient(app) as cliente:
+        resposta = cliente.get("/stock/10")
+        assert resposta.status_code == 200 and resposta.json()["saldo"] == 5
+        assert resposta.headers["cache-control"] == "no-cache"
+        repetido = cliente.get("/stock/10", headers={"If-None-Match": resposta.headers["etag"]})
+        assert repetido.status_code == 304
@@ -0,0 +1,92 @@
+import datetime
+import json
+from contextlib import contextmanager
+from decimal import Decimal
+
+from app import CARREGAR_DADOS as modulo
+
+
+class FakeCursor:
+    """Devolve as linhas de cada tabela em lotes, como o fetchmany do pyodbc."""
+
+    def __init__(self, tabelas):
+        self.tabelas = tabelas
+        self.pedidos = []
+        self.description = None
+        self._rows = []
+
+    def execute(self, sql, *params):
+        tabela = sql.rsplit(" ", 1)[-1]
+        colunas, self._rows = self.tabelas[tabela]
+        self.description = [(c,) for c in colunas]
+
+    def fetchmany(self, n):
+        self.pedidos.append(n)
+        lote, self._rows = self._rows[:n], self._rows[n:]
+        return lote
+
+    def close(self):
+        pass
+
+
+class FakeConexao:
+    def __init__(self, cur):
+        self.cur = cur
+
+    def cursor(self):
+        return self.cur
+
+
+def _gerar(monkeypatch, tabelas, sync_tabelas, lote):
+    cur = FakeCursor(tabelas)
+
+    @contextmanager
+    def get_connection(consulta=None):
+        yield FakeConexao(cur)
+
+    @contextmanager
+    def transacao_snapshot(cur, snapshot):
+        yield 42
+
+    monkeypatch.setattr(modulo, "get_connection", get_connection)
+    monkeypatch.setattr(modulo, "snapshot_disponivel", lambda: True)
+    monkeypatch.setattr(modulo, "transacao_snapshot", transacao_snapshot)
+    partes = list(modulo._gerar_ndjson(sync_tabelas, lote))
+    return partes, cur
+
+
+def test_registos_e_lotes(monkeypatch):
+    data = datetime.datetime(2025, 1, 2, 10, 0)
+    tabelas = {
+        "TIPO": (["ID_tipo", "Designacao"], [(1, "A"), (2, "B"), (3, "C"), (4, "D"), (5, "E")]),
+        "MOVIMENTOS": (["ID_movimento", "Data_mov", "Qtd_entrada"], [(1, data, Decimal("2.5"))]),
+        "ESTADO": (["ID_estado"], []),
+    }
+    sync = [("tipos", "TIPO"), ("movimentos", "MOVIMENTOS"), ("estados", "ESTADO")]
+    partes, cur = _gerar(monkeypatch, tabelas, sync, lote=2)
+
+    # Cada tabela é lida com fetchmany(2) até vir vazio; um item por lote e por fim de tabela
+    assert cur.pedidos == [2] * 4 + [2] * 2 + [2]
+    assert len(partes) == 1 + (3 + 1) + (1 + 1) + 1 + 1
+    assert all(p.endswith(b"\n") for p in partes)
+    registos = [json.loads(linha) for linha in b"".join(partes).splitlines()]
+
+    assert registos[0]["tipo"] == "inicio" and "timestamp" in registos[0]
+    assert registos[1] == {
+        "tipo": "tabela", "tabela": "tipos", "colunas": ["ID_tipo", "Designacao"],
+    }
+    assert registos[2:7] == [{"ID_tipo": i, "Designacao": d} for i, d in enumerate("ABCDE", 1)]
+    assert registos[7] == {"tipo": "fim_tabela", "tabela": "tipos", "registos": 5}
+    assert registos[8]["tabela"] == "movimentos"
+    assert registos[9] == {"ID_movimento": 1, "Data_mov": "2025-01-02T10:00:00", "Qtd_entrada": 2.5}
+    assert registos[10] == {"tipo": "fim_tabela", "tabela": "movimentos", "registos": 1}
+    assert registos[11:13] == [
+        {"tipo": "tabela", "tabela": "estados", "colunas": ["ID_estado"]},
+        {"tipo": "fim_tabela", "tabela": "estados", "registos": 0},
+    ]
+    assert registos[13] == {
+        "tipo": "fim",
+        "versao": 42,
+        "stats": {"total_registos": 6, "tipos": 5, "movimentos": 1, "estados": 0},
+    }
+    assert len(registos) == 14
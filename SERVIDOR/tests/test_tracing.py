@@ -0,0 +1,62 @@
+import json
+import logging
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.db import CursorMedido
+from app.serializacao import json_rapido
+from app.tracing import TracingMiddleware, forma_parametros
+
+
+class _Cursor:
+    def execute(self, sql, *args):
+        return self
+
+    def fetchall(self):
+        return [(1, "a"), (2, "b")]
+
+    def close(self):
+        pass
+
+
+def test_server_timing_e_trace_id():
+    app = FastAPI()
+    app.add_middleware(TracingMiddleware)
+
+    @app.get("/itens")
+    def itens():
+        cur = CursorMedido(_Cursor(), "itens.listar")
+        cur.execute("SELECT ID, Nome FROM Itens WHERE ID > ?", 0)
+        rows = cur.fetchall()
+        cur.close()
+        return json_rapido([list(row) for row in rows])
+
+    c = TestClient(app)
+    r = c.get("/itens", headers={"X-Trace-Id": "abc-123"})
+    assert r.headers["x-trace-id"] == "abc-123"
+    timing = r.headers["server-timing"]
+    assert 'sql;dur=' in timing and 'desc="1 consultas, 2 linhas"' in timing
+    assert 'sql1;dur=' in timing and "itens.listar" in timing
+    assert "ser;dur=" in timing and "total;dur=" in timing
+    # ID inválido: é gerado um novo
+    assert c.get("/itens", headers={"X-Trace-Id": "x" * 100}).headers["x-trace-id"] != "x" * 100
+
+
+def test_consulta_lenta_vai_para_o_log_sem_valores(monkeypatch, caplog):
+    monkeypatch.setattr(settings, "consulta_lenta_ms", 0.000001)
+    cur = CursorMedido(_Cursor(), "itens.por_nome")
+    with caplog.at_level(logging.WARNING, logger="app.consultas_lentas"):
+        cur.execute("SELECT *\n  FROM Itens WHERE Nome = ? AND ID = ?", ("segredo", 7))
+        cur.fetchall()
+        cur.close()
+    registo = json.loads(caplog.records[-1].getMessage())
+    assert registo["consulta"] == "itens.por_nome" and registo["linhas"] == 2
+    assert registo["sql"] == "SELECT * FROM Itens WHERE Nome = ? AND ID = ?"
+    assert registo["parametros"] == ["str(7)", "int"] and "segredo" not in caplog.text
+
+
+def test_forma_de_listas_grandes():
+    assert forma_parametros(list(range(1000))) == ["1000 x int"]
+    assert forma_parametros(None) == []
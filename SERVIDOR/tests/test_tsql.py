@@ -0,0 +1,37 @@
+import datetime
+import sqlite3
+
+from app.tsql import CursorSQLite, traduzir
+
+
+def test_traduzir_top():
+    sql, top_param = traduzir("SELECT TOP (?) ID_artigo FROM Artigo WHERE ID_artigo > ? ORDER BY 1")
+    assert top_param
+    assert sql == "SELECT ID_artigo FROM Artigo WHERE ID_artigo > ? ORDER BY 1 LIMIT ?"
+    sql, top_param = traduzir("SELECT TOP 1 Imagem FROM Artigo ORDER BY ID_artigo\n")
+    assert not top_param and sql == "SELECT Imagem FROM Artigo ORDER BY ID_artigo LIMIT 1"
+
+
+def test_traduzir_funcoes():
+    sql, _ = traduzir("SELECT DATEDIFF(DAY, '19700101', Data_mov) FROM Movimentos")
+    assert "julianday(Data_mov)" in sql
+    sql, _ = traduzir("SELECT ISNULL(Qtd_saida, 0) FROM Movimentos WHERE Data_mov < GETDATE()")
+    assert sql == "SELECT IFNULL(Qtd_saida, 0) FROM Movimentos WHERE Data_mov < CURRENT_TIMESTAMP"
+
+
+def test_cursor_top_e_datas():
+    con = sqlite3.connect(":memory:")
+    con.execute("CREATE TABLE Movimentos (ID_movimento INTEGER, Data_mov TEXT, Data_fim TEXT)")
+    con.executemany(
+        "INSERT INTO Movimentos VALUES (?, ?, ?)",
+        [(1, "2025-01-02T10:00:00", "2025-01-03"), (2, "sem data", None), (3, None, None)],
+    )
+    cur = CursorSQLite(con.cursor())
+    cur.execute("SELECT TOP (?) * FROM Movimentos WHERE ID_movimento > ? ORDER BY 1", 2, 0)
+    assert cur.fetchall() == [
+        (1, datetime.datetime(2025, 1, 2, 10, 0), datetime.date(2025, 1, 3)),
+        (2, "sem data", None),
+    ]
+    cur.execute("SELECT ID_movimento FROM Movimentos ORDER BY 1")
+    assert cur.fetchmany(2) == [(1,), (2,)]
+    con.close()